@@ -1,48 +1,84 @@
 import asyncio
-import copy 
 import logging
+import multiprocessing
 import threading
 import sys
 
 from datetime import datetime, timedelta
-from collections import deque
 from threading import Thread
-from time import sleep
+from time import monotonic
 
-from argus.utils.timing import Throttler
+from argus.utils.timing import FpsCounter, Throttler
+from argus.application.capture_process import run_capture_process
 from argus.domain.queue_item import QueueItem
+from argus.utils.event_store import http_handler as events_http_handler
 from argus.utils.frame_grabber import FrameGrabber
-from argus.utils.async_loop import init_async_loop
+from argus.utils.frame_scheduler import DEFAULT_ACTIVE_HOLD_SEC, DEFAULT_ACTIVE_WEIGHT, FrameScheduler
+from argus.utils.metrics import (
+    capture_frames,
+    dropped_frames,
+    motion_frames,
+    queue_depth,
+    source_active,
+    start_metrics_server,
+)
+from argus.utils.motion_gate import MOTION, SKIPPED, MotionGate
+from argus.utils.shared_frame_ring import SharedFrameRing
+from argus.utils.async_loop import get_async_loop, init_async_loop
 from argus.utils.multi_hit_confirmation import MultiHitConfirmation
+from argus.utils.tracker import Tracker
+from argus.utils.notification_dispatcher import init_notification_dispatcher
+from argus.utils.tracing import DEFAULT_SAMPLE_RATE, init_tracer
 from argus.utils.fatal_restart import fatal_restart
 from argus.settings import (
     SILENT_TIME,
     save_throttlers,
     notification_throttlers, 
     send_frames_after_signal, 
-    multi_hit_confirmations
+    multi_hit_confirmations,
+    trackers
 )
 
 from argus.globals import (
+    clip_recorder,
     config, 
+    event_store,
+    retention,
     recognizer, 
+    source_profiles,
     telegram_service
 )
 
-REDUCE_CPU_USAGE_SEC = 0.01
 LOG_TEMPERATURE_TIME = timedelta(minutes=1)
 LOG_SOURCE_FPS_TIME = timedelta(minutes=1)
+CHECK_SNAPSHOT_THREADS_TIME = timedelta(seconds=1)
+READ_SHARED_FRAME_TIMEOUT_SEC = 1
+
+# Frame ring slot must fit the biggest frame of the source
+DEFAULT_MAX_FRAME_SIZE = (3840, 2160)
 
-QUEUE_SIZE = 3
 DEFAULT_SERVER_RESPONSE = 'OK'
+DEFAULT_METRICS_HOST = '127.0.0.1'
 
 logger = logging.getLogger('json')
 
-# Dict of frame Queues
-frame_items_queues = {}
+# Newest frame of every source, waiting for a free infer request
+frame_scheduler = FrameScheduler(
+    max_frame_age=config['app'].get('max_frame_age_sec'),
+    on_drop=QueueItem.release,
+    active_hold_sec=config['app'].get('active_hold_sec', DEFAULT_ACTIVE_HOLD_SEC),
+    active_weight=config['app'].get('active_weight', DEFAULT_ACTIVE_WEIGHT),
+)
+
+queue_depth.labels('scheduler').set_function(
+    lambda: sum(state.item is not None for state in list(frame_scheduler.sources.values()))
+)
 
-# Source FPS
-source_fps = {}
+# Capture in separate processes: shared memory rings by source, processes by capture group
+capture_in_processes = config['app'].get('capture_processes', False)
+capture_context = multiprocessing.get_context('spawn')
+frame_rings = {}
+capture_processes = {}
 
 
 class ServerProtocol(asyncio.Protocol):
@@ -61,7 +97,7 @@ class ServerProtocol(asyncio.Protocol):
         elif message == 'reset':
             notification_throttlers.clear()
         elif message == 'get_photos':
-            send_frames_after_signal.extend(list(frame_items_queues.keys()))
+            send_frames_after_signal.extend(list(frame_scheduler.sources.keys()))
         else:
             logger.info('Unknown command')
 
@@ -93,39 +129,180 @@ class ExternalSignalsReciver(Thread):
         asyncio.run(self.serve())
 
 
+def is_static(name, profile, motion_gate, frame):
+    """
+    True if the motion gate of the source skips the frame: nothing moves and the heartbeat is not due.
+    The check runs in the capture thread, the main loop gets only frames worth recognizing.
+    """
+    if motion_gate is None:
+        return False
+
+    if profile.roi is not None:
+        frame, _ = profile.roi.crop(frame)
+
+    result = motion_gate.check(frame)
+    motion_frames.labels(name, result).inc()
+    if result == MOTION:
+        frame_scheduler.activate(name)
+    if result != SKIPPED:
+        return False
+
+    frame_scheduler.skip(name)
+    return True
+
+
 class SnapshotThread(Thread):
     def __init__(self, name):
-        super(SnapshotThread, self).__init__()
+        super(SnapshotThread, self).__init__(daemon=True)
         self.name = name
+        self.profile = source_profiles[name]
         self.frame_grabber = FrameGrabber(config=config['sources'][name])
+        self.motion_gate = MotionGate.from_config(config['sources'][name])
+        self.fps_counter = FpsCounter(LOG_SOURCE_FPS_TIME.total_seconds())
+        self.frames_metric = capture_frames.labels(name)
 
     def run(self):
         """
-        Putting QueueItem to the queue in an infinite queue.
-        Queue is global. Thread is unique for every source.
+        Putting QueueItem to the scheduler in an infinite loop.
+        Scheduler is global. Thread is unique for every source.
+        With decode_on_demand frames are grabbed continuously to keep the stream drained,
+        but decoded only when the scheduler or the clip buffer wants a new frame from the source.
         """
-        if self.name not in frame_items_queues:
-            frame_items_queues[self.name] = deque(maxlen=QUEUE_SIZE)
+        while True:
+
+            # Capture time is taken right after the grab, so latency of the frame
+            # includes decoding, clip encoding and the motion check
+            if self.profile.decode_on_demand:
+                self.frame_grabber.grab()
+                captured = monotonic()
+                self.count_frame()
+                wanted = frame_scheduler.wants_frame(self.name)
+                if not wanted and not clip_recorder.wants_frame(self.name):
+                    continue
+                frame = self.frame_grabber.retrieve()
+            else:
+                frame = self.frame_grabber.make_snapshot()
+                captured = monotonic()
+                self.count_frame()
+                wanted = True
+
+            # Clip buffer takes frames at its own FPS, also the ones that are not recognized
+            clip_recorder.add(self.name, frame)
+            if not wanted:
+                continue
+
+            if is_static(self.name, self.profile, self.motion_gate, frame):
+                continue
 
+            frame_scheduler.put(self.name, QueueItem(frame, self.profile, captured=captured))
+
+    def count_frame(self):
+        self.frames_metric.inc()
+        # Log FPS to logs
+        fps = self.fps_counter.up()
+        if fps is not None:
+            dropped = frame_scheduler.sources[self.name].dropped
+            logger.info(
+                f'FPS from {self.name}: {fps}',
+                extra={'fps': fps, 'source': self.name, 'dropped': dropped}
+            )
+
+
+class SharedRingReaderThread(Thread):
+    def __init__(self, name):
+        super(SharedRingReaderThread, self).__init__(daemon=True)
+        self.name = name
+        self.profile = source_profiles[name]
+        self.ring = frame_rings[name]
+        self.motion_gate = MotionGate.from_config(config['sources'][name])
+
+    def run(self):
+        """
+        Putting frames captured by a capture process to the scheduler.
+        Frame stays in shared memory, the ring slot is released with the QueueItem.
+        The newest frame is read only when the scheduler wants one.
+        """
+        seq = 0
         while True:
 
-            frame_items_queues[self.name].append(QueueItem(
-                self.frame_grabber.make_snapshot(),
-                self.name)
+            if not frame_scheduler.wait_wanted(self.name, timeout=READ_SHARED_FRAME_TIMEOUT_SEC):
+                continue
+
+            if not self.ring.new_frame.wait(timeout=READ_SHARED_FRAME_TIMEOUT_SEC):
+                continue
+            self.ring.new_frame.clear()
+
+            shared_frame = self.ring.read_latest(after_seq=seq)
+            if shared_frame is None:
+                continue
+            seq = shared_frame.seq
+
+            # Frames are read when the scheduler wants them, so clips get at most the recognition FPS
+            clip_recorder.add(self.name, shared_frame.data)
+
+            if is_static(self.name, self.profile, self.motion_gate, shared_frame.data):
+                shared_frame.release()
+                continue
+
+            frame_scheduler.put(
+                self.name,
+                QueueItem(shared_frame.data, self.profile, shared_frame.release, shared_frame.captured)
             )
 
-            # Log FPS to logs
-            if self.name in source_fps:
-                source_fps[self.name]['count'] += 1
-                now = datetime.now()
-                if source_fps[self.name]['time'] + LOG_SOURCE_FPS_TIME < now:
-                    delta = now - source_fps[self.name]['time']
-                    fps = source_fps[self.name]['count'] / delta.seconds
-                    source_fps[self.name]['time'] = now
-                    source_fps[self.name]['count'] = 0
-                    logger.info(f'FPS from {self.name}: {fps}', extra={'fps': fps, 'source': self.name})
-            else:
-                source_fps[self.name] = {'count': 0, 'time': datetime.now()}
+
+def create_capture_thread(name):
+    if capture_in_processes:
+        return SharedRingReaderThread(name)
+    return SnapshotThread(name)
+
+
+def start_capture_processes():
+    groups = {}
+    for source, source_config in config['sources'].items():
+        decoder = source_config.get('decoder', {})
+        if decoder.get('width') and decoder.get('height'):
+            max_frame_size = (decoder['width'], decoder['height'])
+        else:
+            max_frame_size = source_config.get('max_frame_size', DEFAULT_MAX_FRAME_SIZE)
+
+        # Pinned by in-flight infer requests and the scheduler, plus the latest and the one being written
+        slots = source_config.get('ring_slots', recognizer.net_config['num_requests'] + 3)
+
+        ring = SharedFrameRing(slots, max_frame_size, capture_context)
+        frame_rings[source] = ring
+
+        # Frames are counted by the capture process in the ring itself
+        capture_frames.labels(source).set_function(lambda ring=ring: ring.written)
+        dropped_frames.labels(source, 'ring').set_function(lambda ring=ring: ring.dropped)
+
+        group = source_config.get('capture_group', source)
+        groups.setdefault(group, {})[source] = (
+            source_config,
+            frame_rings[source],
+            source_profiles[source].decode_on_demand,
+        )
+
+    for group, sources in groups.items():
+        start_capture_process(group, sources)
+        logger.info('Capture process %s started' % group)
+
+
+def start_capture_process(group, sources):
+    process = capture_context.Process(
+        target=run_capture_process,
+        args=(sources,),
+        name=f'capture-{group}',
+        daemon=True,
+    )
+    process.start()
+    capture_processes[group] = (process, sources)
+
+
+def check_and_restart_dead_capture_processes():
+    for group, (process, sources) in list(capture_processes.items()):
+        if not process.is_alive():
+            start_capture_process(group, sources)
+            logger.warning('Capture process %s exited with code %s, restarted' % (group, process.exitcode))
 
 
 def check_and_restart_dead_snapshot_threads():
@@ -137,57 +314,123 @@ def check_and_restart_dead_snapshot_threads():
 
     for thread_name in config['sources']:
         if thread_name not in active_threads:
-            thread = SnapshotThread(thread_name)
+            thread = create_capture_thread(thread_name)
             thread.start()
             logger.warning('Thread %s restarted' % thread_name)
 
 
-def run():
+def run(duration=None, external_signals=True, silent_time=SILENT_TIME):
+    """
+    Recognize frames of all sources forever.
+    duration (sec), disabled external signals and silent_time are used by the benchmark, see bench.py
+    """
 
     last_log_temperature_time = datetime.now()
+    last_check_threads_time = datetime.now()
+
+    metrics_port = config['app'].get('metrics_port')
+    if metrics_port:
+        # Detections of the event store are queried on the same server: /events?source=&label=&since=
+        routes = {}
+        if event_store is not None:
+            routes['/events'] = events_http_handler(event_store.path)
+        start_metrics_server(config['app'].get('metrics_host', DEFAULT_METRICS_HOST), metrics_port, routes=routes)
+
+    # Sampled per-stage traces of frames, see argus/utils/tracing.py
+    trace_path = config['app'].get('trace_path')
+    if trace_path:
+        init_tracer(trace_path, config['app'].get('trace_sample_rate', DEFAULT_SAMPLE_RATE))
 
     # Create loop for async telegram
     init_async_loop()
+    # Telegram and email notifications go through bounded per-channel queues on that loop
+    init_notification_dispatcher(get_async_loop(), config.get('notifications'))
+
+    # Old stills are deleted in the background, see argus/utils/retention.py
+    if retention is not None:
+        retention.start()
+
+    # Detections raise the recognition rate of the source and its neighbours
+    recognizer.on_activity = frame_scheduler.activate
+
+    if capture_in_processes:
+        start_capture_processes()
 
     # Create and start threading for every source
     for source in config['sources']:
-        thread = SnapshotThread(source)
+        frame_scheduler.add_source(
+            source,
+            priority=source_profiles[source].priority,
+            max_fps=source_profiles[source].max_fps,
+            idle_fps=source_profiles[source].idle_fps,
+            neighbours=source_profiles[source].neighbours,
+        )
+        source_active.labels(source).set_function(
+            lambda source=source: int(frame_scheduler.is_active(source))
+        )
+        dropped_frames.labels(source, 'scheduler').set_function(
+            lambda state=frame_scheduler.sources[source]: state.dropped
+        )
+
+        thread = create_capture_thread(source)
         thread.start()
         logger.info('Thread %s started' % source)
         
         # Set throttlers for saving and notifications
         save_throttlers[source] = Throttler(interval=config['sources'][source]['save_every_sec'])
         save_throttlers[source + '_detected'] = Throttler(interval=1)
-        notification_throttlers[source] = Throttler(interval=SILENT_TIME)
+        notification_throttlers[source] = Throttler(interval=silent_time)
 
         # Set Multi-hit confirmation for detections
         multi_hit_confirmations[source] = MultiHitConfirmation()
 
+        # Tracked sources confirm detections by track birth instead
+        tracker = Tracker.from_config(config['sources'][source])
+        if tracker is not None:
+            trackers[source] = tracker
+
 
     # Create and start threading for external events
-    ExternalSignalsReciver('127.0.0.1', 8888).start()
+    if external_signals:
+        ExternalSignalsReciver('127.0.0.1', 8888).start()
+
+    finish_time = None if duration is None else monotonic() + duration
+
+    while finish_time is None or monotonic() < finish_time:
+
+        # Take a frame only when it can be recognized right away,
+        # so the newest frame of the source is sent
+        recognizer.wait_for_idle_request()
 
-    while True:
+        # Do not wait for frames longer than a partial batch may wait
+        timeout = CHECK_SNAPSHOT_THREADS_TIME.total_seconds()
+        batch_wait_time = recognizer.batch_wait_time()
+        if batch_wait_time is not None:
+            timeout = min(timeout, batch_wait_time)
 
-        sleep(REDUCE_CPU_USAGE_SEC)
+        # Item taken from the scheduler is owned by the recognizer, no copy is needed.
+        # The frame is copied only if it gets annotated, see QueueItem.frame
+        queue_item = frame_scheduler.get(timeout=timeout)
 
-        for frame_items_queue in frame_items_queues.values():
+        if last_check_threads_time + CHECK_SNAPSHOT_THREADS_TIME < datetime.now():
+            check_and_restart_dead_snapshot_threads()
+            check_and_restart_dead_capture_processes()
+            last_check_threads_time = datetime.now()
+
+        if queue_item is None:
+            recognizer.send_expired_batch()
+            continue
+        queue_item.mark('scheduled')
+
+        # Log temperature every LOG_TEMPERATURE_TIME
+        if last_log_temperature_time + LOG_TEMPERATURE_TIME < datetime.now():
             try:
-                queue_item = copy.deepcopy(frame_items_queue.pop())
-            except IndexError:
-                check_and_restart_dead_snapshot_threads()
-                continue
+                recognizer.log_temperature()
+            except RuntimeError as e:
+                logger.warning(f'Unable to get device temperature {e}')
+                fatal_restart(f'Unable to get device temperature: {e}')
+            else:
+                last_log_temperature_time = datetime.now()
 
-            # Log temperature every LOG_TEMPERATURE_TIME
-            if last_log_temperature_time + LOG_TEMPERATURE_TIME < datetime.now():
-                try:
-                    recognizer.log_temperature()
-                except RuntimeError as e:
-                    logger.warning(f'Unable to get device temperature {e}')
-                    fatal_restart(f'Unable to get device temperature: {e}')
-                else:
-                    last_log_temperature_time = datetime.now()
-
-            # Send frame from buffer to recognize
-            recognizer.send_to_recognize(queue_item)
-            
+        # Send frame from scheduler to recognize
+        recognizer.send_to_recognize(queue_item)
@@ -0,0 +1,260 @@
+"""
+Offline benchmark: N sources replay a video file through the full pipeline
+(scheduler, OpenVinoRecognizer, still writer, notification dispatcher).
+Notification services are replaced with stubs, the result is printed as JSON.
+
+    argus bench --sources 4 --model yolo11n --num-requests 4 --duration 60
+    argus bench --mode realtime --model yolov9s --device CPU --output yolov9s.json
+    argus bench --tiles 3x2 --tile-overlap 0.2 --max-batch-size 2
+
+The application reads its config on import, so the config is written to a temporary
+directory and passed with CONFIG_PATH before the application is imported.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+
+from time import monotonic
+
+import cv2
+import yaml
+
+from argus.utils.tracing import read_traces, summarize
+
+REALTIME = 'realtime'
+MAX = 'max'
+
+DEFAULT_VIDEO = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'res', 'demo.mov'))
+DEFAULT_VIDEO_FPS = 25
+
+logger = logging.getLogger('json')
+
+
+class StubNotifier:
+    """
+    Stands for Telegram and email: counts notifications, optionally waits like a network call.
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.sent = 0
+
+    async def send_message(self, message):
+        await asyncio.sleep(self.delay)
+        self.sent += 1
+
+    async def send_frame(self, jpeg, message):
+        await asyncio.sleep(self.delay)
+        self.sent += 1
+
+
+def add_arguments(parser):
+    parser.add_argument('--video', default=DEFAULT_VIDEO, help='video file replayed by every source')
+    parser.add_argument('--sources', type=int, default=1, help='number of simulated sources')
+    parser.add_argument('--mode', choices=(REALTIME, MAX), default=MAX,
+                        help='replay at the file FPS or as fast as possible')
+    parser.add_argument('--model', default='yolo11n')
+    parser.add_argument('--device', default='CPU')
+    parser.add_argument('--num-requests', type=int, default=4)
+    parser.add_argument('--max-batch-size', type=int, default=1)
+    parser.add_argument('--tiles', type=parse_tiles, help='tiled recognition of every source, COLSxROWS')
+    parser.add_argument('--tile-overlap', type=float, default=0.2)
+    parser.add_argument('--no-tile-full-frame', dest='tile_full_frame', action='store_false',
+                        help='recognize only tiles, without the whole frame')
+    parser.add_argument('--motion-threshold', type=float,
+                        help='skip frames without motion, share of changed thumbnail pixels')
+    parser.add_argument('--duration', type=float, default=30, help='measured time, sec')
+    parser.add_argument('--warmup', type=float, default=5, help='time before measuring, sec')
+    parser.add_argument('--save-every-sec', type=float, default=1, help='still saving interval of a source')
+    parser.add_argument('--notify-delay-ms', type=float, default=0, help='delay of stub notifications')
+    parser.add_argument('--trace-sample-rate', type=float, default=0.1)
+    parser.add_argument('--output', help='write JSON result to the file instead of stdout')
+    parser.add_argument('--keep', action='store_true', help='keep the work directory with stills and traces')
+    parser.add_argument('--verbose', action='store_true', help='show application logs')
+
+
+def parse_tiles(value):
+    try:
+        cols, rows = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Tiles must be COLSxROWS, got {value}')
+    return [cols, rows]
+
+
+def tile_count(args):
+    # Model inputs per frame, as SourceProfile.tile_count
+    if args.tiles is None:
+        return 1
+    cols, rows = args.tiles
+    return cols * rows + (1 if args.tile_full_frame else 0)
+
+
+def grab_delay(args):
+    if args.mode == MAX:
+        return 0
+    fps = cv2.VideoCapture(args.video).get(cv2.CAP_PROP_FPS) or DEFAULT_VIDEO_FPS
+    return 1 / fps
+
+
+def build_config(args, work_dir):
+    delay = grab_delay(args)
+    sources = {}
+    for index in range(args.sources):
+        name = f'bench-{index}'
+        sources[name] = {
+            'source': args.video,
+            'grab_delay_sec': delay,
+            'save_every_sec': args.save_every_sec,
+            'stills_dir': os.path.join(work_dir, 'Stills', name),
+        }
+        if args.motion_threshold is not None:
+            sources[name]['motion_threshold'] = args.motion_threshold
+        if args.tiles is not None:
+            sources[name].update({
+                'tiles': args.tiles,
+                'tile_overlap': args.tile_overlap,
+                'tile_full_frame': args.tile_full_frame,
+            })
+
+    return {
+        'app': {
+            'state_dir': os.path.join(work_dir, 'state'),
+            'trace_path': os.path.join(work_dir, 'traces.jsonl'),
+            'trace_sample_rate': args.trace_sample_rate,
+        },
+        'sources': sources,
+        'recognizer': {
+            'model': args.model,
+            'device_name': args.device,
+            'num_requests': args.num_requests,
+            'max_batch_size': args.max_batch_size,
+        },
+    }
+
+
+def counter_total(metric):
+    return sum(value for _, value in metric.samples())
+
+
+def rss_mb():
+    # Current RSS from /proc, peak RSS on other systems
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return max_rss_mb()
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def snapshot():
+    from argus.utils.metrics import capture_frames, motion_frames, recognized_frames
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        'time': monotonic(),
+        'cpu': usage.ru_utime + usage.ru_stime,
+        'captured': counter_total(capture_frames),
+        'recognized': counter_total(recognized_frames),
+        'motion_skipped': sum(value for (_, result), value in motion_frames.samples() if result == 'skipped'),
+    }
+
+
+def report(args, warm, end, traces, notifier):
+    elapsed = end['time'] - warm['time']
+    summary = summarize(traces).get('all', {})
+    recognized_fps = (end['recognized'] - warm['recognized']) / elapsed
+
+    return {
+        'config': {
+            'model': args.model,
+            'device': args.device,
+            'num_requests': args.num_requests,
+            'max_batch_size': args.max_batch_size,
+            'sources': args.sources,
+            'tiles': args.tiles,
+            'tile_count': tile_count(args),
+            'motion_threshold': args.motion_threshold,
+            'mode': args.mode,
+            'video': args.video,
+            'duration': round(elapsed, 3),
+        },
+        'fps': {
+            'recognized': round(recognized_fps, 2),
+            'recognized_per_source': round(recognized_fps / args.sources, 2),
+            # Letterboxed model inputs, the cost of tiling
+            'inferred_inputs': round(recognized_fps * tile_count(args), 2),
+            'captured': round((end['captured'] - warm['captured']) / elapsed, 2),
+        },
+        'motion_skipped_fps': round((end['motion_skipped'] - warm['motion_skipped']) / elapsed, 2),
+        'cpu_percent': round((end['cpu'] - warm['cpu']) / elapsed * 100, 1),
+        'rss_mb': round(rss_mb(), 1),
+        'max_rss_mb': round(max_rss_mb(), 1),
+        'stages_ms': {stage: row for stage, row in summary.items() if stage != 'alert'},
+        'alert_delay_ms': summary.get('alert'),
+        'notifications': notifier.sent,
+        'traced_frames': len(traces),
+    }
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix='argus-bench-')
+    config = build_config(args, work_dir)
+    config_path = os.path.join(work_dir, 'config.yml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f)
+    os.environ['CONFIG_PATH'] = config_path
+
+    if not args.verbose:
+        logging.getLogger('json').setLevel(logging.ERROR)
+
+    # Imported after CONFIG_PATH is set: the recognizer is created from the config on import
+    from argus.application import app
+    from argus.globals import recognizer, still_writer
+    from argus.utils.tracing import close_tracer
+
+    notifier = StubNotifier(args.notify_delay_ms / 1000)
+    recognizer.telegram = notifier
+
+    warm = {}
+    threading.Timer(args.warmup, lambda: warm.update(snapshot())).start()
+
+    # Every confirmed detection is notified, so alert delay has samples
+    app.run(duration=args.warmup + args.duration, external_signals=False, silent_time=0)
+    end = snapshot()
+
+    # Frames in flight finish before the traces are read
+    if recognizer.batch:
+        recognizer.send_batch()
+    recognizer.ireqs.wait_all()
+    still_writer.join()
+    close_tracer()
+
+    result = report(args, warm, end, read_traces(config['app']['trace_path']), notifier)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.keep:
+        print(f'Work directory: {work_dir}')
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Capture threads can not be stopped while they are inside OpenCV,
+    # interpreter teardown under them aborts, so the process exits right away
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(0)
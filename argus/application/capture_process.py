@@ -0,0 +1,82 @@
+"""
+Capture of sources in a separate process. Frames are written to SharedFrameRing,
+the main process reads them without copying, see SharedRingReaderThread in app.
+
+Module is imported by spawned processes, so it must not import argus.globals.
+"""
+import logging
+import os
+import sys
+import threading
+
+from threading import Thread
+from time import sleep
+
+from argus.utils.frame_grabber import FrameGrabber
+from argus.utils.timing import FpsCounter
+
+CHECK_CAPTURE_THREADS_SEC = 1
+LOG_SOURCE_FPS_SEC = 60
+
+logger = logging.getLogger('json')
+
+
+class CaptureThread(Thread):
+    def __init__(self, name, source_config, ring, decode_on_demand):
+        super(CaptureThread, self).__init__(daemon=True)
+        self.name = name
+        self.source_config = source_config
+        self.ring = ring
+        self.decode_on_demand = decode_on_demand
+        self.fps_counter = FpsCounter(LOG_SOURCE_FPS_SEC)
+
+    def run(self):
+        """
+        Writing frames to the ring in an infinite loop.
+        With decode_on_demand a frame is decoded only when the main process has taken the previous one.
+        """
+        frame_grabber = FrameGrabber(config=self.source_config)
+
+        while True:
+
+            if self.decode_on_demand:
+                frame_grabber.grab()
+                self.count_frame()
+                if not self.ring.frame_wanted():
+                    continue
+                frame = frame_grabber.retrieve()
+            else:
+                frame = frame_grabber.make_snapshot()
+                self.count_frame()
+
+            self.ring.write(frame)
+
+    def count_frame(self):
+        fps = self.fps_counter.up()
+        if fps is not None:
+            logger.info(
+                f'FPS from {self.name}: {fps}',
+                extra={'fps': fps, 'source': self.name, 'dropped': self.ring.dropped}
+            )
+
+
+def run_capture_process(sources):
+    """
+    Entry point of a capture process.
+    sources: {name: (source_config, ring, decode_on_demand)}
+    Dead capture threads are restarted, the process exits when the main process is gone.
+    """
+    parent_pid = os.getppid()
+
+    while True:
+        if os.getppid() != parent_pid:
+            logger.error('Main process is gone. Exit from capture process')
+            sys.exit(1)
+
+        active_threads = [t.name for t in threading.enumerate()]
+        for name, (source_config, ring, decode_on_demand) in sources.items():
+            if name not in active_threads:
+                CaptureThread(name, source_config, ring, decode_on_demand).start()
+                logger.info('Capture thread %s started' % name)
+
+        sleep(CHECK_CAPTURE_THREADS_SEC)
@@ -0,0 +1,34 @@
+"""
+Command line tools, installed as the argus command:
+    argus bench ...   benchmark of the pipeline on video files, see argus/application/bench.py
+    argus trace ...   latency report of a trace file, see argus/utils/tracing.py
+    argus events ...  detections from the event store, see argus/utils/event_store.py
+"""
+import argparse
+
+from argus.application import bench
+from argus.utils import event_store, tracing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='argus')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    bench_parser = commands.add_parser('bench', help='replay video files through the full pipeline')
+    bench.add_arguments(bench_parser)
+    bench_parser.set_defaults(handler=bench.run)
+
+    trace_parser = commands.add_parser('trace', help='p50/p95/p99 of pipeline stages from a trace file')
+    tracing.add_arguments(trace_parser)
+    trace_parser.set_defaults(handler=tracing.report)
+
+    events_parser = commands.add_parser('events', help='query detections stored with app.events_db')
+    event_store.add_arguments(events_parser)
+    events_parser.set_defaults(handler=event_store.report)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,37 +3,50 @@ import logging
 import os
 
 from datetime import datetime
-
-from argus.globals import config
+from itertools import count
+from time import monotonic
 
 WHITE_COLOR = (255, 255, 255)
-DEFAULT_OBJECT_DETECTED_PROMPT = 'Object detected.'
-DEFAULT_PHOTO_REQUESTED_PROMPT = 'Photo requested.'
+DEFAULT_JPEG_QUALITY = 95
+# Stills are sharded by date in stills_dir, so a directory holds one day of a source
+STILLS_DATE_FORMAT = '%Y/%m/%d'
 
 logger = logging.getLogger('json')
 
+# next() on count is atomic, items of all capture threads get unique ids
+trace_ids = count()
+
 
 class QueueItem:
-    def __init__(self, frame, thread_name):
-
-        self.frame = frame
-        self.thread_name = thread_name
-
-        source_config = config['sources'][thread_name]
- 
-        self.important_objects = source_config.get('important_objects', ['person'])
-        self.detectable_objects = self.important_objects + source_config.get('other_objects', [])
-
-        self.stills_dir = source_config['stills_dir']
-        self.host_stills_uri = source_config.get('host_stills_uri')
-        self.object_detected_prompt = source_config.get(
-            'object_detected_prompt',
-            DEFAULT_OBJECT_DETECTED_PROMPT,
-        )
-        self.photo_requested_prompt = source_config.get(
-            'photo_requested_prompt',
-            DEFAULT_PHOTO_REQUESTED_PROMPT,
-        )
+    """
+    Frame of a source on its way through recognition.
+    Created for every captured frame, so it only keeps the frame and a reference
+    to the shared SourceProfile of the source.
+    """
+    __slots__ = (
+        'raw_frame',
+        '_frame',
+        '_jpeg',
+        'profile',
+        'path',
+        'url',
+        'objects_detected',
+        'important_objects_detected',
+        'recognized',
+        'marked_objects',
+        'release_callback',
+        'trace_id',
+        'stages',
+        'inference_transforms',
+    )
+
+    def __init__(self, frame, profile, release_callback=None, captured=None):
+
+        # Captured frame, never drawn on. Annotated copy is made lazily, see frame property
+        self.raw_frame = frame
+        self._frame = None
+        self._jpeg = None
+        self.profile = profile
 
         self.path = None
         self.url = None
@@ -41,11 +54,98 @@ class QueueItem:
         self.objects_detected = False
         self.important_objects_detected = False
 
-    def __mark_object(self, obj):
+        self.recognized = False
+        self.marked_objects = ()
+
+        # Gives the frame buffer back to capture, e.g. shared memory ring slot
+        self.release_callback = release_callback
+
+        # Monotonic time of every stage the frame has passed, see argus.utils.tracing
+        self.trace_id = next(trace_ids)
+        self.stages = {'captured': monotonic() if captured is None else captured}
+
+        # (scale, x offset, y offset) of every recognized crop or tile of the frame,
+        # maps model coordinates back to the frame
+        self.inference_transforms = ()
+
+    @property
+    def thread_name(self):
+        return self.profile.name
+
+    @property
+    def stills_dir(self):
+        return self.profile.stills_dir
+
+    @property
+    def host_stills_uri(self):
+        return self.profile.host_stills_uri
+
+    @property
+    def object_detected_prompt(self):
+        return self.profile.object_detected_prompt
+
+    @property
+    def photo_requested_prompt(self):
+        return self.profile.photo_requested_prompt
+
+    def mark(self, stage):
+        self.stages[stage] = monotonic()
+
+    def release(self):
+        """
+        Called when raw_frame is not needed anymore: item is dropped or recognized.
+        raw_frame must not be used after it.
+        """
+        if self.release_callback is not None:
+            self.release_callback()
+            self.release_callback = None
+
+    @property
+    def frame(self):
+        """
+        Annotated frame. Copy-on-write: the raw frame is copied and marked only on first access,
+        so frames that are neither saved nor sent never pay for a full-frame copy.
+        """
+        if self._frame is None:
+            frame = self.raw_frame.copy()
+            for obj in self.marked_objects:
+                self.__mark_object(frame, obj)
+            if self.recognized:
+                self.__mark_as_recognized(frame)
+            self._frame = frame
+        return self._frame
+
+    def encode_jpeg(self, quality=DEFAULT_JPEG_QUALITY):
+        """
+        JPEG bytes of the annotated frame. Encoded once and shared by the still file,
+        Telegram and email, encoded again only for another quality.
+        """
+        if self._jpeg is None or self._jpeg[0] != quality:
+            success, buffer = cv2.imencode('.jpg', self.frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not success:
+                raise ValueError(f'Unable to encode frame from {self.thread_name}')
+            self._jpeg = (quality, buffer.tobytes())
+        return self._jpeg[1]
+
+    @property
+    def jpeg(self):
+        # Memoized JPEG of any quality, the default one if the frame has not been encoded yet
+        if self._jpeg is not None:
+            return self._jpeg[1]
+        return self.encode_jpeg()
+
+    @staticmethod
+    def __mark_object(frame, obj):
         label = f"{obj['label']} ({obj['confidence']:.2f})"
+        if obj.get('track_id') is not None:
+            label = f"{obj['label']} #{obj['track_id']} ({obj['confidence']:.2f})"
         label_position = (obj['xmin'], obj['ymin'] - 7)
-        cv2.rectangle(self.frame, (obj['xmin'], obj['ymin']), (obj['xmax'], obj['ymax']), WHITE_COLOR, 1)
-        cv2.putText(self.frame, label, label_position, cv2.FONT_HERSHEY_COMPLEX, 0.4, WHITE_COLOR, 1)
+        cv2.rectangle(frame, (obj['xmin'], obj['ymin']), (obj['xmax'], obj['ymax']), WHITE_COLOR, 1)
+        cv2.putText(frame, label, label_position, cv2.FONT_HERSHEY_COMPLEX, 0.4, WHITE_COLOR, 1)
+
+    @staticmethod
+    def __mark_as_recognized(frame):
+        cv2.putText(frame, f"Recognized", (20, 20), cv2.FONT_HERSHEY_COMPLEX, 0.5, (0, 0, 255), 1)
 
     def post_process(self, detections):
         if detections:
@@ -53,33 +153,54 @@ class QueueItem:
         self.mark_as_recognized()
 
     def mark_as_recognized(self):
-        cv2.putText(self.frame, f"Recognized", (20, 20), cv2.FONT_HERSHEY_COMPLEX, 0.5, (0, 0, 255), 1)
+        self.recognized = True
+        # Annotations are drawn and encoded on the next access to frame
+        self._frame = None
+        self._jpeg = None
 
     def map_detections_to_frame(self, detection):
+        marked_objects = []
         for obj in detection:
-            if obj['label'] in self.detectable_objects:
+            if obj['label'] in self.profile.detectable_objects:
                 self.objects_detected = True
-                self.__mark_object(obj)
+                marked_objects.append(obj)
                 logger.warning('Object detected', extra=obj)
-                if obj['label'] in self.important_objects:
+                if obj['label'] in self.profile.important_objects:
                     self.important_objects_detected = True
-                
-    def save(self):
+        self.marked_objects = marked_objects
 
-        if not os.path.exists(self.stills_dir):
-            os.makedirs(self.stills_dir, mode=0o777)
-
-        timestamp = datetime.now().strftime("%d-%m-%Y-%H-%M-%S")
+    def still_filename(self):
+        """
+        Path of the still relative to stills_dir: YYYY/MM/DD/name.jpg, also the path of the url.
+        """
+        now = datetime.now()
+        timestamp = now.strftime("%d-%m-%Y-%H-%M-%S")
 
         if self.objects_detected:
-            frame_filename = '{}-{}.jpg'.format(timestamp, 'detected')
+            filename = '{}-{}.jpg'.format(timestamp, 'detected')
         else:
-            frame_filename = '{}.jpg'.format(timestamp)
+            filename = '{}.jpg'.format(timestamp)
+        return '{}/{}'.format(now.strftime(STILLS_DATE_FORMAT), filename)
+
+    def save(self, frame_filename=None, jpeg_quality=DEFAULT_JPEG_QUALITY, make_dirs=True):
+        """
+        Write the annotated frame to stills_dir and set path and url.
+        StillWriter names the file when the still is queued and creates directories itself.
+        """
+        if frame_filename is None:
+            frame_filename = self.still_filename()
 
         path = os.path.join(self.stills_dir, frame_filename)
 
-        if not cv2.imwrite(path, self.frame):
-            logger.error('Unable to save file: %s' % frame_filename)
+        if make_dirs:
+            os.makedirs(os.path.dirname(path), mode=0o777, exist_ok=True)
+
+        try:
+            jpeg = self.encode_jpeg(jpeg_quality)
+            with open(path, 'wb') as f:
+                f.write(jpeg)
+        except (OSError, ValueError) as e:
+            logger.error('Unable to save file: %s. %s' % (frame_filename, e))
         else:
             self.path = path
             if self.host_stills_uri is not None:
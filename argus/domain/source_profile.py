@@ -0,0 +1,82 @@
+import os
+
+from dataclasses import dataclass
+from typing import Optional
+
+from argus.utils.roi import Roi
+
+DEFAULT_IMPORTANT_OBJECTS = ('person',)
+DEFAULT_OBJECT_DETECTED_PROMPT = 'Object detected.'
+DEFAULT_PHOTO_REQUESTED_PROMPT = 'Photo requested.'
+DEFAULT_PRIORITY = 1
+DEFAULT_TILE_OVERLAP = 0.2
+
+
+@dataclass(frozen=True)
+class SourceProfile:
+    """
+    Per-source settings resolved once from config and shared by every QueueItem of the source.
+    """
+    name: str
+    important_objects: frozenset
+    detectable_objects: frozenset
+    stills_dir: str
+    host_stills_uri: Optional[str]
+    object_detected_prompt: str
+    photo_requested_prompt: str
+    priority: float
+    max_fps: Optional[float]
+    idle_fps: Optional[float]
+    neighbours: tuple
+    decode_on_demand: bool
+    roi: Optional[Roi]
+    tiles: Optional[tuple]
+    tile_overlap: float
+    tile_full_frame: bool
+
+    @classmethod
+    def from_config(cls, name, source_config):
+        important_objects = frozenset(source_config.get('important_objects', DEFAULT_IMPORTANT_OBJECTS))
+        return cls(
+            name=name,
+            important_objects=important_objects,
+            detectable_objects=important_objects | frozenset(source_config.get('other_objects', ())),
+            stills_dir=os.path.abspath(source_config['stills_dir']),
+            host_stills_uri=source_config.get('host_stills_uri'),
+            object_detected_prompt=source_config.get('object_detected_prompt', DEFAULT_OBJECT_DETECTED_PROMPT),
+            photo_requested_prompt=source_config.get('photo_requested_prompt', DEFAULT_PHOTO_REQUESTED_PROMPT),
+            priority=source_config.get('priority', DEFAULT_PRIORITY),
+            max_fps=source_config.get('max_fps'),
+            idle_fps=source_config.get('idle_fps'),
+            neighbours=tuple(source_config.get('neighbours', ())),
+            decode_on_demand=source_config.get('decode_on_demand', False),
+            roi=Roi.from_config(source_config.get('roi')),
+            tiles=parse_tiles(source_config.get('tiles')),
+            tile_overlap=parse_tile_overlap(source_config.get('tile_overlap', DEFAULT_TILE_OVERLAP)),
+            tile_full_frame=source_config.get('tile_full_frame', True),
+        )
+
+    @property
+    def tile_count(self):
+        # Model inputs taken by a frame of the source
+        if self.tiles is None:
+            return 1
+        cols, rows = self.tiles
+        return cols * rows + (1 if self.tile_full_frame else 0)
+
+
+def parse_tiles(tiles):
+    # [cols, rows] grid of tiles, None if the frame is recognized as a whole
+    if tiles is None:
+        return None
+    cols, rows = (int(value) for value in tiles)
+    if cols < 1 or rows < 1:
+        raise ValueError(f'Tiles grid must be positive, got {tiles}')
+    return cols, rows
+
+
+def parse_tile_overlap(overlap):
+    # Share of the tile size shared with the neighbour tile
+    if not 0 <= overlap < 1:
+        raise ValueError(f'Tile overlap must be in [0, 1), got {overlap}')
+    return overlap
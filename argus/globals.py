@@ -1,10 +1,15 @@
 import os
 import yaml
 
+from argus.domain.source_profile import SourceProfile
 from argus.services.telegram import TelegramService
 from argus.services.recognizer import OpenVinoRecognizer
 from argus.services.mqtt import MQTTService
 from argus.services.email import EmailService
+from argus.utils.clip_recorder import ClipRecorder
+from argus.utils.event_store import EventStore
+from argus.utils.retention import RetentionManager
+from argus.utils.still_writer import StillWriter
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
@@ -13,6 +18,12 @@ config_path = os.getenv('CONFIG_PATH', os.path.join(dir_path, '../development.ym
 with open(os.path.join(dir_path, config_path)) as f:
     config = yaml.safe_load(f)
 
+# Settings of every source, resolved once and shared by all frames of the source
+source_profiles = {
+    name: SourceProfile.from_config(name, source_config)
+    for name, source_config in config['sources'].items()
+}
+
 state_dir = config['app']['state_dir']
 if not os.path.exists(state_dir):
     os.makedirs(state_dir, mode=0o777)
@@ -29,7 +40,10 @@ else:
 if config.get('mqtt') is not None:
     mqtt_service = MQTTService(
         config['mqtt']['hostname'], 
-        config['mqtt']['port']
+        config['mqtt']['port'],
+        client_id=config['mqtt'].get('client_id', 'ARGUS'),
+        qos=config['mqtt'].get('qos', 0),
+        max_queue_size=config['mqtt'].get('max_queue_size', 1000)
     )
 else:
     mqtt_service = None
@@ -45,15 +59,39 @@ if config.get('email') is not None:
         email_config.get('password'),
         email_config.get('use_tls', True),
         email_config.get('use_ssl', False),
-        email_config.get('subject', 'Argus object detected')
+        email_config.get('subject', 'Argus object detected'),
+        pool_size=email_config.get('pool_size', 1),
+        keepalive_sec=email_config.get('keepalive_sec', 60),
+        digest_window_sec=email_config.get('digest_window_sec'),
+        digest_max_attachments=email_config.get('digest_max_attachments', 10)
     )
 else:
     email_service = None
 
 
+# JPEG encoding and disk I/O of stills run on writer threads, not in the infer callback
+still_writer = StillWriter.from_config(config['app'])
+
+# Pre- and post-event clips of sources with clips enabled, fed by capture threads
+clip_recorder = ClipRecorder.from_config(config, source_profiles)
+
+# Detections of saved stills in SQLite, None if app.events_db is not set
+event_store = EventStore.from_config(config['app'])
+
 recognizer = OpenVinoRecognizer(
     config['recognizer'], 
     telegram_service,
     mqtt_service,
-    email_service
+    email_service,
+    still_writer,
+    clip_recorder=clip_recorder,
+    event_store=event_store,
+    max_tiles=max(profile.tile_count for profile in source_profiles.values())
 )
+clip_recorder.on_written = recognizer.on_clip_written
+
+# Age and size quotas of stills_dir, None if no source has retention_days or retention_gb.
+# Started by the app, writers add new files to its index
+retention = RetentionManager.from_config(config, source_profiles)
+still_writer.retention = retention
+clip_recorder.retention = retention
@@ -3,8 +3,6 @@ import os
 
 from logging import config
 
-from argus.application import app
-
 config.fileConfig(
     os.path.join(
         os.path.dirname(os.path.realpath(__file__)), 
@@ -15,4 +13,8 @@ config.fileConfig(
 logger = logging.getLogger('json')
 
 if __name__ == '__main__':
+    # Imported here: capture processes are spawned and import this module too,
+    # they need the logging config, but not the application
+    from argus.application import app
+
     app.run()
@@ -1,12 +1,143 @@
 import asyncio
+import logging
+import queue
 import smtplib
+import threading
+
+from datetime import datetime
 from email.message import EmailMessage
+from time import monotonic, sleep
 
+from argus.utils.metrics import notifications_dropped
 
 DEFAULT_SUBJECT = 'Argus object detected'
 DEFAULT_USE_TLS = True
 DEFAULT_USE_SSL = False
 DEFAULT_ATTACHMENT_FILENAME = 'detected.jpg'
+DEFAULT_POOL_SIZE = 1
+DEFAULT_KEEPALIVE_SEC = 60
+DEFAULT_DIGEST_MAX_ATTACHMENTS = 10
+DIGEST_RETRIES = 3
+DIGEST_BACKOFF_SEC = 1
+
+logger = logging.getLogger('json')
+
+
+class SMTPConnectionPool:
+    """
+    Authenticated SMTP connections reused between emails, at most size of them at once.
+    Notifications are rare, so idle connections are kept alive: a keepalive thread sends NOOP
+    every keepalive_sec over connections idle that long and closes the ones the server dropped.
+    A connection is also checked with NOOP when it is taken after keepalive_sec without use.
+    If a connection drops while sending, the email is resent once on a new connection.
+    """
+
+    def __init__(self, connect, size=DEFAULT_POOL_SIZE, keepalive_sec=DEFAULT_KEEPALIVE_SEC):
+        self.connect = connect
+        self.size = size
+        self.keepalive_sec = keepalive_sec
+        self.slots = threading.BoundedSemaphore(size)
+        # (smtp, last used or checked time), the most recently used connection is taken first
+        self.idle = queue.LifoQueue()
+
+        if keepalive_sec:
+            threading.Thread(target=self.keep_alive, name='SMTPKeepalive', daemon=True).start()
+
+    def send_message(self, message, from_addr, to_addrs):
+        with self.slots:
+            try:
+                self.send(self.take(), message, from_addr, to_addrs)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.send(self.connect(), message, from_addr, to_addrs)
+
+    def send(self, smtp, message, from_addr, to_addrs):
+        # The connection goes back to the pool or is closed, whatever happens
+        try:
+            smtp.send_message(message, from_addr=from_addr, to_addrs=to_addrs)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # Rejected by the server, the connection itself is fine
+            self.release(smtp, monotonic())
+            raise
+        except Exception:
+            self.close(smtp)
+            raise
+        self.release(smtp, monotonic())
+
+    def take(self):
+        try:
+            smtp, last_used = self.idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+        if monotonic() - last_used >= self.keepalive_sec and not self.is_alive(smtp):
+            self.close(smtp)
+            return self.connect()
+        return smtp
+
+    def release(self, smtp, last_used):
+        # Connections opened while the keepalive thread held the idle ones are not kept over size
+        if self.idle.qsize() >= self.size:
+            self.close(smtp)
+        else:
+            self.idle.put((smtp, last_used))
+
+    def keep_alive(self):
+        while True:
+            sleep(self.keepalive_sec)
+            try:
+                self.ping_idle()
+            except Exception:
+                logger.exception('SMTP keepalive failed')
+
+    def ping_idle(self):
+        """
+        NOOP over connections idle for keepalive_sec, dropped ones are closed.
+        """
+        # Every connection is sending, none is idle
+        if not self.slots.acquire(blocking=False):
+            return
+        try:
+            idle = []
+            while True:
+                try:
+                    idle.append(self.idle.get_nowait())
+                except queue.Empty:
+                    break
+
+            alive = []
+            for smtp, last_used in idle:
+                if monotonic() - last_used < self.keepalive_sec:
+                    alive.append((smtp, last_used))
+                elif self.is_alive(smtp):
+                    alive.append((smtp, monotonic()))
+                else:
+                    self.close(smtp)
+
+            # Taken newest first, put back oldest first to keep the order
+            for smtp, last_used in reversed(alive):
+                self.idle.put((smtp, last_used))
+        finally:
+            self.slots.release()
+
+    @staticmethod
+    def is_alive(smtp):
+        try:
+            status, _ = smtp.noop()
+        except (smtplib.SMTPException, OSError):
+            return False
+        return status == 250
+
+    @staticmethod
+    def close(smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def close_all(self):
+        while not self.idle.empty():
+            smtp, _ = self.idle.get_nowait()
+            self.close(smtp)
 
 
 class EmailService:
@@ -21,6 +152,10 @@ class EmailService:
         use_tls=DEFAULT_USE_TLS,
         use_ssl=DEFAULT_USE_SSL,
         subject=DEFAULT_SUBJECT,
+        pool_size=DEFAULT_POOL_SIZE,
+        keepalive_sec=DEFAULT_KEEPALIVE_SEC,
+        digest_window_sec=None,
+        digest_max_attachments=DEFAULT_DIGEST_MAX_ATTACHMENTS,
     ):
         self.smtp_host = smtp_host
         self.smtp_port = smtp_port
@@ -32,6 +167,15 @@ class EmailService:
         self.use_ssl = use_ssl
         self.subject = subject
 
+        self.pool = SMTPConnectionPool(self._connect, pool_size, keepalive_sec)
+
+        # Digest mode: notifications within the window go in one email.
+        # Digest state is touched only from the async loop
+        self.digest_window_sec = digest_window_sec
+        self.digest_max_attachments = digest_max_attachments
+        self.digest = []
+        self.digest_task = None
+
     def _build_message(self, body):
         message = EmailMessage()
         message['Subject'] = self.subject
@@ -50,24 +194,76 @@ class EmailService:
         )
         return email_message
 
-    def _send_message(self, message):
+    def _build_digest_message(self, entries):
+        lines = [f'{time:%H:%M:%S} {message}' for time, message, _ in entries]
+        email_message = self._build_message('\n'.join(lines))
+
+        frames = [jpeg for _, _, jpeg in entries if jpeg is not None]
+        for index, jpeg in enumerate(frames[:self.digest_max_attachments], start=1):
+            email_message.add_attachment(
+                jpeg,
+                maintype='image',
+                subtype='jpeg',
+                filename=f'detected-{index}.jpg',
+            )
+        return email_message
+
+    def _connect(self):
         smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
-        with smtp_class(self.smtp_host, self.smtp_port) as smtp:
+        smtp = smtp_class(self.smtp_host, self.smtp_port)
+        try:
             if self.use_tls and not self.use_ssl:
                 smtp.starttls()
 
             if self.username and self.password:
                 smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
 
-            smtp.send_message(message, from_addr=self.from_addr, to_addrs=self.to_addrs)
+    def _send_message(self, message):
+        self.pool.send_message(message, from_addr=self.from_addr, to_addrs=self.to_addrs)
 
     async def send_message(self, message):
+        if self.digest_window_sec:
+            self._add_to_digest(message)
+            return
         email_message = self._build_message(message)
         await asyncio.to_thread(self._send_message, email_message)
 
-    async def send_frame(self, frame, message):
-        import cv2
-
-        _, img = cv2.imencode('.jpg', frame)
-        email_message = self._build_frame_message(img.tobytes(), message)
+    async def send_frame(self, jpeg, message):
+        # jpeg is the encoded frame, see QueueItem.jpeg
+        if self.digest_window_sec:
+            self._add_to_digest(message, jpeg)
+            return
+        email_message = self._build_frame_message(jpeg, message)
         await asyncio.to_thread(self._send_message, email_message)
+
+    def _add_to_digest(self, message, jpeg=None):
+        self.digest.append((datetime.now(), message, jpeg))
+        if self.digest_task is None:
+            self.digest_task = asyncio.create_task(self._send_digest_later())
+
+    async def _send_digest_later(self):
+        # Notifications in the digest were reported as delivered when they were queued,
+        # so the digest is retried here and counted as dropped if it still fails
+        await asyncio.sleep(self.digest_window_sec)
+        entries, self.digest = self.digest, []
+        self.digest_task = None
+        email_message = self._build_digest_message(entries)
+
+        for attempt in range(DIGEST_RETRIES + 1):
+            try:
+                await asyncio.to_thread(self._send_message, email_message)
+            except Exception:
+                if attempt == DIGEST_RETRIES:
+                    logger.exception('Unable to send email digest of %s notifications', len(entries))
+                    notifications_dropped.labels('email', 'digest_failed').inc(len(entries))
+                    return
+                delay = DIGEST_BACKOFF_SEC * 2 ** attempt
+                logger.warning(f'Email digest failed, retry in {delay} sec')
+                await asyncio.sleep(delay)
+            else:
+                logger.info(f'Email digest sent: {len(entries)} notifications', extra={'notifications': len(entries)})
+                return
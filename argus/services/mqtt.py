@@ -1,26 +1,118 @@
+import json
 import logging
-import os
+import threading
 
-import asyncio
-import paho.mqtt.publish as publish
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from argus.utils.metrics import notifications_dropped, queue_depth
+
+DEFAULT_CLIENT_ID = 'ARGUS'
+DEFAULT_QOS = 0
+DEFAULT_KEEPALIVE = 60
+DEFAULT_MAX_QUEUE_SIZE = 1000
+DEFAULT_RECONNECT_MIN_DELAY = 1
+DEFAULT_RECONNECT_MAX_DELAY = 60
 
 logger = logging.getLogger('json')
 
 
 class MQTTService:
+    """
+    Long-lived MQTT client. Network loop runs in the paho background thread,
+    which reconnects automatically, so publish never blocks on the network.
+
+    Messages published while the broker is unreachable wait in a bounded in-memory
+    queue and are sent on reconnect, the oldest ones are dropped when it is full.
+    State of every source goes to a retained topic, published only when it changes.
+    """
 
-    def __init__(self, hostname, port):
+    def __init__(
+        self,
+        hostname,
+        port,
+        client_id=DEFAULT_CLIENT_ID,
+        qos=DEFAULT_QOS,
+        keepalive=DEFAULT_KEEPALIVE,
+        max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+        reconnect_min_delay=DEFAULT_RECONNECT_MIN_DELAY,
+        reconnect_max_delay=DEFAULT_RECONNECT_MAX_DELAY,
+    ):
         self.hostname = hostname
         self.port = port
+        self.qos = qos
+
+        self.lock = threading.Lock()
+        self.connected = False
+        self.pending = deque(maxlen=max_queue_size)
+        self.dropped = 0
+        self.states = {}
+        queue_depth.labels('mqtt').set_function(lambda: len(self.pending))
+        notifications_dropped.labels('mqtt', 'queue_full').set_function(lambda: self.dropped)
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        # Messages in flight are bounded by paho too, QoS 0 messages are not queued by paho offline
+        self.client.max_queued_messages_set(max_queue_size)
+        self.client.reconnect_delay_set(reconnect_min_delay, reconnect_max_delay)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+
+        self.client.connect_async(self.hostname, self.port, keepalive)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logger.error(f'MQTT connection refused: {reason_code}')
+            return
+
+        logger.info(f'MQTT connected to {self.hostname}:{self.port}')
+        with self.lock:
+            self.connected = True
+            pending = list(self.pending)
+            self.pending.clear()
+
+        for topic, payload, retain in pending:
+            self.publish(topic, payload, retain)
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        with self.lock:
+            self.connected = False
+        logger.warning(f'MQTT disconnected: {reason_code}')
+
+    def publish(self, topic, payload, retain=False):
+        """
+        Non-blocking publish, safe to call from any thread.
+        """
+        with self.lock:
+            if not self.connected:
+                self.enqueue(topic, payload, retain)
+                return
+
+        info = self.client.publish(topic, payload, qos=self.qos, retain=retain)
+        if info.rc == mqtt.MQTT_ERR_NO_CONN:
+            with self.lock:
+                self.enqueue(topic, payload, retain)
+        elif info.rc != mqtt.MQTT_ERR_SUCCESS:
+            with self.lock:
+                self.dropped += 1
+            logger.warning(f'MQTT message to {topic} dropped: {mqtt.error_string(info.rc)}')
+
+    def enqueue(self, topic, payload, retain):
+        # Called under the lock
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append((topic, payload, retain))
+
+    def publish_state(self, source, state):
+        """
+        Retained state of the source, the broker keeps the last one for new subscribers.
+        """
+        if self.states.get(source) == state:
+            return
+        self.states[source] = state
+        self.publish(f'argus/source/{source}/state', json.dumps(state), retain=True)
 
-    def publish(self, topic, payload):
-        publish.single(
-            topic=topic,
-            payload=payload,
-            client_id='ARGUS',
-            hostname=self.hostname,
-            port=self.port,
-        )
-
-    async def publish_async(self, topic, payload):
-        await asyncio.to_thread(self.publish, topic, payload)
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
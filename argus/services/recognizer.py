@@ -1,28 +1,46 @@
-import cv2
 import json
 import logging
 import numpy as np
 import os
 
 from datetime import datetime, timedelta
+from functools import partial
+from time import monotonic
 try:
     # 2026.2.1
-    from openvino import Core, AsyncInferQueue
+    from openvino import Core, AsyncInferQueue, Dimension, Layout, Tensor, Type
 except ImportError:
-    from openvino.runtime import Core, AsyncInferQueue
+    from openvino.runtime import Core, AsyncInferQueue, Dimension, Layout, Tensor, Type
+from openvino.preprocess import ColorFormat, PrePostProcessor
 
 from argus.settings import (
     save_throttlers, 
     notification_throttlers,
     send_frames_after_signal,
-    multi_hit_confirmations
+    multi_hit_confirmations,
+    trackers
 )
-from argus.utils.async_loop import run_async
+from argus.utils.notification_dispatcher import dispatch
+from argus.utils.tracing import NOTIFIED_PREFIX, export_trace
 from argus.utils.fatal_restart import fatal_restart
+from argus.utils.metrics import (
+    CounterChild,
+    device_temperature,
+    inference_seconds,
+    infer_requests,
+    infer_requests_busy,
+    infer_requests_busy_seconds,
+    postprocess_seconds,
+    preprocess_seconds,
+    recognized_frames,
+)
+from argus.utils.tiling import tile_rects
+from argus.utils.yolo import PROB_THRESHOLD, batched_nms, decode_predictions, letterbox, suppress_fragments
 
 LOG_RECOGNIZE_RPS_TIME = timedelta(minutes=1)
 
-PROB_THRESHOLD = 0.65
+DEFAULT_MAX_BATCH_SIZE = 1
+DEFAULT_MAX_BATCH_WAIT_MS = 0
 
 logger = logging.getLogger('json')
 
@@ -42,26 +60,75 @@ def up_rps():
 
 class OpenVinoRecognizer:
 
-    def __init__(self, net_config, telegram_service, mqtt_service, email_service=None):
+    # Called with the source name when objects are detected, see FrameScheduler.activate
+    on_activity = None
+
+    def __init__(
+        self,
+        net_config,
+        telegram_service,
+        mqtt_service,
+        email_service=None,
+        still_writer=None,
+        clip_recorder=None,
+        event_store=None,
+        max_tiles=1,
+    ):
         self.net_config = net_config
         self.telegram  = telegram_service
         self.mqtt_service = mqtt_service
         self.email_service = email_service
+        # Stills are saved synchronously without a writer
+        self.still_writer = still_writer
+        # Clips of confirmed detections, None if no source records clips
+        self.clip_recorder = clip_recorder
+        # Detections of saved stills, None if app.events_db is not set
+        self.event_store = event_store
 
         models_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'models'))
         model_name = self.net_config.get('model', 'yolo11n')
 
         self.core = Core()
-        model = self.core.read_model(os.path.join(models_path, f'{model_name}.xml'))
+        model_path = os.path.join(models_path, f'{model_name}.xml')
+        model = self.core.read_model(model_path)
 
         # Extract network params
         self.input_layer_ir = model.input(0)
-        self.n, self.c, self.h, self.w = self.input_layer_ir.shape
-
-        compiled_model = self.core.compile_model(model, self.net_config['device_name'])
+        _, self.c, self.h, self.w = self.input_layer_ir.shape
+
+        # Dynamic batching: frames of several sources go to one infer request.
+        # Batch is sent when it is full or max_batch_wait_ms after its first frame
+        self.max_batch_size = self.net_config.get('max_batch_size', DEFAULT_MAX_BATCH_SIZE)
+        self.max_batch_wait = self.net_config.get('max_batch_wait_ms', DEFAULT_MAX_BATCH_WAIT_MS) / 1000
+        # A tiled frame takes one place of the batch per tile, all tiles of a frame go to one request
+        self.n = max(self.max_batch_size, max_tiles)
+
+        # Items of the batch being filled, places they take, its infer request and send deadline
+        self.batch = []
+        self.batch_places = 0
+        self.batch_request_id = None
+        self.batch_deadline = None
+
+        compiled_model, self.dynamic_batch = self.compile_model(model, model_path)
         self.ireqs = AsyncInferQueue(compiled_model, self.net_config['num_requests'])
         self.ireqs.set_callback(self.process_frame)
 
+        # One preallocated uint8 BGR input per infer request, shared with OpenVINO without copying.
+        # Frames are letterboxed straight into it, the rest of preprocessing runs on the device.
+        self.input_buffers = []
+        for ireq in self.ireqs:
+            buffer = np.zeros((self.n, self.h, self.w, self.c), np.uint8)
+            ireq.set_input_tensor(Tensor(buffer, shared_memory=True))
+            self.input_buffers.append(buffer)
+
+        # Started and completed requests are counted by different threads, busy requests are the difference
+        self.requests_started = CounterChild()
+        self.requests_completed = CounterChild()
+        infer_requests.set(self.net_config['num_requests'])
+        infer_requests_busy.labels().set_function(
+            lambda: self.requests_started.value() - self.requests_completed.value()
+        )
+
         logger.info(
             f'OPTIMAL_NUMBER_OF_INFER_REQUESTS: {compiled_model.get_property("OPTIMAL_NUMBER_OF_INFER_REQUESTS")}'
         )
@@ -69,6 +136,36 @@ class OpenVinoRecognizer:
         with open(os.path.join(models_path, 'coco.names'), 'r') as f:
             self.labels_map = [x.strip() for x in f]
 
+    def compile_model(self, model, model_path):
+        """
+        Compiled model and whether its batch dimension is dynamic.
+        With more than one place the batch dimension is dynamic up to n: a request infers
+        only the places it uses, so untiled frames and partial batches are not padded
+        to the size of the largest batch. Devices without dynamic shapes get a static batch of n.
+        """
+        device_name = self.net_config['device_name']
+        if self.n > 1:
+            model.reshape([Dimension(1, self.n), self.c, self.h, self.w])
+            try:
+                return self.core.compile_model(self.add_preprocessing(model), device_name), True
+            except RuntimeError as e:
+                logger.warning(f'Dynamic batch is not supported by {device_name}, partial batches are padded: {e}')
+            # Preprocessing changed the layout of the input, static batch starts from the model file
+            model = self.core.read_model(model_path)
+
+        if model.input(0).shape[0] != self.n:
+            model.reshape([self.n, self.c, self.h, self.w])
+        return self.core.compile_model(self.add_preprocessing(model), device_name), False
+
+    @staticmethod
+    def add_preprocessing(model):
+        # uint8 NHWC BGR frame -> float NCHW RGB in [0, 1], executed by the inference device
+        ppp = PrePostProcessor(model)
+        ppp.input().tensor().set_element_type(Type.u8).set_layout(Layout('NHWC')).set_color_format(ColorFormat.BGR)
+        ppp.input().model().set_layout(Layout('NCHW'))
+        ppp.input().preprocess().convert_element_type(Type.f32).convert_color(ColorFormat.RGB).scale(255.0)
+        return ppp.build()
+
     def log_temperature(self):
 
         devices = []
@@ -80,115 +177,293 @@ class OpenVinoRecognizer:
        
         for device in devices:
             themperature = self.core.get_property(device, 'DEVICE_THERMAL')
+            device_temperature.labels(device).set(themperature)
             logger.info(
                 "Device {} themperature: {}".format(device, themperature), 
                 extra={'device': device, 'themperature': themperature}
             )
 
-    def send_to_recognize(self, queue_item):
+    def wait_for_idle_request(self):
+        # Blocks until one of infer requests is idle, the request of a batch being filled is reserved already
+        if not self.batch:
+            self.ireqs.get_idle_request_id()
 
-        frame = queue_item.frame
+    def batch_wait_time(self):
+        # Seconds until the batch being filled has to be sent, None if there is no batch
+        if not self.batch:
+            return None
+        return max(0, self.batch_deadline - monotonic())
 
-        height, width, _ = frame.shape
-        length = max((height, width))
-        image = np.zeros((length, length, 3), np.uint8)
-        image[0:height, 0:width] = frame
+    def send_to_recognize(self, queue_item):
 
-        blob = cv2.dnn.blobFromImage(image, scalefactor=1/255, size=(self.h, self.w), swapRB=True)
+        views = self.inference_views(queue_item)
+        if self.batch and self.batch_places + len(views) > self.n:
+            self.send_batch()
+
+        if not self.batch:
+            # Blocks until a request is idle. Only this thread starts requests,
+            # so start_async takes the same idle request
+            self.batch_request_id = self.ireqs.get_idle_request_id()
+            self.batch_deadline = monotonic() + self.max_batch_wait
+
+        started = monotonic()
+        buffer = self.input_buffers[self.batch_request_id]
+        transforms = []
+        for frame, (offset_x, offset_y) in views:
+            scale = letterbox(frame, buffer[self.batch_places])
+            transforms.append((scale, offset_x, offset_y))
+            self.batch_places += 1
+        queue_item.inference_transforms = transforms
+        preprocess_seconds.labels(queue_item.thread_name).observe(monotonic() - started)
+        queue_item.mark('preprocessed')
+        self.batch.append(queue_item)
+
+        if len(self.batch) == self.max_batch_size or self.batch_places == self.n:
+            self.send_batch()
+
+    @staticmethod
+    def inference_views(queue_item):
+        """
+        Parts of the frame letterboxed into model inputs with their offsets in the frame.
+        Only the bounding crop of the ROI is recognized, so it gets more model pixels than the whole frame.
+        Tiled sources also split it into overlapping tiles, small objects keep their size in pixels.
+        """
+        profile = queue_item.profile
+        frame, offset = queue_item.raw_frame, (0, 0)
+        if profile.roi is not None:
+            frame, offset = profile.roi.crop(frame)
+
+        if profile.tiles is None:
+            return [(frame, offset)]
+
+        # Whole frame finds objects too large for one tile
+        views = [(frame, offset)] if profile.tile_full_frame else []
+        height, width = frame.shape[:2]
+        for xmin, ymin, xmax, ymax in tile_rects(width, height, profile.tiles, profile.tile_overlap):
+            views.append((frame[ymin:ymax, xmin:xmax], (offset[0] + xmin, offset[1] + ymin)))
+        return views
+
+    def send_expired_batch(self):
+        if self.batch and monotonic() >= self.batch_deadline:
+            self.send_batch()
+
+    def send_batch(self):
+        queue_items = self.batch
+        places = self.batch_places
+        self.batch = []
+        self.batch_places = 0
 
         try:
-            self.ireqs.start_async({self.input_layer_ir.any_name: blob}, queue_item)
+            if self.dynamic_batch:
+                # Only the used places of the input buffer are inferred
+                buffer = self.input_buffers[self.batch_request_id]
+                self.ireqs[self.batch_request_id].set_input_tensor(Tensor(buffer[:places], shared_memory=True))
+            # With a static batch unused places of a partial batch keep old frames, their results are ignored
+            self.requests_started.inc()
+            self.ireqs.start_async(userdata=(queue_items, monotonic()))
         except Exception as e:
             logger.exception('Exec Network is down. Restart. %s', e)
             fatal_restart(f'Infer request failed: {e}')
 
+    def process_frame(self, infer_request, userdata):
 
-    def process_frame(self, infer_request, queue_item):
+        queue_items, started = userdata
+        inference_time = monotonic() - started
+        self.requests_completed.inc()
+        infer_requests_busy_seconds.inc(inference_time)
+        inference_seconds.labels(len(queue_items)).observe(inference_time)
 
-        up_rps()
-        
         result = infer_request.get_output_tensor(0).data
 
-        detections = []
+        # Split batch results back per QueueItem, every item takes a place per tile
+        place = 0
+        for queue_item in queue_items:
+            up_rps()
+            started = monotonic()
+            queue_item.stages['inferred'] = started
+            places = len(queue_item.inference_transforms)
+            try:
+                detections = self.decode_detections(result[place:place + places], queue_item)
+                events = self.track(queue_item, detections)
+                queue_item.mark('postprocessed')
+                self.on_recognized(queue_item, detections, events)
+            except Exception:
+                logger.exception('Unable to process frame from %s', queue_item.thread_name)
+            finally:
+                queue_item.release()
+                export_trace(queue_item)
+            place += places
+            postprocess_seconds.labels(queue_item.thread_name).observe(monotonic() - started)
+            recognized_frames.labels(queue_item.thread_name).inc()
+
+    def decode_detections(self, result, queue_item):
+
+        # (x, y, w, h) in model input -> (x, y, w, h) in frame for every tile
+        decoded = []
+        for index, (scale, offset_x, offset_y) in enumerate(queue_item.inference_transforms):
+            boxes, scores, class_ids = decode_predictions(result[index:index + 1], PROB_THRESHOLD)
+            boxes *= scale
+            boxes[:, :2] += (offset_x, offset_y)
+            decoded.append((boxes, scores, class_ids))
+
+        if len(decoded) == 1:
+            boxes, scores, class_ids = decoded[0]
+            kept = batched_nms(boxes, scores, class_ids, PROB_THRESHOLD)
+        else:
+            # Cross-tile NMS: duplicates from overlapping tiles, then parts of objects cut by tile borders
+            boxes, scores, class_ids = (np.concatenate(arrays) for arrays in zip(*decoded))
+            kept = batched_nms(boxes, scores, class_ids, PROB_THRESHOLD)
+            kept = kept[suppress_fragments(boxes[kept], scores[kept], class_ids[kept])]
 
-        outputs = np.array([cv2.transpose(result[0])])
-        rows = outputs.shape[1]
-
-        boxes = []
-        scores = []
-        class_ids = []
-
-        for i in range(rows):
-            classes_scores = outputs[0][i][4:]
-            (minScore, maxScore, minClassLoc, (x, maxClassIndex)) = cv2.minMaxLoc(classes_scores)
-            if maxScore >= PROB_THRESHOLD:
-                box = [
-                    outputs[0][i][0] - (0.5 * outputs[0][i][2]), 
-                    outputs[0][i][1] - (0.5 * outputs[0][i][3]),
-                    outputs[0][i][2], 
-                    outputs[0][i][3]
-                ]
-                boxes.append(box)
-                scores.append(maxScore)
-                class_ids.append(maxClassIndex)
-
-        result_boxes = cv2.dnn.NMSBoxes(boxes, scores, PROB_THRESHOLD, nms_threshold=0.45, eta=0.5)
-
-        height, width, _ = queue_item.frame.shape
-        length = max((height, width))
-        scale = length / self.w
-
-        for i in range(len(result_boxes)):
-            index = result_boxes[i]
-            box = boxes[index]
-            detection = {
-                'class_id': class_ids[index],
-                'label': self.labels_map[class_ids[index]],
-                'confidence': scores[index],
-                'xmin': round(box[0] * scale), 
-                'ymin': round(box[1] * scale),
-                'xmax': round((box[0] + box[2]) * scale), 
-                'ymax': round((box[1] + box[3]) * scale)
-            }
+        roi = queue_item.profile.roi
+
+        # (x, y, w, h) -> (xmin, ymin, xmax, ymax)
+        corners = boxes[kept]
+        corners[:, 2:] += corners[:, :2]
+        corners = np.round(corners).astype(int)
+
+        detections = []
+        for index, (xmin, ymin, xmax, ymax) in zip(kept, corners.tolist()):
+            # Objects outside the ROI polygon are not detected, even if the crop shows them
+            if roi is not None and not roi.contains((xmin + xmax) / 2, (ymin + ymax) / 2):
+                continue
+            class_id = int(class_ids[index])
+            detections.append({
+                'class_id': class_id,
+                'label': self.labels_map[class_id],
+                'confidence': float(scores[index]),
+                'xmin': xmin,
+                'ymin': ymin,
+                'xmax': xmax,
+                'ymax': ymax
+            })
+
+        return detections
+
+    @staticmethod
+    def track(queue_item, detections):
+        # Track events of detectable objects, None if the source is not tracked
+        tracker = trackers.get(queue_item.thread_name)
+        if tracker is None:
+            return None
+        detectable_objects = queue_item.profile.detectable_objects
+        return tracker.update(
+            [obj for obj in detections if obj['label'] in detectable_objects],
+            queue_item.stages['captured'],
+        )
 
-            detections.append(detection)
+    def on_recognized(self, queue_item, detections, events=None):
 
         queue_item.post_process(detections)
 
         thread_name = queue_item.thread_name
 
+        if queue_item.objects_detected and self.on_activity is not None:
+            self.on_activity(thread_name)
+
         # Send frame to telegram after external signal
         if thread_name in send_frames_after_signal and self.telegram is not None:
             send_frames_after_signal.remove(thread_name)
-            run_async(self.telegram.send_frame, queue_item.frame, queue_item.photo_requested_prompt)
+            dispatch(
+                'telegram',
+                self.telegram.send_frame,
+                queue_item.jpeg,
+                queue_item.photo_requested_prompt,
+                source=thread_name,
+                kind='photo_requested'
+            )
 
-        if queue_item.important_objects_detected:
+        # Retained state of the source, sent to the broker only when it changes
+        if self.mqtt_service is not None:
+            state = {
+                'objects_detected': queue_item.objects_detected,
+                'important_objects_detected': queue_item.important_objects_detected,
+                'labels': sorted({obj['label'] for obj in queue_item.marked_objects}),
+            }
+            if events is not None:
+                state['tracks'] = events.active
+            self.mqtt_service.publish_state(thread_name, state)
+
+        if events is not None:
+            # Tracked source: stills, MQTT messages and notifications key on track events,
+            # an object standing still is saved once, not every second
+            detection_is_confirm = any(
+                track.label in queue_item.profile.important_objects for track in events.born
+            )
+            if events.born or events.ended:
+                need_save = True
+            elif events.changed:
+                need_save = save_throttlers[thread_name + '_detected'].is_allowed()
+            else:
+                need_save = save_throttlers[thread_name].is_allowed()
+        elif queue_item.important_objects_detected:
             detection_is_confirm = multi_hit_confirmations[thread_name].on_detect()
             need_save = save_throttlers[thread_name + '_detected'].is_allowed() # save detected frames every 1 sec
         else:
             detection_is_confirm = False
             need_save = save_throttlers[thread_name].is_allowed()
 
+        if detection_is_confirm and self.clip_recorder is not None:
+            self.clip_recorder.trigger(thread_name)
+
         if need_save:
-            queue_item.save()
-
-            # Send mqtt message
-            if queue_item.objects_detected and self.mqtt_service is not None:
-                run_async(
-                    self.mqtt_service.publish_async,
-                    topic=f"argus/source/{queue_item.thread_name}/meta",
-                    payload=json.dumps({
-                        'important_objects_detected': queue_item.important_objects_detected,
-                        'path': queue_item.path,
-                        'url': queue_item.url,
-                        'detections': detections,
-                        'datetime': datetime.now().strftime('%d-%m-%Y %H:%M:%S')
-                    }),
-                )
+            on_saved = partial(
+                self.on_saved,
+                detections=detections,
+                detection_is_confirm=detection_is_confirm,
+                events=events,
+            )
 
-            # Оповещение. is_allowed должен быть в другом условии
-            # т.к. изменяют внутренние счетчики
-            self.notify_on_confirmed_detection(queue_item, detection_is_confirm)
+            if self.still_writer is not None:
+                self.still_writer.submit(queue_item, on_saved)
+            else:
+                queue_item.save()
+                on_saved(queue_item)
+
+    def on_saved(self, queue_item, detections, detection_is_confirm, events=None):
+        """
+        Called by the still writer when the still is on disk, path and url are set.
+        """
+        # Send mqtt message, publish does not block. Track end has no objects on the frame
+        if (queue_item.objects_detected or events) and self.mqtt_service is not None:
+            meta = {
+                'important_objects_detected': queue_item.important_objects_detected,
+                'path': queue_item.path,
+                'url': queue_item.url,
+                'detections': detections,
+                'datetime': datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+            }
+            if events is not None:
+                meta['events'] = events.as_list()
+            self.mqtt_service.publish(
+                topic=f"argus/source/{queue_item.thread_name}/meta",
+                payload=json.dumps(meta),
+            )
+
+        if queue_item.marked_objects and self.event_store is not None:
+            self.event_store.record(queue_item, queue_item.marked_objects)
+
+        # Оповещение. is_allowed должен быть в другом условии
+        # т.к. изменяют внутренние счетчики
+        self.notify_on_confirmed_detection(queue_item, detection_is_confirm)
+        export_trace(queue_item)
+
+    def on_clip_written(self, source, path, url):
+        # Called by the clip writer thread
+        if self.mqtt_service is not None:
+            self.mqtt_service.publish(
+                topic=f"argus/source/{source}/clip",
+                payload=json.dumps({
+                    'path': path,
+                    'url': url,
+                    'datetime': datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+                }),
+            )
+
+    @staticmethod
+    def on_notified(queue_item, channel):
+        queue_item.mark(NOTIFIED_PREFIX + channel)
+        export_trace(queue_item)
 
     def notify_on_confirmed_detection(self, queue_item, detection_is_confirm):
         if detection_is_confirm:
@@ -196,22 +471,46 @@ class OpenVinoRecognizer:
                 self.send_detection_notifications(queue_item)
 
     def send_detection_notifications(self, queue_item):
+        # Not sent yet notification of the source is replaced by the newer one
+        source = queue_item.thread_name
         if queue_item.url is not None:
             message = f'Objects detected: {queue_item.url}'
             if self.telegram is not None:
-                run_async(self.telegram.send_message, message)
+                dispatch(
+                    'telegram',
+                    self.telegram.send_message,
+                    message,
+                    source=source,
+                    kind='detection',
+                    on_delivered=partial(self.on_notified, queue_item, 'telegram')
+                )
             if self.email_service is not None:
-                run_async(self.email_service.send_message, message)
+                dispatch(
+                    'email',
+                    self.email_service.send_message,
+                    message,
+                    source=source,
+                    kind='detection',
+                    on_delivered=partial(self.on_notified, queue_item, 'email')
+                )
         else:
             if self.telegram is not None:
-                run_async(
+                dispatch(
+                    'telegram',
                     self.telegram.send_frame,
-                    queue_item.frame,
-                    queue_item.object_detected_prompt
+                    queue_item.jpeg,
+                    queue_item.object_detected_prompt,
+                    source=source,
+                    kind='detection',
+                    on_delivered=partial(self.on_notified, queue_item, 'telegram')
                 )
             if self.email_service is not None:
-                run_async(
+                dispatch(
+                    'email',
                     self.email_service.send_frame,
-                    queue_item.frame,
-                    'Objects detected'
+                    queue_item.jpeg,
+                    queue_item.object_detected_prompt,
+                    source=source,
+                    kind='detection',
+                    on_delivered=partial(self.on_notified, queue_item, 'email')
                 )
@@ -1,9 +1,9 @@
-import cv2
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from aiogram.client.session.aiohttp import AiohttpSession
-from aiogram.types import FSInputFile
-from tempfile import NamedTemporaryFile
+from aiogram.types import BufferedInputFile
+
+DEFAULT_PHOTO_FILENAME = 'detected.jpg'
 
 
 class TelegramService:
@@ -26,10 +26,7 @@ class TelegramService:
     async def send_message(self, message):
         return await self.bot.send_message(chat_id=self.bot_chat_id, text=message)
 
-    async def send_frame(self, frame, message):
-        _, img = cv2.imencode('.jpg', frame)
-        with NamedTemporaryFile(suffix=".jpg") as temp:
-            temp.write(img.tobytes())
-            temp.flush()
-            photo = FSInputFile(temp.name)
-            return await self.bot.send_photo(chat_id=self.bot_chat_id, photo=photo, caption=message)
+    async def send_frame(self, jpeg, message):
+        # jpeg is the encoded frame, see QueueItem.jpeg. Uploaded from memory
+        photo = BufferedInputFile(jpeg, filename=DEFAULT_PHOTO_FILENAME)
+        return await self.bot.send_photo(chat_id=self.bot_chat_id, photo=photo, caption=message)
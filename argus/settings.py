@@ -12,4 +12,7 @@ send_frames_after_signal = []
 
 
 # Protection against false detections
-multi_hit_confirmations = {}
\ No newline at end of file
+multi_hit_confirmations = {}
+
+# Object trackers of sources with tracking, see argus/utils/tracker.py
+trackers = {}
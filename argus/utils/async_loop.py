@@ -16,6 +16,13 @@ def init_async_loop():
     _loop = asyncio.new_event_loop()
     threading.Thread(target=_loop.run_forever, daemon=True).start()
 
+
+def get_async_loop():
+    if _loop is None:
+        raise RuntimeError("Async loop not initialized")
+    return _loop
+
+
 def run_async(func, *args, **kwargs):
     # Вызывается из синхронного кода:
     # 1) собираем coroutine через func(*args, **kwargs),
@@ -0,0 +1,278 @@
+import logging
+import os
+import queue
+import threading
+
+from collections import deque
+from datetime import datetime
+from threading import Thread
+from time import monotonic
+
+import cv2
+import numpy as np
+
+from argus.utils.metrics import dropped_frames, queue_depth
+
+CLIPS_DIR = 'clips'
+FOURCC = 'mp4v'
+
+DEFAULT_PRE_SEC = 5
+DEFAULT_POST_SEC = 10
+DEFAULT_MAX_SEC = 60
+DEFAULT_FPS = 5
+DEFAULT_WIDTH = 640
+DEFAULT_BUFFER_MB = 16
+DEFAULT_JPEG_QUALITY = 80
+DEFAULT_MAX_QUEUE_SIZE = 4
+# How often the writer finishes clips of sources that stopped sending frames
+EXPIRE_CHECK_SEC = 1
+
+logger = logging.getLogger('json')
+
+
+class Clip:
+    __slots__ = ('source', 'name', 'frames', 'end_time', 'max_end_time')
+
+    def __init__(self, source, frames, end_time, max_end_time):
+        self.source = source
+        # Named as stills, by wall clock time of the detection
+        self.name = datetime.now().strftime('%d-%m-%Y-%H-%M-%S') + '.mp4'
+        # (monotonic time, JPEG bytes)
+        self.frames = frames
+        self.end_time = end_time
+        self.max_end_time = max_end_time
+
+
+class ClipBuffer:
+    """
+    Last pre_sec seconds of a source: frames downscaled to width and JPEG compressed,
+    at most fps frames a second and max_bytes in total.
+    A triggered clip takes the buffered frames and collects new ones for post_sec more,
+    a trigger during the post-roll extends it up to max_sec from the first trigger.
+    """
+
+    def __init__(
+        self,
+        profile,
+        pre_sec=DEFAULT_PRE_SEC,
+        post_sec=DEFAULT_POST_SEC,
+        max_sec=DEFAULT_MAX_SEC,
+        fps=DEFAULT_FPS,
+        width=DEFAULT_WIDTH,
+        max_bytes=DEFAULT_BUFFER_MB * 2 ** 20,
+        jpeg_quality=DEFAULT_JPEG_QUALITY,
+    ):
+        self.profile = profile
+        self.pre_sec = pre_sec
+        self.post_sec = post_sec
+        self.max_sec = max_sec
+        self.fps = fps
+        self.interval = 1 / fps
+        self.width = width
+        self.max_bytes = max_bytes
+        self.jpeg_quality = jpeg_quality
+
+        self.frames = deque()
+        self.size = 0
+        self.clip = None
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, profile, source_config):
+        # None if clips are not recorded for the source
+        if not source_config.get('clips', False):
+            return None
+        return cls(
+            profile,
+            pre_sec=source_config.get('clip_pre_sec', DEFAULT_PRE_SEC),
+            post_sec=source_config.get('clip_post_sec', DEFAULT_POST_SEC),
+            max_sec=source_config.get('clip_max_sec', DEFAULT_MAX_SEC),
+            fps=source_config.get('clip_fps', DEFAULT_FPS),
+            width=source_config.get('clip_width', DEFAULT_WIDTH),
+            max_bytes=source_config.get('clip_buffer_mb', DEFAULT_BUFFER_MB) * 2 ** 20,
+        )
+
+    def wants_frame(self, now):
+        return now >= self.next_time
+
+    def encode(self, frame):
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, round(height * self.width / width)), interpolation=cv2.INTER_LINEAR)
+        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not success:
+            raise ValueError(f'Unable to encode clip frame of {self.profile.name}')
+        return buffer.tobytes()
+
+    def add(self, frame, now):
+        """
+        Buffer the frame. Returns the clip if the frame finishes its post-roll.
+        """
+        self.next_time = now + self.interval
+        # Encoded by the capture thread outside of the lock
+        jpeg = self.encode(frame)
+
+        with self.lock:
+            self.frames.append((now, jpeg))
+            self.size += len(jpeg)
+            while self.frames and (self.frames[0][0] < now - self.pre_sec or self.size > self.max_bytes):
+                self.size -= len(self.frames.popleft()[1])
+
+            if self.clip is not None:
+                self.clip.frames.append((now, jpeg))
+                if now >= self.clip.end_time:
+                    return self.finish()
+        return None
+
+    def trigger(self, now):
+        with self.lock:
+            if self.clip is None:
+                self.clip = Clip(self.profile.name, list(self.frames), now + self.post_sec, now + self.max_sec)
+            else:
+                self.clip.end_time = min(now + self.post_sec, self.clip.max_end_time)
+
+    def expire(self, now):
+        """
+        Clip whose post-roll is over although no frame has come, e.g. the stream is down.
+        """
+        with self.lock:
+            if self.clip is not None and now >= self.clip.end_time + self.interval:
+                return self.finish()
+        return None
+
+    def finish(self):
+        clip = self.clip
+        self.clip = None
+        return clip
+
+
+class ClipRecorder:
+    """
+    Pre- and post-event MP4 clips of sources from in-memory buffers of recent frames.
+
+    Capture threads add frames, the recognizer triggers a clip on a confirmed detection,
+    a writer thread decodes the buffered JPEGs and encodes MP4 with cv2.VideoWriter,
+    so neither capture nor the infer callback encode video.
+    on_written(source, path, url) is called when the clip is on disk.
+    """
+
+    # RetentionManager indexing written clips, see argus/utils/retention.py
+    retention = None
+
+    def __init__(self, buffers, max_queue_size=DEFAULT_MAX_QUEUE_SIZE, on_written=None):
+        self.buffers = buffers
+        self.on_written = on_written
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        queue_depth.labels('clips').set_function(self.queue.qsize)
+
+        self.writer = None
+        if buffers:
+            self.writer = Thread(target=self.work, name='ClipWriter', daemon=True)
+            self.writer.start()
+
+    @classmethod
+    def from_config(cls, config, source_profiles):
+        buffers = {}
+        for name, source_config in config['sources'].items():
+            buffer = ClipBuffer.from_config(source_profiles[name], source_config)
+            if buffer is not None:
+                buffers[name] = buffer
+        return cls(buffers, max_queue_size=config['app'].get('clips_queue_size', DEFAULT_MAX_QUEUE_SIZE))
+
+    def wants_frame(self, source):
+        buffer = self.buffers.get(source)
+        return buffer is not None and buffer.wants_frame(monotonic())
+
+    def add(self, source, frame):
+        """
+        Called by the capture thread of the source for every frame it has,
+        frames are buffered at the clip FPS of the source.
+        """
+        buffer = self.buffers.get(source)
+        if buffer is None:
+            return
+        now = monotonic()
+        if not buffer.wants_frame(now):
+            return
+        try:
+            clip = buffer.add(frame, now)
+        except ValueError as e:
+            logger.warning(str(e))
+            return
+        if clip is not None:
+            self.submit(clip)
+
+    def trigger(self, source):
+        buffer = self.buffers.get(source)
+        if buffer is not None:
+            buffer.trigger(monotonic())
+
+    def submit(self, clip):
+        try:
+            self.queue.put_nowait(clip)
+        except queue.Full:
+            dropped_frames.labels(clip.source, 'clips').inc(len(clip.frames))
+            logger.warning('Clip writer queue is full, clip of %s dropped' % clip.source, extra={'source': clip.source})
+
+    def work(self):
+        while True:
+            try:
+                clip = self.queue.get(timeout=EXPIRE_CHECK_SEC)
+            except queue.Empty:
+                clip = None
+
+            if clip is not None:
+                try:
+                    self.write(clip)
+                except Exception:
+                    logger.exception('Unable to write clip of %s', clip.source)
+                self.queue.task_done()
+
+            now = monotonic()
+            for buffer in self.buffers.values():
+                expired = buffer.expire(now)
+                if expired is not None:
+                    self.submit(expired)
+
+    def write(self, clip):
+        if not clip.frames:
+            return
+        profile = self.buffers[clip.source].profile
+        clips_dir = os.path.join(profile.stills_dir, CLIPS_DIR)
+        os.makedirs(clips_dir, mode=0o777, exist_ok=True)
+        path = os.path.join(clips_dir, clip.name)
+
+        # Playback speed follows the real frame times, the source may give less than clip_fps
+        duration = clip.frames[-1][0] - clip.frames[0][0]
+        fps = (len(clip.frames) - 1) / duration if duration > 0 else self.buffers[clip.source].fps
+
+        writer = None
+        try:
+            for _, jpeg in clip.frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                if writer is None:
+                    size = (frame.shape[1], frame.shape[0])
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FOURCC), fps, size)
+                elif (frame.shape[1], frame.shape[0]) != size:
+                    frame = cv2.resize(frame, size)
+                writer.write(frame)
+        finally:
+            if writer is not None:
+                writer.release()
+
+        url = None
+        if profile.host_stills_uri is not None:
+            url = f'{profile.host_stills_uri}/{CLIPS_DIR}/{clip.name}'
+        logger.info(
+            f'Clip of {clip.source} written: {path}',
+            extra={'source': clip.source, 'path': path, 'frames': len(clip.frames)}
+        )
+        if self.retention is not None:
+            self.retention.add(clip.source, path)
+        if self.on_written is not None:
+            self.on_written(clip.source, path, url)
+
+    def join(self):
+        # Waits until every queued clip is written
+        self.queue.join()
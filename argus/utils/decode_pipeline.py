@@ -0,0 +1,115 @@
+import cv2
+
+SOFTWARE = 'software'
+VAAPI = 'vaapi'
+GSTREAMER = 'gstreamer'
+BACKENDS = (SOFTWARE, VAAPI, GSTREAMER)
+
+MAIN_STREAM = 'main'
+SUB_STREAM = 'sub'
+
+APPSINK = 'appsink drop=true max-buffers=1 sync=false'
+
+
+def build_capture_source(source_config):
+    """
+    Returns (source, api_preference) for cv2.VideoCapture from the source config.
+
+    Without decoder section the source is opened as is.
+    Decoder section example:
+        decoder:
+          backend: vaapi            # software, vaapi or gstreamer
+          stream: sub               # main (source) or sub (sub_source)
+          width: 640                # resize inside the pipeline
+          height: 360
+          fps: 5                    # drop frames inside the pipeline
+          pipeline: "..."           # template for gstreamer backend: {source}, {width}, {height}, {fps}
+    """
+    decoder = source_config.get('decoder')
+    if decoder is None:
+        return legacy_capture_source(source_config['source'])
+
+    uri = stream_uri(source_config, decoder.get('stream', MAIN_STREAM))
+    backend = decoder.get('backend', SOFTWARE)
+
+    if backend == GSTREAMER:
+        if 'pipeline' not in decoder:
+            raise ValueError('Decoder pipeline is required for gstreamer backend')
+        pipeline = decoder['pipeline'].format(
+            source=uri,
+            width=decoder.get('width'),
+            height=decoder.get('height'),
+            fps=decoder.get('fps'),
+        )
+        return pipeline, cv2.CAP_GSTREAMER
+
+    if backend == VAAPI:
+        return vaapi_pipeline(uri, decoder), cv2.CAP_GSTREAMER
+
+    if backend == SOFTWARE:
+        if not any(decoder.get(option) for option in ('width', 'height', 'fps')):
+            return legacy_capture_source(uri)
+        return software_pipeline(uri, decoder), cv2.CAP_GSTREAMER
+
+    raise ValueError(f'Unknown decoder backend {backend}, expected one of {", ".join(BACKENDS)}')
+
+
+def legacy_capture_source(uri):
+    if 'rtspsrc' in uri:
+        return uri, cv2.CAP_GSTREAMER
+    return uri, cv2.CAP_ANY
+
+
+def stream_uri(source_config, stream):
+    if stream == MAIN_STREAM:
+        return source_config['source']
+    if stream == SUB_STREAM:
+        if 'sub_source' not in source_config:
+            raise ValueError('sub_source is required for decoder stream: sub')
+        return source_config['sub_source']
+    raise ValueError(f'Unknown decoder stream {stream}, expected {MAIN_STREAM} or {SUB_STREAM}')
+
+
+def source_element(uri):
+    if uri.startswith('rtsp://') or uri.startswith('rtsps://'):
+        return f'rtspsrc location="{uri}" latency=0'
+    if '://' in uri:
+        return f'urisourcebin uri="{uri}"'
+    return f'filesrc location="{uri}"'
+
+
+def postprocess_elements(decoder, scaler):
+    """
+    Frame skipping goes first, so dropped frames are never scaled or converted.
+    """
+    elements = []
+
+    if decoder.get('fps'):
+        elements.append(f'videorate drop-only=true max-rate={decoder["fps"]}')
+
+    size = []
+    if decoder.get('width'):
+        size.append(f'width={decoder["width"]}')
+    if decoder.get('height'):
+        size.append(f'height={decoder["height"]}')
+
+    if scaler == 'vaapipostproc':
+        elements.append(' '.join(['vaapipostproc'] + size))
+    elif size:
+        elements.append('videoscale')
+        elements.append(','.join(['video/x-raw'] + size + ['pixel-aspect-ratio=1/1']))
+
+    elements.append('videoconvert')
+    elements.append('video/x-raw,format=BGR')
+    elements.append(APPSINK)
+    return elements
+
+
+def software_pipeline(uri, decoder):
+    return ' ! '.join([source_element(uri), 'decodebin'] + postprocess_elements(decoder, 'videoscale'))
+
+
+def vaapi_pipeline(uri, decoder):
+    return ' ! '.join(
+        [source_element(uri), 'parsebin', 'vaapidecodebin'] + postprocess_elements(decoder, 'vaapipostproc')
+    )
@@ -0,0 +1,271 @@
+import json
+import logging
+import queue
+import re
+import sqlite3
+
+from datetime import datetime, timedelta
+from threading import Thread
+from time import monotonic, time
+from urllib.parse import parse_qs
+
+from argus.utils.metrics import dropped_frames, queue_depth
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_SEC = 1
+DEFAULT_MAX_QUEUE_SIZE = 10000
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    ts REAL NOT NULL,
+    label TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    xmin INTEGER NOT NULL,
+    ymin INTEGER NOT NULL,
+    xmax INTEGER NOT NULL,
+    ymax INTEGER NOT NULL,
+    track_id INTEGER,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS detections_source_ts ON detections (source, ts);
+CREATE INDEX IF NOT EXISTS detections_label_ts ON detections (label, ts);
+CREATE INDEX IF NOT EXISTS detections_ts ON detections (ts);
+"""
+
+INSERT = """
+INSERT INTO detections (source, ts, label, confidence, xmin, ymin, xmax, ymax, track_id, path)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+COLUMNS = ('source', 'ts', 'label', 'confidence', 'xmin', 'ymin', 'xmax', 'ymax', 'track_id', 'path')
+
+# 7d, 12h, 30m, 45s before now
+RELATIVE_TIME = re.compile(r'^(\d+(?:\.\d+)?)([dhms])$')
+UNITS = {'d': 'days', 'h': 'hours', 'm': 'minutes', 's': 'seconds'}
+
+logger = logging.getLogger('json')
+
+
+class EventStore:
+    """
+    Detections of saved stills in SQLite: one row per object with source, time, label,
+    confidence, box, track id and still path.
+
+    record only queues rows, a writer thread inserts them in batches of batch_size
+    or every flush_sec, one transaction per batch. WAL journal lets queries
+    read while the writer writes. The queue is bounded, rows are dropped when it is full.
+    """
+
+    def __init__(
+        self,
+        path,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_sec=DEFAULT_FLUSH_SEC,
+        max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_sec = flush_sec
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        queue_depth.labels('events').set_function(self.queue.qsize)
+
+        # Schema is created before the first query, the writer connection belongs to the writer thread
+        connection = connect(path)
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        self.writer = Thread(target=self.work, name='EventStore', daemon=True)
+        self.writer.start()
+
+    @classmethod
+    def from_config(cls, app_config):
+        # None if the event store is disabled
+        if not app_config.get('events_db'):
+            return None
+        return cls(
+            app_config['events_db'],
+            batch_size=app_config.get('events_batch_size', DEFAULT_BATCH_SIZE),
+            flush_sec=app_config.get('events_flush_sec', DEFAULT_FLUSH_SEC),
+        )
+
+    def record(self, queue_item, detections):
+        """
+        Queue detections of a saved still, called from the still writer callback.
+        """
+        # Wall clock time of the capture
+        ts = time() - (monotonic() - queue_item.stages['captured'])
+        source = queue_item.thread_name
+        for obj in detections:
+            row = (
+                source,
+                ts,
+                obj['label'],
+                obj['confidence'],
+                obj['xmin'],
+                obj['ymin'],
+                obj['xmax'],
+                obj['ymax'],
+                obj.get('track_id'),
+                queue_item.path,
+            )
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                dropped_frames.labels(source, 'events').inc()
+                logger.warning('Event store queue is full, detection of %s dropped' % source, extra={'source': source})
+                return
+
+    def work(self):
+        connection = connect(self.path)
+        while True:
+            rows = [self.queue.get()]
+            deadline = monotonic() + self.flush_sec
+            while len(rows) < self.batch_size:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                with connection:
+                    connection.executemany(INSERT, rows)
+            except sqlite3.Error:
+                logger.exception('Unable to store %s detections', len(rows))
+
+            for _ in rows:
+                self.queue.task_done()
+
+    def join(self):
+        # Waits until every queued detection is stored
+        self.queue.join()
+
+
+def connect(path, read_only=False):
+    if read_only:
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    else:
+        connection = sqlite3.connect(path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # Durable up to the last checkpoint, enough for detections
+        connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def parse_time(value):
+    """
+    Unix time of an ISO date/time or of a time before now: 7d, 12h, 30m, 45s.
+    """
+    if value is None:
+        return None
+    match = RELATIVE_TIME.match(value)
+    if match:
+        amount, unit = match.groups()
+        return (datetime.now() - timedelta(**{UNITS[unit]: float(amount)})).timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+def query(path, source=None, label=None, since=None, until=None, min_confidence=None, limit=DEFAULT_LIMIT):
+    """
+    Latest detections first, filters are optional. since and until are unix times.
+    """
+    conditions = []
+    params = []
+    for condition, value in (
+        ('source = ?', source),
+        ('label = ?', label),
+        ('ts >= ?', since),
+        ('ts < ?', until),
+        ('confidence >= ?', min_confidence),
+    ):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+
+    sql = f'SELECT {", ".join(COLUMNS)} FROM detections'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY ts DESC LIMIT ?'
+    # Negative LIMIT is no limit for SQLite
+    params.append(max(1, min(limit, MAX_LIMIT)))
+
+    connection = connect(path, read_only=True)
+    try:
+        return [dict(zip(COLUMNS, row)) for row in connection.execute(sql, params)]
+    finally:
+        connection.close()
+
+
+def format_event(event):
+    time_string = datetime.fromtimestamp(event['ts']).isoformat(sep=' ', timespec='seconds')
+    box = f"{event['xmin']},{event['ymin']},{event['xmax']},{event['ymax']}"
+    track = '' if event['track_id'] is None else f" #{event['track_id']}"
+    return (
+        f"{time_string}  {event['source']:<16} {event['label']}{track} ({event['confidence']:.2f})"
+        f"  [{box}]  {event['path'] or ''}"
+    )
+
+
+def add_arguments(parser):
+    parser.add_argument('path', help='SQLite database written with app.events_db')
+    parser.add_argument('--source')
+    parser.add_argument('--label')
+    parser.add_argument('--since', help='ISO date/time or time before now: 7d, 12h, 30m')
+    parser.add_argument('--until', help='ISO date/time or time before now')
+    parser.add_argument('--min-confidence', type=float)
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    parser.add_argument('--json', action='store_true', help='print events as JSON lines')
+
+
+def report(args):
+    events = query(
+        args.path,
+        source=args.source,
+        label=args.label,
+        since=parse_time(args.since),
+        until=parse_time(args.until),
+        min_confidence=args.min_confidence,
+        limit=args.limit,
+    )
+    for event in events:
+        print(json.dumps(event) if args.json else format_event(event))
+
+
+def http_handler(path):
+    """
+    GET /events?source=&label=&since=&until=&min_confidence=&limit= for the metrics HTTP server.
+    Returns a function of the query string to (status, content type, body).
+    """
+    def error(status, message):
+        return status, 'application/json', json.dumps({'error': message}).encode()
+
+    def handle(query_string):
+        params = {key: values[-1] for key, values in parse_qs(query_string).items()}
+        try:
+            limit = int(params.get('limit', DEFAULT_LIMIT))
+            if not 1 <= limit <= MAX_LIMIT:
+                raise ValueError(f'limit must be from 1 to {MAX_LIMIT}')
+            filters = {
+                'source': params.get('source'),
+                'label': params.get('label'),
+                'since': parse_time(params.get('since')),
+                'until': parse_time(params.get('until')),
+                'min_confidence': float(params['min_confidence']) if 'min_confidence' in params else None,
+            }
+        except ValueError as e:
+            return error(400, str(e))
+
+        try:
+            events = query(path, limit=limit, **filters)
+        except sqlite3.Error as e:
+            # Locked, missing or corrupt database
+            logger.exception('Unable to query events')
+            return error(500, str(e))
+        return 200, 'application/json', json.dumps(events).encode()
+    return handle
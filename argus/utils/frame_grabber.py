@@ -4,10 +4,12 @@ import sys
 
 from time import sleep
 
+from argus.utils.decode_pipeline import build_capture_source
 from argus.utils.timing import timing
 
 
 RECONNECT_SLEEP_TIME = 1
+DEFAULT_GRAB_DELAY_SEC = 0.1
 logger = logging.getLogger('json')
 
 
@@ -16,10 +18,10 @@ class FrameGrabber:
     def __init__(self, config):
 
         try:
-            if 'rtspsrc' in config['source']:
-                self.cap = cv2.VideoCapture(config['source'], cv2.CAP_GSTREAMER)
-            else:
-                self.cap = cv2.VideoCapture(config['source'])
+            source, api_preference = build_capture_source(config)
+            if source != config['source']:
+                logger.info("Decode pipeline for %s: %s" % (config['source'], source))
+            self.cap = cv2.VideoCapture(source, api_preference)
         except Exception:
             logger.exception("Unable to create steam %s" % config['source'])
             self._exit()
@@ -27,7 +29,11 @@ class FrameGrabber:
         # Sleep if source is video. 
         # Without sleeping grabbing run very fast.
         # Recognizer does not have time to process the frames. 
-        self.grab_delay = not 'rtsp' in config['source']
+        # grab_delay_sec: 0 reads a file as fast as possible, 1 / fps of the file replays it in real time
+        if 'rtsp' in config['source']:
+            self.grab_delay = 0
+        else:
+            self.grab_delay = config.get('grab_delay_sec', DEFAULT_GRAB_DELAY_SEC)
         
 
         if not self.cap.isOpened():
@@ -36,16 +42,37 @@ class FrameGrabber:
 
 
     def make_snapshot(self):
-
+        self.grab()
+        return self.retrieve()
+
+    def grab(self):
+        """
+        Take the next frame from the stream without decoding it.
+        Keeps the stream buffer drained when the frame is not needed.
+        """
         if self.grab_delay:
-            sleep(0.1)
+            sleep(self.grab_delay)
 
         try:
             if self.cap.isOpened():
-                __, frame = self.cap.read()
+                grabbed = self.cap.grab()
             else:
                 logger.error("Cap is closed")
                 self._exit()
+        except Exception:
+            logger.exception("Unable to grab frame. Exit from thread")
+            self._exit()
+
+        if not grabbed:
+            logger.error('Empty frame. Exit from thread')
+            self._exit()
+
+    def retrieve(self):
+        """
+        Decode the last grabbed frame.
+        """
+        try:
+            __, frame = self.cap.retrieve()
         except Exception:
             logger.exception("Unable to get frame. Exit from thread")
             self._exit()
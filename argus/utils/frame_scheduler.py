@@ -0,0 +1,223 @@
+import logging
+import threading
+
+from time import monotonic
+
+logger = logging.getLogger('json')
+
+DEFAULT_PRIORITY = 1
+DEFAULT_ACTIVE_HOLD_SEC = 10
+DEFAULT_ACTIVE_WEIGHT = 4
+
+
+class SourceState:
+    def __init__(self, priority=DEFAULT_PRIORITY, max_fps=None, idle_fps=None, neighbours=()):
+        self.priority = priority
+        self.min_interval = 1 / max_fps if max_fps else 0
+        # Quiet source is recognized at idle_fps, at max_fps while active
+        self.idle_interval = max(self.min_interval, 1 / idle_fps) if idle_fps else self.min_interval
+        # Sources activated together with this one, e.g. cameras watching the same yard
+        self.neighbours = tuple(neighbours)
+        self.active_until = 0
+        self.dispatched_time = None
+
+        self.item = None
+        self.put_time = None
+        self.next_allowed_time = 0
+
+        # Stride scheduling: source with the smallest pass value goes first,
+        # every dispatch moves it forward by 1 / priority
+        self.pass_value = 0
+
+        self.dropped = 0
+
+    def is_active(self, now):
+        return now < self.active_until
+
+    def interval(self, now):
+        return self.min_interval if self.is_active(now) else self.idle_interval
+
+
+class FrameScheduler:
+    """
+    Keeps only the newest frame of every source and hands frames out on demand.
+    Capture threads put frames, the main loop gets them when an infer request is free.
+    A frame replaced by a newer one (or older than max_frame_age) is dropped, never queued.
+    Sources are served by priority (weighted fair) and not faster than their max_fps.
+
+    Activity (motion or detected objects, see activate) makes a source active for active_hold_sec:
+    its priority is multiplied by active_weight, so quiet sources get a smaller share of inference,
+    and a source with idle_fps goes from idle_fps to full rate.
+    """
+
+    def __init__(
+        self,
+        max_frame_age=None,
+        on_drop=None,
+        active_hold_sec=DEFAULT_ACTIVE_HOLD_SEC,
+        active_weight=DEFAULT_ACTIVE_WEIGHT,
+    ):
+        self.max_frame_age = max_frame_age
+        self.on_drop = on_drop
+        self.active_hold_sec = active_hold_sec
+        self.active_weight = active_weight
+        self.sources = {}
+        self._condition = threading.Condition()
+        self._virtual_time = 0
+
+    def add_source(self, name, priority=DEFAULT_PRIORITY, max_fps=None, idle_fps=None, neighbours=()):
+        with self._condition:
+            self.sources[name] = SourceState(priority, max_fps, idle_fps, neighbours)
+
+    def activate(self, name):
+        """
+        Something happens on the source: it and its neighbours are active for active_hold_sec.
+        An idle source may take its next frame right away, not after the idle interval.
+        """
+        with self._condition:
+            now = monotonic()
+            for source in (name,) + self.sources[name].neighbours:
+                state = self.sources.get(source)
+                if state is None:
+                    continue
+                if not state.is_active(now) and state.dispatched_time is not None:
+                    state.next_allowed_time = min(
+                        state.next_allowed_time, state.dispatched_time + state.min_interval
+                    )
+                state.active_until = now + self.active_hold_sec
+            self._condition.notify_all()
+
+    def is_active(self, name):
+        with self._condition:
+            return self.sources[name].is_active(monotonic())
+
+    def put(self, name, item):
+        with self._condition:
+            state = self.sources[name]
+            if state.item is not None:
+                self._drop(state)
+            else:
+                # Source returns to the competition: do not let it spend the time it was idle
+                state.pass_value = max(state.pass_value, self._virtual_time)
+            state.item = item
+            state.put_time = monotonic()
+            # Main loop and capture readers wait on the same condition
+            self._condition.notify_all()
+
+    def wants_frame(self, name):
+        """
+        True if a new frame of the source would be recognized: nothing is pending
+        (or pending frame is stale) and the source is not rate limited.
+        """
+        with self._condition:
+            return self._wants(self.sources[name], monotonic())
+
+    def wait_wanted(self, name, timeout=None):
+        """
+        Wait until wants_frame is True for the source. Returns False on timeout.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+
+        with self._condition:
+            state = self.sources[name]
+            while True:
+                now = monotonic()
+                if self._wants(state, now):
+                    return True
+
+                wait = state.next_allowed_time - now if state.next_allowed_time > now else None
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return False
+                    wait = remaining if wait is None else min(wait, remaining)
+
+                self._condition.wait(wait)
+
+    def skip(self, name):
+        """
+        Frame of the source was dropped before put, e.g. by the motion gate.
+        It uses the rate of the source as a recognized frame does, so skipped frames
+        are not decoded and checked faster than frames would be recognized.
+        A pending frame or a deadline still ahead is left alone: frames skipped meanwhile
+        by a continuously captured source must not hold back a heartbeat frame.
+        """
+        with self._condition:
+            state = self.sources[name]
+            now = monotonic()
+            if state.item is not None or state.next_allowed_time > now:
+                return
+            state.dispatched_time = now
+            state.next_allowed_time = now + state.interval(now)
+
+    def _wants(self, state, now):
+        if state.next_allowed_time > now:
+            return False
+        if state.item is None:
+            return True
+        return self.max_frame_age is not None and now - state.put_time > self.max_frame_age
+
+    def _drop(self, state):
+        state.dropped += 1
+        if self.on_drop is not None:
+            self.on_drop(state.item)
+        state.item = None
+
+    def get(self, timeout=None):
+        """
+        Wait for the next frame to recognize. Returns None on timeout.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+
+        with self._condition:
+            while True:
+                now = monotonic()
+                item, wait = self._pop_ready(now)
+                if item is not None:
+                    self._condition.notify_all()
+                    return item
+
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+
+                self._condition.wait(wait)
+
+    def _pop_ready(self, now):
+        """
+        Pop frame of the ready source with the smallest pass value.
+        If nothing is ready, return time to wait for a rate limited source.
+        """
+        chosen = None
+        wait = None
+
+        for state in self.sources.values():
+            if state.item is None:
+                continue
+
+            if self.max_frame_age is not None and now - state.put_time > self.max_frame_age:
+                self._drop(state)
+                continue
+
+            if state.next_allowed_time > now:
+                delay = state.next_allowed_time - now
+                wait = delay if wait is None else min(wait, delay)
+                continue
+
+            if chosen is None or state.pass_value < chosen.pass_value:
+                chosen = state
+
+        if chosen is None:
+            return None, wait
+
+        item = chosen.item
+        chosen.item = None
+        chosen.dispatched_time = now
+        chosen.next_allowed_time = now + chosen.interval(now)
+        self._virtual_time = chosen.pass_value
+        weight = chosen.priority * (self.active_weight if chosen.is_active(now) else 1)
+        chosen.pass_value += 1 / weight
+
+        return item, None
@@ -0,0 +1,324 @@
+import logging
+import math
+import threading
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger('json')
+
+
+class Shards:
+    """
+    Per-thread copies of metric values. A thread writes only its own shard, so updates
+    take no lock, the lock is taken once per thread and on scrape to sum the shards.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+
+    def get(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = [0.0] * self.size
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+            return shard
+
+    def sum(self):
+        with self.lock:
+            shards = list(self.shards)
+        return [sum(column) for column in zip(*shards)] if shards else [0.0] * self.size
+
+
+class CounterChild:
+    def __init__(self):
+        self.shards = Shards(1)
+        self.function = None
+
+    def inc(self, amount=1):
+        self.shards.get()[0] += amount
+
+    def set_function(self, function):
+        # Value is taken from function on scrape, e.g. a counter kept by another component
+        self.function = function
+
+    def value(self):
+        if self.function is not None:
+            return self.function()
+        return self.shards.sum()[0]
+
+
+class GaugeChild:
+    def __init__(self):
+        self.current = 0
+        self.function = None
+
+    def set(self, value):
+        self.current = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def value(self):
+        if self.function is not None:
+            return self.function()
+        return self.current
+
+
+class HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Count per bucket (the last one is +Inf), sum, count
+        self.shards = Shards(len(buckets) + 3)
+
+    def observe(self, value):
+        shard = self.shards.get()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    def value(self):
+        return self.shards.sum()
+
+
+class Metric:
+    """
+    Metric family. Children are created once per label values and should be kept
+    by the caller on the hot path, see labels().
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        # Plain dict lookup on the hot path, values are converted to strings on scrape
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def remove(self, *values):
+        with self.lock:
+            self.children.pop(values, None)
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def label_string(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape(str(value))}"' for name, value in pairs) + '}'
+
+    def samples(self):
+        with self.lock:
+            children = list(self.children.items())
+        for values, child in children:
+            try:
+                yield values, child.value()
+            except Exception:
+                logger.exception('Unable to collect metric %s', self.name)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for values, value in self.samples():
+            lines.append(f'{self.name}{self.label_string(values)} {format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def new_child(self):
+        return GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super(Histogram, self).__init__(name, documentation, labelnames, registry)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for values, value in self.samples():
+            cumulative = 0
+            bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+            for bound, bucket_count in zip(bounds, value):
+                cumulative += bucket_count
+                labels = self.label_string(values, [('le', bound)])
+                lines.append(f'{self.name}_bucket{labels} {format_value(cumulative)}')
+            lines.append(f'{self.name}_sum{self.label_string(values)} {format_value(value[-2])}')
+            lines.append(f'{self.name}_count{self.label_string(values)} {format_value(value[-1])}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self.metrics[metric.name] = metric
+
+    def expose(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    value = float(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+REGISTRY = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+    # {path: function of the query string returning (status, content type, body)}
+    routes = {}
+
+    def do_GET(self):
+        path, _, query_string = self.path.partition('?')
+        if path == '/metrics':
+            status, content_type, body = 200, CONTENT_TYPE, self.registry.expose().encode()
+        elif path in self.routes:
+            status, content_type, body = self.routes[path](query_string)
+        else:
+            self.send_error(404)
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not logged
+        pass
+
+
+def start_metrics_server(host, port, registry=REGISTRY, routes=None):
+    handler = type('RegistryMetricsHandler', (MetricsHandler,), {'registry': registry, 'routes': routes or {}})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+    logger.info(f'Metrics are served on http://{host}:{server.server_address[1]}/metrics')
+    return server
+
+
+# Pipeline metrics
+
+capture_frames = Counter(
+    'argus_capture_frames_total', 'Frames captured from the source', ['source']
+)
+dropped_frames = Counter(
+    'argus_dropped_frames_total', 'Frames dropped before recognition', ['source', 'stage']
+)
+motion_frames = Counter(
+    'argus_motion_frames_total', 'Frames checked by the motion gate by result: motion, heartbeat or skipped',
+    ['source', 'result']
+)
+recognized_frames = Counter(
+    'argus_recognized_frames_total', 'Frames recognized', ['source']
+)
+queue_depth = Gauge(
+    'argus_queue_depth', 'Items waiting in the queue', ['queue']
+)
+source_active = Gauge(
+    'argus_source_active', '1 while the source is recognized at full rate after motion or detection', ['source']
+)
+preprocess_seconds = Histogram(
+    'argus_preprocess_seconds', 'Letterboxing of a frame into the infer request input', ['source']
+)
+inference_seconds = Histogram(
+    'argus_inference_seconds', 'Infer request time from start to completion callback', ['batch_size']
+)
+postprocess_seconds = Histogram(
+    'argus_postprocess_seconds', 'Decoding of detections and handling of a recognized frame', ['source']
+)
+infer_requests_busy = Gauge(
+    'argus_infer_requests_busy', 'Infer requests in flight'
+)
+infer_requests_busy_seconds = Counter(
+    'argus_infer_requests_busy_seconds_total', 'Total time of infer requests in flight, '
+    'rate divided by argus_infer_requests is utilization'
+)
+infer_requests = Gauge(
+    'argus_infer_requests', 'Number of infer requests'
+)
+stills_bytes = Gauge(
+    'argus_stills_bytes', 'Size of stills and clips of the source under retention', ['source']
+)
+stills_deleted = Counter(
+    'argus_stills_deleted_total', 'Stills and clips deleted by retention', ['source']
+)
+save_seconds = Histogram(
+    'argus_save_seconds', 'Still latency from queueing to the file on disk'
+)
+notification_seconds = Histogram(
+    'argus_notification_seconds', 'Notification latency from queueing to delivery', ['channel'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+notifications_dropped = Counter(
+    'argus_notifications_dropped_total', 'Notifications dropped or failed', ['channel', 'reason']
+)
+device_temperature = Gauge(
+    'argus_device_temperature_celsius', 'Temperature of the inference device', ['device']
+)
@@ -0,0 +1,90 @@
+import cv2
+
+from time import monotonic
+
+MOTION = 'motion'
+HEARTBEAT = 'heartbeat'
+SKIPPED = 'skipped'
+
+DEFAULT_HEARTBEAT_SEC = 5
+DEFAULT_PIXEL_THRESHOLD = 25
+DEFAULT_THUMBNAIL_WIDTH = 160
+# Samples of the frame averaged into a thumbnail pixel along each axis
+THUMBNAIL_SAMPLES = 2
+# Share of the background replaced by every frame, slow changes of light are absorbed
+BACKGROUND_LEARNING_RATE = 0.05
+
+
+class MotionGate:
+    """
+    Cheap pre-filter of frames before recognition. A frame is compared with the running
+    average background on a small grayscale thumbnail. A frame without motion is skipped,
+    unless no frame of the source has been recognized for heartbeat_sec.
+    """
+
+    def __init__(
+        self,
+        threshold,
+        heartbeat_sec=DEFAULT_HEARTBEAT_SEC,
+        pixel_threshold=DEFAULT_PIXEL_THRESHOLD,
+        thumbnail_width=DEFAULT_THUMBNAIL_WIDTH,
+    ):
+        # Share of thumbnail pixels changed by more than pixel_threshold levels of gray
+        self.threshold = threshold
+        self.heartbeat_sec = heartbeat_sec
+        self.pixel_threshold = pixel_threshold
+        self.thumbnail_width = thumbnail_width
+
+        self.background = None
+        self.passed_time = None
+
+    @classmethod
+    def from_config(cls, source_config):
+        # None if motion gating is disabled for the source
+        if source_config.get('motion_threshold') is None:
+            return None
+        return cls(
+            threshold=source_config['motion_threshold'],
+            heartbeat_sec=source_config.get('motion_heartbeat_sec', DEFAULT_HEARTBEAT_SEC),
+            pixel_threshold=source_config.get('motion_pixel_threshold', DEFAULT_PIXEL_THRESHOLD),
+        )
+
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.thumbnail_width, max(1, round(height * self.thumbnail_width / width)))
+        # Every step-th pixel is taken first, INTER_AREA over a full 4K frame costs more than
+        # the rest of the check. INTER_AREA then averages the samples, sensor noise is smoothed out
+        step = max(1, width // (self.thumbnail_width * THUMBNAIL_SAMPLES))
+        thumbnail = cv2.resize(frame[::step, ::step], size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+
+    def motion(self, frame):
+        """
+        Share of thumbnail pixels that differ from the background, the background is updated.
+        """
+        thumbnail = self.thumbnail(frame)
+
+        if self.background is None or self.background.shape != thumbnail.shape:
+            self.background = thumbnail.astype('float32')
+            return 1.0
+
+        difference = cv2.absdiff(thumbnail, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(thumbnail, self.background, BACKGROUND_LEARNING_RATE)
+        changed = cv2.countNonZero(cv2.threshold(difference, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed / difference.size
+
+    def check(self, frame):
+        """
+        MOTION or HEARTBEAT if the frame has to be recognized, SKIPPED otherwise.
+        """
+        now = monotonic()
+
+        if self.motion(frame) >= self.threshold:
+            result = MOTION
+        elif self.passed_time is None or now - self.passed_time >= self.heartbeat_sec:
+            result = HEARTBEAT
+        else:
+            return SKIPPED
+
+        self.passed_time = now
+        return result
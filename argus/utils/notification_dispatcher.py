@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import threading
+
+from collections import OrderedDict
+from itertools import count
+from time import monotonic
+
+from argus.utils.metrics import notification_seconds, notifications_dropped, queue_depth
+
+DEFAULT_MAX_QUEUE_SIZE = 100
+DEFAULT_CONCURRENCY = 1
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_SEC = 1
+DEFAULT_MAX_BACKOFF_SEC = 30
+LOG_STATS_SEC = 60
+
+# Notifications are delivered by channels, each with its own queue and workers
+# on the background loop of async_loop. A slow Telegram does not hold emails
+# and can not take more memory than its queue.
+_dispatcher = None
+logger = logging.getLogger('json')
+
+
+class Notification:
+    __slots__ = ('func', 'args', 'on_delivered', 'created')
+
+    def __init__(self, func, args, on_delivered=None):
+        self.func = func
+        self.args = args
+        self.on_delivered = on_delivered
+        self.created = monotonic()
+
+
+class NotificationChannel:
+    """
+    Bounded queue of notifications of one channel (telegram, email) and its workers.
+
+    Notification with the same (source, kind) as a queued one replaces it in place:
+    only the newest one of a source is sent. When the queue is full the oldest one is dropped.
+    Failed notifications are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        name,
+        loop,
+        max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+        concurrency=DEFAULT_CONCURRENCY,
+        retries=DEFAULT_RETRIES,
+        backoff_sec=DEFAULT_BACKOFF_SEC,
+        max_backoff_sec=DEFAULT_MAX_BACKOFF_SEC,
+    ):
+        self.name = name
+        self.max_queue_size = max_queue_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff_sec = backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()
+        self.keys = count()
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.latency_sum = 0
+        self.latency_max = 0
+        self.stats_started = monotonic()
+
+        queue_depth.labels(f'notifications_{name}').set_function(lambda: len(self.pending))
+        self.latency_metric = notification_seconds.labels(name)
+
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+        self.loop.call_soon_threadsafe(self.start)
+
+    def start(self):
+        # Called in the loop thread
+        for _ in range(self.concurrency):
+            self.loop.create_task(self.work())
+
+    def put(self, func, args, source=None, kind=None, on_delivered=None):
+        """
+        Thread-safe. Without source every notification is queued separately.
+        """
+        key = (source, kind) if source is not None else next(self.keys)
+
+        with self.lock:
+            if key in self.pending:
+                # Keeps the place and the creation time of the replaced notification
+                self.pending[key].func = func
+                self.pending[key].args = args
+                self.pending[key].on_delivered = on_delivered
+                self.coalesced += 1
+            else:
+                if len(self.pending) >= self.max_queue_size:
+                    self.pending.popitem(last=False)
+                    self.dropped += 1
+                    notifications_dropped.labels(self.name, 'queue_full').inc()
+                    logger.warning(f'Notification queue {self.name} is full, the oldest notification dropped')
+                self.pending[key] = Notification(func, args, on_delivered)
+
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def take(self):
+        with self.lock:
+            if not self.pending:
+                return None
+            _, notification = self.pending.popitem(last=False)
+            return notification
+
+    async def work(self):
+        while True:
+            await self.wakeup.wait()
+            notification = self.take()
+            if notification is None:
+                # Nothing is awaited since the check, so no wakeup is lost
+                self.wakeup.clear()
+                continue
+            await self.deliver(notification)
+            self.log_stats()
+
+    async def deliver(self, notification):
+        task_name = getattr(notification.func, '__qualname__', str(notification.func))
+
+        for attempt in range(self.retries + 1):
+            try:
+                await notification.func(*notification.args)
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception('Notification failed: %s', task_name)
+                    with self.lock:
+                        self.failed += 1
+                    notifications_dropped.labels(self.name, 'failed').inc()
+                    return
+                delay = min(self.backoff_sec * 2 ** attempt, self.max_backoff_sec)
+                logger.warning(f'Notification {task_name} failed, retry in {delay} sec')
+                await asyncio.sleep(delay)
+            else:
+                latency = monotonic() - notification.created
+                self.latency_metric.observe(latency)
+                with self.lock:
+                    self.sent += 1
+                    self.latency_sum += latency
+                    self.latency_max = max(self.latency_max, latency)
+                if notification.on_delivered is not None:
+                    try:
+                        notification.on_delivered()
+                    except Exception:
+                        logger.exception('Delivery callback failed: %s', task_name)
+                return
+
+    def stats(self, reset=False):
+        with self.lock:
+            stats = {
+                'channel': self.name,
+                'queue_depth': len(self.pending),
+                'sent': self.sent,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'latency_avg': self.latency_sum / self.sent if self.sent else 0,
+                'latency_max': self.latency_max,
+            }
+            if reset:
+                self.sent = self.failed = self.dropped = self.coalesced = 0
+                self.latency_sum = self.latency_max = 0
+                self.stats_started = monotonic()
+        return stats
+
+    def log_stats(self):
+        if monotonic() - self.stats_started < LOG_STATS_SEC:
+            return
+        stats = self.stats(reset=True)
+        logger.info(
+            f'Notifications {self.name}: sent {stats["sent"]}, dropped {stats["dropped"]}, '
+            f'queue {stats["queue_depth"]}',
+            extra=stats
+        )
+
+
+class NotificationDispatcher:
+    def __init__(self, loop, channels_config=None):
+        self.loop = loop
+        self.channels_config = channels_config or {}
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def channel(self, name):
+        # Channels are created on first use, settings are taken from notifications.<name>
+        with self.lock:
+            if name not in self.channels:
+                self.channels[name] = NotificationChannel(name, self.loop, **self.channels_config.get(name, {}))
+            return self.channels[name]
+
+    def dispatch(self, channel, func, *args, source=None, kind=None, on_delivered=None):
+        self.channel(channel).put(func, args, source, kind, on_delivered)
+
+
+def init_notification_dispatcher(loop, channels_config=None):
+    global _dispatcher
+    _dispatcher = NotificationDispatcher(loop, channels_config)
+    return _dispatcher
+
+
+def dispatch(channel, func, *args, source=None, kind=None, on_delivered=None):
+    """
+    Queue coroutine function func(*args) to the channel, callable from any thread.
+    Queued notification of the same source and kind is replaced.
+    on_delivered() is called on the loop after successful delivery.
+    """
+    if _dispatcher is None:
+        raise RuntimeError('Notification dispatcher not initialized')
+    _dispatcher.dispatch(channel, func, *args, source=source, kind=kind, on_delivered=on_delivered)
@@ -0,0 +1,218 @@
+import logging
+import os
+import re
+import threading
+
+from collections import deque
+from datetime import datetime
+from threading import Thread
+from time import monotonic, sleep, time
+
+from argus.domain.queue_item import STILLS_DATE_FORMAT
+from argus.utils.metrics import stills_bytes, stills_deleted
+
+DEFAULT_DELETES_PER_SEC = 20
+DEFAULT_CHECK_SEC = 60
+
+# Day directory of the dated layout relative to stills_dir
+DATED_DIR = re.compile(r'^\d{4}/\d{2}/\d{2}$')
+
+logger = logging.getLogger('json')
+
+
+class StillsIndex:
+    """
+    Files of one source: stills and clips in stills_dir, oldest first, with their total size.
+
+    Built once by a scan of stills_dir, then kept up to date by the still and clip writers,
+    so quotas are checked without listing directories. New files are the newest ones
+    and are appended. Files added during the scan are merged when it is over.
+    """
+
+    def __init__(self, source, stills_dir, max_age_sec=None, max_bytes=None):
+        self.source = source
+        self.stills_dir = stills_dir
+        self.max_age_sec = max_age_sec
+        self.max_bytes = max_bytes
+
+        # (mtime, path, size)
+        self.files = deque()
+        self.size = 0
+        self.ready = False
+        self.pending = []
+        self.lock = threading.Lock()
+        stills_bytes.labels(source).set_function(lambda: self.size)
+
+    @classmethod
+    def from_config(cls, profile, source_config, app_config):
+        # None if the source has no quota, source keys override app keys
+        retention_days = source_config.get('retention_days', app_config.get('retention_days'))
+        retention_gb = source_config.get('retention_gb', app_config.get('retention_gb'))
+        if retention_days is None and retention_gb is None:
+            return None
+        return cls(
+            profile.name,
+            profile.stills_dir,
+            max_age_sec=retention_days * 86400 if retention_days is not None else None,
+            max_bytes=int(retention_gb * 2 ** 30) if retention_gb is not None else None,
+        )
+
+    def add(self, path, mtime, size):
+        with self.lock:
+            if not self.ready:
+                self.pending.append((mtime, path, size))
+                return
+            self.files.append((mtime, path, size))
+            self.size += size
+
+    def bootstrap(self):
+        files = []
+        for root, _, names in os.walk(self.stills_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+
+        with self.lock:
+            scanned = {path for _, path, _ in files}
+            files.extend(file for file in self.pending if file[1] not in scanned)
+            files.sort()
+            self.files = deque(files)
+            self.size = sum(size for _, _, size in files)
+            self.pending = []
+            self.ready = True
+
+        logger.info(
+            f'Stills of {self.source} indexed: {len(files)} files, {self.size / 2 ** 30:.2f} GB',
+            extra={'source': self.source, 'files': len(files), 'bytes': self.size}
+        )
+
+    def pop_expired(self, now):
+        """
+        Oldest file if it is over the age or the size quota, it is removed from the index.
+        """
+        with self.lock:
+            if not self.files:
+                return None
+            mtime, path, size = self.files[0]
+            too_old = self.max_age_sec is not None and mtime < now - self.max_age_sec
+            too_big = self.max_bytes is not None and self.size > self.max_bytes
+            if not too_old and not too_big:
+                return None
+            self.files.popleft()
+            self.size -= size
+            next_path = self.files[0][1] if self.files else None
+        return path, next_path
+
+
+class RetentionManager:
+    """
+    Keeps stills_dir of every source with a quota within retention_days and retention_gb:
+    a worker thread deletes the oldest files of every source first, at most deletes_per_sec
+    files a second in total, so cleanup does not compete with capture and still writes for the disk.
+    Empty day directories are removed after their last file.
+    """
+
+    def __init__(self, indexes, deletes_per_sec=DEFAULT_DELETES_PER_SEC, check_sec=DEFAULT_CHECK_SEC):
+        self.indexes = indexes
+        self.delete_interval = 1 / deletes_per_sec
+        self.check_sec = check_sec
+        self.worker = None
+
+    @classmethod
+    def from_config(cls, config, source_profiles):
+        # None if no source has a quota
+        indexes = {}
+        for name, source_config in config['sources'].items():
+            index = StillsIndex.from_config(source_profiles[name], source_config, config['app'])
+            if index is not None:
+                indexes[name] = index
+        if not indexes:
+            return None
+        return cls(
+            indexes,
+            deletes_per_sec=config['app'].get('retention_deletes_per_sec', DEFAULT_DELETES_PER_SEC),
+            check_sec=config['app'].get('retention_check_sec', DEFAULT_CHECK_SEC),
+        )
+
+    def start(self):
+        self.worker = Thread(target=self.work, name='Retention', daemon=True)
+        self.worker.start()
+
+    def add(self, source, path):
+        """
+        Called by the still and clip writers when a file is on disk.
+        """
+        index = self.indexes.get(source)
+        if index is None:
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        index.add(path, stat.st_mtime, stat.st_size)
+
+    def work(self):
+        for index in self.indexes.values():
+            index.bootstrap()
+        while True:
+            started = monotonic()
+            self.enforce()
+            sleep(max(self.check_sec - (monotonic() - started), 0))
+
+    def enforce(self):
+        """
+        Delete expired files round-robin: one file of every source over its quota per pass,
+        so deletes_per_sec is shared and a source with a large backlog does not hold the others.
+        """
+        deleted = {}
+        pending = list(self.indexes.values())
+        while pending:
+            over_quota = []
+            for index in pending:
+                expired = index.pop_expired(time())
+                if expired is None:
+                    continue
+                over_quota.append(index)
+                if self.delete(index, *expired):
+                    deleted[index.source] = deleted.get(index.source, 0) + 1
+                sleep(self.delete_interval)
+            pending = over_quota
+
+        for source, count in deleted.items():
+            logger.info(
+                f'Stills of {source} deleted by retention: {count}',
+                extra={'source': source, 'deleted': count, 'bytes': self.indexes[source].size}
+            )
+
+    def delete(self, index, path, next_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f'Unable to delete {path}: {e}', extra={'source': index.source})
+            return False
+        else:
+            stills_deleted.labels(index.source).inc()
+
+        directory = os.path.dirname(path)
+        if next_path is None or os.path.dirname(next_path) != directory:
+            self.remove_day_dir(index.stills_dir, directory)
+        return True
+
+    @staticmethod
+    def remove_day_dir(stills_dir, directory):
+        # Day, month and year directories of the dated layout, if they are empty and not of today
+        relative = os.path.relpath(directory, stills_dir)
+        if not DATED_DIR.match(relative) or relative == datetime.now().strftime(STILLS_DATE_FORMAT):
+            return
+        for _ in range(3):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
@@ -0,0 +1,43 @@
+import math
+
+import cv2
+import numpy as np
+
+
+class Roi:
+    """
+    Region of interest of a source: polygon in frame pixels.
+    Only the bounding crop of the polygon is recognized, detections with the box center
+    outside the polygon are discarded.
+    """
+
+    def __init__(self, points):
+        self.polygon = np.array(points, np.float32).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError(f'ROI polygon needs at least 3 points, got {len(self.polygon)}')
+
+        xmin, ymin = self.polygon.min(axis=0).tolist()
+        xmax, ymax = self.polygon.max(axis=0).tolist()
+        self.bounds = (max(0, math.floor(xmin)), max(0, math.floor(ymin)), math.ceil(xmax), math.ceil(ymax))
+
+    @classmethod
+    def from_config(cls, points):
+        if not points:
+            return None
+        return cls(points)
+
+    def crop(self, frame):
+        """
+        View of the frame inside the polygon bounds and the offset of the view in the frame.
+        The whole frame if the polygon is outside of it.
+        """
+        height, width = frame.shape[:2]
+        xmin, ymin, xmax, ymax = self.bounds
+        xmax, ymax = min(xmax, width), min(ymax, height)
+        if xmin >= xmax or ymin >= ymax:
+            return frame, (0, 0)
+        return frame[ymin:ymax, xmin:xmax], (xmin, ymin)
+
+    def contains(self, x, y):
+        # Points on the edge are inside
+        return cv2.pointPolygonTest(self.polygon, (float(x), float(y)), False) >= 0
@@ -0,0 +1,176 @@
+import multiprocessing
+
+import numpy as np
+
+from time import monotonic_ns
+
+from multiprocessing import shared_memory
+
+# Columns of slot metadata
+SEQ = 0
+HEIGHT = 1
+WIDTH = 2
+CHANNELS = 3
+PINS = 4
+CAPTURED = 5
+SLOT_FIELDS = 6
+
+# Ring state
+LATEST_SLOT = 0
+LATEST_SEQ = 1
+CONSUMED_SEQ = 2
+DROPPED = 3
+STATE_FIELDS = 4
+
+ALIGNMENT = 64
+WRITING = -1
+
+
+class SharedFrame:
+    """
+    Frame read from the ring: data is a view into shared memory, valid until release().
+    """
+    __slots__ = ('ring', 'slot', 'seq', 'data', 'captured')
+
+    def __init__(self, ring, slot, seq, data, captured):
+        self.ring = ring
+        self.slot = slot
+        self.seq = seq
+        self.data = data
+        # Monotonic time of the write, the clock is shared by processes
+        self.captured = captured
+
+    def release(self):
+        self.ring.release(self.slot)
+
+
+class SharedFrameRing:
+    """
+    Ring of frame slots in shared memory. A capture process writes frames,
+    the main process reads the newest one without copying or pickling.
+
+    Slots being read are pinned and never overwritten, the writer takes the oldest free slot
+    or drops the frame if every slot is pinned. Metadata is guarded by a process-shared lock,
+    frame data is copied outside of it.
+    """
+
+    def __init__(self, slots, max_frame_size, context=None):
+        context = context or multiprocessing.get_context('spawn')
+        width, height = max_frame_size
+
+        self.slots = slots
+        self.slot_bytes = width * height * 3
+        self.lock = context.Lock()
+        self.new_frame = context.Event()
+
+        self.shm = shared_memory.SharedMemory(create=True, size=self._data_offset() + slots * self.slot_bytes)
+        self._attach()
+        self.meta[:] = 0
+        self.state[:] = 0
+        self.state[LATEST_SLOT] = -1
+
+    def __getstate__(self):
+        return {
+            'slots': self.slots,
+            'slot_bytes': self.slot_bytes,
+            'lock': self.lock,
+            'new_frame': self.new_frame,
+            'name': self.shm.name,
+        }
+
+    def __setstate__(self, state):
+        self.slots = state['slots']
+        self.slot_bytes = state['slot_bytes']
+        self.lock = state['lock']
+        self.new_frame = state['new_frame']
+        # Spawned processes share the resource tracker of the creator, the segment is unlinked once
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self._attach()
+
+    def _data_offset(self):
+        header_bytes = (self.slots * SLOT_FIELDS + STATE_FIELDS) * np.dtype(np.int64).itemsize
+        return -(-header_bytes // ALIGNMENT) * ALIGNMENT
+
+    def _attach(self):
+        self.meta = np.ndarray((self.slots, SLOT_FIELDS), np.int64, buffer=self.shm.buf)
+        self.state = np.ndarray(
+            (STATE_FIELDS,), np.int64, buffer=self.shm.buf, offset=self.meta.nbytes
+        )
+
+    def _slot_view(self, slot, shape):
+        return np.ndarray(shape, np.uint8, buffer=self.shm.buf, offset=self._data_offset() + slot * self.slot_bytes)
+
+    @property
+    def dropped(self):
+        return int(self.state[DROPPED])
+
+    @property
+    def written(self):
+        return int(self.state[LATEST_SEQ])
+
+    def write(self, frame):
+        """
+        Copy frame into a free slot and publish it. Returns False if every slot is pinned.
+        """
+        captured = monotonic_ns()
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f'Frame {frame.shape} does not fit into ring slot of {self.slot_bytes} bytes')
+
+        with self.lock:
+            free_slots = [
+                slot for slot in range(self.slots)
+                if self.meta[slot, PINS] == 0 and slot != self.state[LATEST_SLOT]
+            ]
+            if not free_slots:
+                self.state[DROPPED] += 1
+                return False
+            slot = min(free_slots, key=lambda free_slot: self.meta[free_slot, SEQ])
+            self.meta[slot, SEQ] = WRITING
+
+        np.copyto(self._slot_view(slot, frame.shape), frame)
+
+        with self.lock:
+            seq = self.state[LATEST_SEQ] + 1
+            self.meta[slot, SEQ] = seq
+            self.meta[slot, HEIGHT:PINS] = frame.shape
+            self.meta[slot, CAPTURED] = captured
+            self.state[LATEST_SLOT] = slot
+            self.state[LATEST_SEQ] = seq
+
+        self.new_frame.set()
+        return True
+
+    def frame_wanted(self):
+        """
+        True if the reader has taken the latest frame and waits for a new one.
+        """
+        with self.lock:
+            return self.state[CONSUMED_SEQ] == self.state[LATEST_SEQ]
+
+    def read_latest(self, after_seq=0):
+        """
+        Pin and return the newest frame if it is newer than after_seq, otherwise None.
+        """
+        with self.lock:
+            seq = int(self.state[LATEST_SEQ])
+            if seq <= after_seq:
+                return None
+            slot = int(self.state[LATEST_SLOT])
+            self.meta[slot, PINS] += 1
+            self.state[CONSUMED_SEQ] = seq
+            shape = tuple(int(size) for size in self.meta[slot, HEIGHT:PINS])
+            captured = int(self.meta[slot, CAPTURED]) / 1e9
+
+        return SharedFrame(self, slot, seq, self._slot_view(slot, shape), captured)
+
+    def release(self, slot):
+        with self.lock:
+            self.meta[slot, PINS] -= 1
+
+    def close(self, unlink=False):
+        # Views must be dropped before the mapping is closed
+        self.meta = None
+        self.state = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
@@ -0,0 +1,198 @@
+import logging
+import os
+import queue
+import threading
+
+from threading import Thread
+from time import monotonic
+
+from argus.domain.queue_item import DEFAULT_JPEG_QUALITY
+from argus.utils.metrics import dropped_frames, queue_depth, save_seconds
+
+DROP = 'drop'
+BLOCK = 'block'
+POLICIES = (DROP, BLOCK)
+
+DEFAULT_WORKERS = 1
+DEFAULT_MAX_QUEUE_SIZE = 16
+LOG_STATS_SEC = 60
+
+logger = logging.getLogger('json')
+
+
+class StillWriterStats:
+    """
+    Counters of the writer, updated by workers under the lock.
+    Latency is the time from submit to the file on disk, write time is the encode and disk I/O.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency_sum = 0
+        self.latency_max = 0
+        self.write_time_sum = 0
+        self.started = monotonic()
+
+    def on_written(self, success, latency, write_time):
+        with self.lock:
+            if success:
+                self.written += 1
+            else:
+                self.failed += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.write_time_sum += write_time
+
+    def on_dropped(self):
+        with self.lock:
+            self.dropped += 1
+
+    def snapshot(self, reset=False):
+        with self.lock:
+            done = self.written + self.failed
+            stats = {
+                'written': self.written,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'latency_avg': self.latency_sum / done if done else 0,
+                'latency_max': self.latency_max,
+                'write_time_avg': self.write_time_sum / done if done else 0,
+                'period': monotonic() - self.started,
+            }
+            if reset:
+                self.reset()
+        return stats
+
+
+class StillWriter:
+    """
+    Saves stills on worker threads, so JPEG encoding and disk I/O never run
+    in the OpenVINO completion callback.
+
+    The queue is bounded. When it is full the still is dropped (policy drop)
+    or submit waits for a free place (policy block, backpressure to recognition).
+    on_saved(queue_item) is called after the write, with path and url set on success,
+    or right away if the still is dropped, so notifications are not lost.
+    """
+
+    # RetentionManager indexing written stills, see argus/utils/retention.py
+    retention = None
+
+    def __init__(
+        self,
+        workers=DEFAULT_WORKERS,
+        max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+        policy=DROP,
+        jpeg_quality=DEFAULT_JPEG_QUALITY,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown still writer policy {policy}, expected one of {", ".join(POLICIES)}')
+
+        self.policy = policy
+        self.jpeg_quality = jpeg_quality
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stats = StillWriterStats()
+        queue_depth.labels('stills').set_function(self.queue.qsize)
+
+        # Directories known to exist, makedirs is called once per directory
+        self.created_dirs = set()
+        self.dirs_lock = threading.Lock()
+
+        self.workers = []
+        for index in range(workers):
+            worker = Thread(target=self.work, name=f'StillWriter-{index}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    @classmethod
+    def from_config(cls, app_config):
+        return cls(
+            workers=app_config.get('stills_writer_threads', DEFAULT_WORKERS),
+            max_queue_size=app_config.get('stills_queue_size', DEFAULT_MAX_QUEUE_SIZE),
+            policy=app_config.get('stills_queue_policy', DROP),
+            jpeg_quality=app_config.get('jpeg_quality', DEFAULT_JPEG_QUALITY),
+        )
+
+    def submit(self, queue_item, on_saved=None):
+        """
+        Queue the still of the item. Returns False if it is dropped.
+        """
+        # Annotated copy is made here: the raw frame is released after recognition
+        queue_item.frame
+        queue_item.mark('save_queued')
+        task = (queue_item, queue_item.still_filename(), on_saved, monotonic())
+
+        try:
+            self.queue.put(task, block=self.policy == BLOCK)
+        except queue.Full:
+            self.stats.on_dropped()
+            dropped_frames.labels(queue_item.thread_name, 'stills').inc()
+            logger.warning(
+                'Still writer queue is full, still of %s dropped' % queue_item.thread_name,
+                extra={'source': queue_item.thread_name}
+            )
+            self.call_on_saved(on_saved, queue_item)
+            return False
+
+        return True
+
+    def work(self):
+        while True:
+            queue_item, frame_filename, on_saved, submitted = self.queue.get()
+            try:
+                self.write(queue_item, frame_filename, submitted)
+            except Exception:
+                logger.exception('Unable to save still of %s', queue_item.thread_name)
+            self.call_on_saved(on_saved, queue_item)
+            self.queue.task_done()
+            self.log_stats()
+
+    def write(self, queue_item, frame_filename, submitted):
+        started = monotonic()
+        # Date directory of the still, see QueueItem.still_filename
+        self.ensure_dir(os.path.dirname(os.path.join(queue_item.stills_dir, frame_filename)))
+        queue_item.save(frame_filename, self.jpeg_quality, make_dirs=False)
+        finished = monotonic()
+        queue_item.stages['saved'] = finished
+        self.stats.on_written(queue_item.path is not None, finished - submitted, finished - started)
+        save_seconds.observe(finished - submitted)
+        if queue_item.path is not None and self.retention is not None:
+            self.retention.add(queue_item.thread_name, queue_item.path)
+
+    def ensure_dir(self, path):
+        if path in self.created_dirs:
+            return
+        with self.dirs_lock:
+            if path not in self.created_dirs:
+                os.makedirs(path, mode=0o777, exist_ok=True)
+                self.created_dirs.add(path)
+
+    @staticmethod
+    def call_on_saved(on_saved, queue_item):
+        if on_saved is None:
+            return
+        try:
+            on_saved(queue_item)
+        except Exception:
+            logger.exception('Still callback failed for %s', queue_item.thread_name)
+
+    def log_stats(self):
+        if monotonic() - self.stats.started < LOG_STATS_SEC:
+            return
+        stats = self.stats.snapshot(reset=True)
+        stats['queue_size'] = self.queue.qsize()
+        logger.info(
+            f'Stills written: {stats["written"]}, dropped: {stats["dropped"]}, '
+            f'latency avg: {stats["latency_avg"]:.3f} sec',
+            extra=stats
+        )
+
+    def join(self):
+        # Waits until every queued still is written
+        self.queue.join()
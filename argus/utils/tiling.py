@@ -0,0 +1,17 @@
+def tile_spans(length, count, overlap):
+    """
+    count spans of equal size covering length, neighbour spans overlap by the overlap share of the span.
+    """
+    size = length / (count - (count - 1) * overlap)
+    step = size * (1 - overlap)
+    return [(round(index * step), min(length, round(index * step + size))) for index in range(count)]
+
+
+def tile_rects(width, height, grid, overlap):
+    """
+    (xmin, ymin, xmax, ymax) of every tile of the cols x rows grid over width x height, row by row.
+    """
+    cols, rows = grid
+    xs = tile_spans(width, cols, overlap)
+    ys = tile_spans(height, rows, overlap)
+    return [(xmin, ymin, xmax, ymax) for ymin, ymax in ys for xmin, xmax in xs]
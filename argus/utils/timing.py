@@ -37,4 +37,24 @@ class Throttler:
         if self.last_time_called is None or now - self.last_time_called >= self.interval:
             self.last_time_called = now
             return True
-        return False
\ No newline at end of file
+        return False
+
+
+class FpsCounter:
+    def __init__(self, interval):
+        self.interval = interval
+        self.count = 0
+        self.started = time()
+
+    def up(self):
+        """
+        Count a frame. Returns FPS once per interval, otherwise None.
+        """
+        self.count += 1
+        now = time()
+        if now - self.started >= self.interval:
+            fps = self.count / (now - self.started)
+            self.count = 0
+            self.started = now
+            return fps
+        return None
@@ -0,0 +1,199 @@
+import argparse
+import json
+import logging
+import math
+import threading
+
+from collections import defaultdict
+from datetime import datetime
+from time import monotonic
+
+# Order of stages of a frame, a stage duration is the time since the previous recorded stage
+STAGES = (
+    'captured',
+    'scheduled',
+    'preprocessed',
+    'inferred',
+    'postprocessed',
+    'save_queued',
+    'saved',
+)
+NOTIFIED_PREFIX = 'notified_'
+
+DEFAULT_SAMPLE_RATE = 0.01
+FLUSH_SEC = 1
+PERCENTILES = (50, 95, 99)
+
+# Stages are recorded for every QueueItem, only sampled items are exported.
+# Export is called at the end of every branch of the pipeline (recognized, saved, notified),
+# so an item may have several records, the report merges them by trace_id
+_tracer = None
+logger = logging.getLogger('json')
+
+
+class Tracer:
+    """
+    Writes sampled traces as JSON lines: stage offsets in ms from capture.
+    Items are sampled by trace_id, so all records of a sampled item are written.
+    """
+
+    def __init__(self, path, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.path = path
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+        self.flushed = monotonic()
+
+    def export(self, queue_item):
+        if not self.sample_every or queue_item.trace_id % self.sample_every:
+            return
+
+        # Stages may be added by other threads, dict copy is atomic
+        stages = dict(queue_item.stages)
+        captured = stages.get('captured')
+        if captured is None:
+            return
+
+        line = json.dumps({
+            'trace_id': queue_item.trace_id,
+            'source': queue_item.thread_name,
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'stages': {stage: round((time - captured) * 1000, 3) for stage, time in stages.items()},
+        })
+
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line + '\n')
+            now = monotonic()
+            if now - self.flushed >= FLUSH_SEC:
+                self.file.flush()
+                self.flushed = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def init_tracer(path, sample_rate=DEFAULT_SAMPLE_RATE):
+    global _tracer
+    _tracer = Tracer(path, sample_rate)
+    return _tracer
+
+
+def close_tracer():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+
+def export_trace(queue_item):
+    # Noop if tracing is not configured
+    if _tracer is not None:
+        _tracer.export(queue_item)
+
+
+def read_traces(path):
+    """
+    Records of one item merged into one: {trace_id: (source, stages)}
+    """
+    traces = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            source, stages = traces.setdefault(record['trace_id'], (record['source'], {}))
+            stages.update(record['stages'])
+    return traces
+
+
+def stage_durations(stages):
+    """
+    Duration of every recorded stage since the previous one, plus total and,
+    for notified items, detection to alert delay, all in ms.
+    """
+    ordered = [stage for stage in STAGES if stage in stages]
+    notified = sorted(stage for stage in stages if stage.startswith(NOTIFIED_PREFIX))
+
+    durations = {}
+    for previous, stage in zip(ordered, ordered[1:]):
+        durations[stage] = stages[stage] - stages[previous]
+
+    last_pipeline_stage = ordered[-1] if ordered else 'captured'
+    for stage in notified:
+        durations[stage] = stages[stage] - stages.get(last_pipeline_stage, 0)
+
+    durations['total'] = max(stages.values())
+    if notified:
+        durations['alert'] = min(stages[stage] for stage in notified)
+    return durations
+
+
+def percentile(values, percent):
+    # Nearest-rank percentile
+    values = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(traces):
+    """
+    {source: {stage: {'count': n, 'p50': ms, 'p95': ms, 'p99': ms}}}, 'all' for every source.
+    """
+    samples = defaultdict(lambda: defaultdict(list))
+    for source, stages in traces.values():
+        for stage, duration in stage_durations(stages).items():
+            samples[source][stage].append(duration)
+            samples['all'][stage].append(duration)
+
+    summary = {}
+    for source, stages in samples.items():
+        summary[source] = {}
+        for stage, durations in stages.items():
+            summary[source][stage] = {'count': len(durations)}
+            for percent in PERCENTILES:
+                summary[source][stage][f'p{percent}'] = round(percentile(durations, percent), 3)
+    return summary
+
+
+def stage_order(stage):
+    if stage in STAGES:
+        return STAGES.index(stage), stage
+    if stage.startswith(NOTIFIED_PREFIX):
+        return len(STAGES), stage
+    return len(STAGES) + 1, stage
+
+
+def format_summary(summary):
+    lines = []
+    for source in sorted(summary, key=lambda name: (name == 'all', name)):
+        lines.append(source)
+        lines.append(f'  {"stage":<24}{"count":>8}' + ''.join(f'{f"p{p}, ms":>12}' for p in PERCENTILES))
+        for stage in sorted(summary[source], key=stage_order):
+            row = summary[source][stage]
+            lines.append(
+                f'  {stage:<24}{row["count"]:>8}' + ''.join(f'{row[f"p{p}"]:>12.2f}' for p in PERCENTILES)
+            )
+    return '\n'.join(lines)
+
+
+def add_arguments(parser):
+    parser.add_argument('path', help='JSON lines file written with app.trace_path')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+
+
+def report(args):
+    summary = summarize(read_traces(args.path))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(format_summary(summary))
+
+
+if __name__ == '__main__':
+    # Report of p50/p95/p99 per stage and source: python -m argus.utils.tracing /app/data/traces.jsonl
+    parser = argparse.ArgumentParser(description='Latency of pipeline stages from a trace file')
+    add_arguments(parser)
+    report(parser.parse_args())
@@ -0,0 +1,242 @@
+import threading
+
+from itertools import count
+
+import numpy as np
+
+from argus.utils.yolo import PROB_THRESHOLD
+
+DEFAULT_MIN_HITS = 3
+DEFAULT_MAX_MISSES = 5
+DEFAULT_IOU_THRESHOLD = 0.3
+# Every detection the recognizer keeps can start a track
+DEFAULT_HIGH_CONFIDENCE = PROB_THRESHOLD
+DEFAULT_CHANGE_IOU = 0.5
+# Share of the new velocity in the smoothed one
+VELOCITY_SMOOTHING = 0.5
+
+
+def iou_matrix(boxes, other_boxes):
+    """
+    IoU of every box with every other box, boxes are (xmin, ymin, xmax, ymax) rows.
+    """
+    xmin = np.maximum(boxes[:, None, 0], other_boxes[None, :, 0])
+    ymin = np.maximum(boxes[:, None, 1], other_boxes[None, :, 1])
+    xmax = np.minimum(boxes[:, None, 2], other_boxes[None, :, 2])
+    ymax = np.minimum(boxes[:, None, 3], other_boxes[None, :, 3])
+    intersection = np.clip(xmax - xmin, 0, None) * np.clip(ymax - ymin, 0, None)
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    other_areas = (other_boxes[:, 2] - other_boxes[:, 0]) * (other_boxes[:, 3] - other_boxes[:, 1])
+    union = areas[:, None] + other_areas[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def match(ious, threshold):
+    """
+    Greedy matching: pairs (row, column) with the highest IoU first, every row and column is used once.
+    """
+    ious = ious.copy()
+    pairs = []
+    while ious.size:
+        row, column = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[row, column] < threshold:
+            break
+        pairs.append((int(row), int(column)))
+        ious[row, :] = 0
+        ious[:, column] = 0
+    return pairs
+
+
+class Track:
+    __slots__ = ('id', 'label', 'box', 'velocity', 'confidence', 'hits', 'misses', 'seen', 'confirmed', 'reported_box')
+
+    def __init__(self, track_id, label, box, confidence, seen):
+        self.id = track_id
+        self.label = label
+        self.box = box
+        # Pixels per second of every box coordinate
+        self.velocity = np.zeros(4)
+        self.confidence = confidence
+        self.hits = 1
+        self.misses = 0
+        self.seen = seen
+        self.confirmed = False
+        # Box of the last born or changed event
+        self.reported_box = None
+
+    def predict(self, now):
+        return self.box + self.velocity * (now - self.seen)
+
+    def update(self, box, confidence, now):
+        elapsed = now - self.seen
+        if elapsed > 0:
+            velocity = (box - self.box) / elapsed
+            self.velocity = VELOCITY_SMOOTHING * velocity + (1 - VELOCITY_SMOOTHING) * self.velocity
+        self.box = box
+        self.confidence = confidence
+        self.seen = now
+        self.hits += 1
+        self.misses = 0
+
+    def as_event(self, event):
+        return {'event': event, 'track_id': self.id, 'label': self.label}
+
+
+class TrackEvents:
+    __slots__ = ('born', 'ended', 'changed', 'active')
+
+    def __init__(self, born, ended, changed, active):
+        self.born = born
+        self.ended = ended
+        self.changed = changed
+        # Ids of confirmed tracks after the update
+        self.active = active
+
+    def __bool__(self):
+        return bool(self.born or self.ended or self.changed)
+
+    def as_list(self):
+        return (
+            [track.as_event('born') for track in self.born]
+            + [track.as_event('ended') for track in self.ended]
+            + [track.as_event('changed') for track in self.changed]
+        )
+
+
+class Tracker:
+    """
+    IoU tracker of one source in the spirit of ByteTrack.
+    Confident detections are matched to tracks first, less confident ones only continue
+    confirmed tracks and never start new ones. Boxes of tracks are moved by their velocity
+    before matching, so low FPS sources keep their tracks.
+
+    A track is born after min_hits matched frames and ends after more than max_misses
+    recognized frames in a row without it. A tentative track also survives max_misses
+    misses, so one missed frame does not restart the count, but it ends without an event.
+    Changed means the box moved away from the box of the last event (IoU below change_iou).
+
+    Infer requests complete on different threads, frames of a source may be recognized
+    by two requests at once, so update takes a lock.
+    """
+
+    def __init__(
+        self,
+        min_hits=DEFAULT_MIN_HITS,
+        max_misses=DEFAULT_MAX_MISSES,
+        iou_threshold=DEFAULT_IOU_THRESHOLD,
+        high_confidence=DEFAULT_HIGH_CONFIDENCE,
+        change_iou=DEFAULT_CHANGE_IOU,
+    ):
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.iou_threshold = iou_threshold
+        self.high_confidence = high_confidence
+        self.change_iou = change_iou
+
+        self.tracks = []
+        self.ids = count(1)
+        self.last_time = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, source_config):
+        # None if tracking is disabled for the source
+        if not source_config.get('tracking', True):
+            return None
+        return cls(
+            min_hits=source_config.get('track_min_hits', DEFAULT_MIN_HITS),
+            max_misses=source_config.get('track_max_misses', DEFAULT_MAX_MISSES),
+            high_confidence=source_config.get('track_high_confidence', DEFAULT_HIGH_CONFIDENCE),
+        )
+
+    def update(self, detections, now):
+        """
+        Match detections of a frame captured at now (monotonic) to tracks.
+        Sets track_id of matched detections, None for the rest. Returns TrackEvents.
+        """
+        with self.lock:
+            # Frames finished out of order are treated as the latest one
+            if self.last_time is not None:
+                now = max(now, self.last_time)
+            self.last_time = now
+            return self._update(detections, now)
+
+    def _update(self, detections, now):
+        boxes = np.array(
+            [[obj['xmin'], obj['ymin'], obj['xmax'], obj['ymax']] for obj in detections], np.float64
+        ).reshape(-1, 4)
+        confidences = np.array([obj['confidence'] for obj in detections]).reshape(-1)
+        labels = np.array([obj['label'] for obj in detections], dtype=object)
+        for obj in detections:
+            obj['track_id'] = None
+
+        tracks = self.tracks
+        predicted = np.array([track.predict(now) for track in tracks]).reshape(-1, 4)
+        track_labels = np.array([track.label for track in tracks], dtype=object)
+
+        high = np.flatnonzero(confidences >= self.high_confidence)
+        low = np.flatnonzero(confidences < self.high_confidence)
+
+        matched = self._associate(predicted, track_labels, range(len(tracks)), boxes, labels, high)
+        unmatched_tracks = [index for index in range(len(tracks)) if index not in matched]
+        # Second association: less confident detections continue confirmed tracks only
+        matched.update(self._associate(
+            predicted, track_labels, [index for index in unmatched_tracks if tracks[index].confirmed],
+            boxes, labels, low,
+        ))
+
+        born, ended, changed, kept = [], [], [], []
+
+        for index, track in enumerate(tracks):
+            detection = matched.get(index)
+            if detection is None:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    # Tentative track is dropped without an event
+                    if track.confirmed:
+                        ended.append(track)
+                    continue
+            else:
+                track.update(boxes[detection], float(confidences[detection]), now)
+                detections[detection]['track_id'] = track.id
+                self._on_matched(track, born, changed)
+            kept.append(track)
+
+        used = set(matched.values())
+        for detection in high:
+            if detection in used:
+                continue
+            track = Track(next(self.ids), labels[detection], boxes[detection], float(confidences[detection]), now)
+            detections[detection]['track_id'] = track.id
+            self._on_matched(track, born, changed)
+            kept.append(track)
+
+        self.tracks = kept
+        return TrackEvents(born, ended, changed, sorted(track.id for track in kept if track.confirmed))
+
+    def _associate(self, predicted, track_labels, track_indexes, boxes, labels, detection_indexes):
+        # {track index: detection index} of the given tracks and detections, labels must be equal
+        track_indexes = list(track_indexes)
+        detection_indexes = list(detection_indexes)
+        if not track_indexes or not detection_indexes:
+            return {}
+
+        ious = iou_matrix(predicted[track_indexes], boxes[detection_indexes])
+        ious[track_labels[track_indexes][:, None] != labels[detection_indexes][None, :]] = 0
+        return {
+            track_indexes[row]: detection_indexes[column]
+            for row, column in match(ious, self.iou_threshold)
+        }
+
+    def _on_matched(self, track, born, changed):
+        if not track.confirmed:
+            if track.hits >= self.min_hits:
+                track.confirmed = True
+                track.reported_box = track.box
+                born.append(track)
+            return
+
+        if iou_matrix(track.reported_box[None], track.box[None])[0, 0] < self.change_iou:
+            track.reported_box = track.box
+            changed.append(track)
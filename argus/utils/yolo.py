@@ -0,0 +1,122 @@
+import cv2
+import numpy as np
+
+
+# Detections below are dropped by the decoder
+PROB_THRESHOLD = 0.65
+NMS_THRESHOLD = 0.45
+NMS_ETA = 0.5
+FRAGMENT_THRESHOLD = 0.8
+
+
+def decode_predictions(output, prob_threshold):
+    """
+    Vectorized decoder for the YOLO output tensor of shape (1, 4 + classes, anchors).
+    Returns boxes as (x, y, w, h) array, scores and class ids of anchors above prob_threshold.
+    """
+    predictions = output[0]
+    class_scores = predictions[4:]
+
+    # Reduce over classes along the contiguous axis, then keep only confident anchors
+    max_scores = class_scores.max(axis=0)
+    indexes = np.flatnonzero(max_scores >= prob_threshold)
+
+    class_ids = class_scores[:, indexes].argmax(axis=0)
+    scores = max_scores[indexes]
+
+    cx, cy, w, h = predictions[:4, indexes]
+    boxes = np.stack((cx - 0.5 * w, cy - 0.5 * h, w, h), axis=1)
+
+    return boxes, scores, class_ids
+
+
+def decode_predictions_loop(output, prob_threshold):
+    """
+    Reference decoder: python loop with cv2.minMaxLoc for every anchor.
+    Kept to compare with decode_predictions in tests and benchmarks.
+    """
+    outputs = np.array([cv2.transpose(output[0])])
+    rows = outputs.shape[1]
+
+    boxes = []
+    scores = []
+    class_ids = []
+
+    for i in range(rows):
+        classes_scores = outputs[0][i][4:]
+        (minScore, maxScore, minClassLoc, (x, maxClassIndex)) = cv2.minMaxLoc(classes_scores)
+        if maxScore >= prob_threshold:
+            box = [
+                outputs[0][i][0] - (0.5 * outputs[0][i][2]),
+                outputs[0][i][1] - (0.5 * outputs[0][i][3]),
+                outputs[0][i][2],
+                outputs[0][i][3]
+            ]
+            boxes.append(box)
+            scores.append(maxScore)
+            class_ids.append(maxClassIndex)
+
+    return boxes, scores, class_ids
+
+
+def batched_nms(boxes, scores, class_ids, prob_threshold, nms_threshold=NMS_THRESHOLD):
+    """
+    Per-class NMS in one call: boxes of different classes never suppress each other.
+    Returns indexes of kept boxes.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    kept = cv2.dnn.NMSBoxesBatched(
+        boxes,
+        scores,
+        class_ids.astype(np.int32),
+        prob_threshold,
+        nms_threshold,
+        eta=NMS_ETA,
+    )
+    return np.asarray(kept, dtype=np.int64).reshape(-1)
+
+
+def suppress_fragments(boxes, scores, class_ids, threshold=FRAGMENT_THRESHOLD):
+    """
+    Cross-tile cleanup after NMS. An object cut by a tile border is also detected as its part,
+    IoU of the part and the whole object is low, so NMS keeps both. A box is dropped if
+    a higher scored box of the same class covers threshold of the smaller of the two.
+    Returns indexes of kept boxes.
+    """
+    xmin, ymin = boxes[:, 0], boxes[:, 1]
+    xmax, ymax = xmin + boxes[:, 2], ymin + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    kept = []
+    for index in np.argsort(-scores, kind='stable'):
+        if kept:
+            others = np.asarray(kept)
+            width = np.minimum(xmax[index], xmax[others]) - np.maximum(xmin[index], xmin[others])
+            height = np.minimum(ymax[index], ymax[others]) - np.maximum(ymin[index], ymin[others])
+            intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+            covered = intersection >= threshold * np.minimum(areas[index], areas[others])
+            if np.any(covered & (class_ids[others] == class_ids[index])):
+                continue
+        kept.append(index)
+    return np.asarray(kept, dtype=np.int64)
+
+
+def letterbox(frame, dst):
+    """
+    Resize frame keeping aspect ratio straight into the top-left corner of dst (h x w x 3 uint8)
+    and zero the padding. Returns scale to map model coordinates back to the frame.
+    """
+    height, width, _ = frame.shape
+    dst_height, dst_width, _ = dst.shape
+
+    scale = max(height / dst_height, width / dst_width)
+    resized_height = min(dst_height, round(height / scale))
+    resized_width = min(dst_width, round(width / scale))
+
+    cv2.resize(frame, (resized_width, resized_height), dst=dst[:resized_height, :resized_width])
+    dst[resized_height:] = 0
+    dst[:resized_height, resized_width:] = 0
+
+    return scale
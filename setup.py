@@ -11,5 +11,10 @@ setup(
     package_dir={'': '.'},
     include_package_data=True,
     zip_safe=False,
-    requires=[]
+    requires=[],
+    entry_points={
+        'console_scripts': [
+            'argus=argus.cli:main',
+        ],
+    },
 )
\ No newline at end of file
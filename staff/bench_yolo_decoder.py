@@ -0,0 +1,102 @@
+"""
+Microbenchmark of YOLO output decoders: python loop vs numpy vectorized.
+
+Record output tensors from a model (needs OpenVINO and model weights):
+    python staff/bench_yolo_decoder.py --record /app/data/yolo11n_output.npy --image /app/res/test.jpg
+
+Compare decoders on recorded tensors (synthetic tensor is used if none given):
+    python staff/bench_yolo_decoder.py /app/data/yolo11n_output.npy
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from argus.utils.yolo import (  # noqa: E402
+    PROB_THRESHOLD,
+    batched_nms,
+    decode_predictions,
+    decode_predictions_loop,
+)
+
+MODELS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'models')
+
+
+def record(path, image_path, model_name):
+    import cv2
+    from openvino import Core
+
+    core = Core()
+    net = core.compile_model(os.path.join(MODELS_PATH, f'{model_name}.xml'), device_name='CPU')
+    _, _, h, w = net.inputs[0].shape
+
+    frame = cv2.imread(image_path)
+    height, width, _ = frame.shape
+    length = max((height, width))
+    image = np.zeros((length, length, 3), np.uint8)
+    image[0:height, 0:width] = frame
+
+    blob = cv2.dnn.blobFromImage(image, scalefactor=1 / 255, size=(w, h), swapRB=True)
+    output = net.create_infer_request().infer(blob)[net.outputs[0]]
+    np.save(path, output)
+    print(f'Recorded output {output.shape} to {path}')
+
+
+def synthetic_output(classes=80, anchors=8400, objects=20, seed=0):
+    rng = np.random.default_rng(seed)
+    output = np.zeros((1, 4 + classes, anchors), np.float32)
+    output[0, 0:2] = rng.uniform(0, 640, (2, anchors))
+    output[0, 2:4] = rng.uniform(5, 200, (2, anchors))
+    output[0, 4:] = rng.uniform(0, 0.3, (classes, anchors))
+    # A few objects, each reported by a cluster of neighbour anchors
+    for anchor in rng.choice(anchors - 10, objects, replace=False):
+        output[0, 4 + rng.integers(classes), anchor:anchor + 10] = rng.uniform(0.65, 0.95, 10)
+    return output
+
+
+def bench(name, output, number):
+    loop_time = timeit.timeit(lambda: decode_predictions_loop(output, PROB_THRESHOLD), number=number) / number
+    vector_time = timeit.timeit(lambda: decode_predictions(output, PROB_THRESHOLD), number=number) / number
+
+    boxes, scores, class_ids = decode_predictions(output, PROB_THRESHOLD)
+    nms_time = timeit.timeit(
+        lambda: batched_nms(boxes, scores, class_ids, PROB_THRESHOLD), number=number
+    ) / number
+
+    loop_boxes, _, loop_class_ids = decode_predictions_loop(output, PROB_THRESHOLD)
+    same = np.allclose(np.array(loop_boxes).reshape(-1, 4), boxes) and list(loop_class_ids) == class_ids.tolist()
+
+    print(
+        f'{name}: shape {output.shape}, candidates {len(scores)}, same result: {same}\n'
+        f'  loop decoder:       {loop_time * 1000:8.3f} ms\n'
+        f'  vectorized decoder: {vector_time * 1000:8.3f} ms ({loop_time / vector_time:.0f}x)\n'
+        f'  batched nms:        {nms_time * 1000:8.3f} ms'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare YOLO output decoders')
+    parser.add_argument('tensors', nargs='*', help='Recorded output tensors (.npy)')
+    parser.add_argument('--number', type=int, default=20, help='Runs per decoder')
+    parser.add_argument('--record', help='Run model on --image and save output tensor to this path')
+    parser.add_argument('--image', default=os.path.join(MODELS_PATH, '..', 'res', 'test.jpg'))
+    parser.add_argument('--model', default='yolo11n')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.image, args.model)
+        return
+
+    if not args.tensors:
+        bench('synthetic', synthetic_output(), args.number)
+
+    for path in args.tensors:
+        bench(path, np.load(path), args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import os
+import unittest
+
+from argus.application import bench
+
+
+def parse_args(*argv):
+    parser = argparse.ArgumentParser()
+    bench.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+class BenchConfigTest(unittest.TestCase):
+    def test_sources_replay_video_as_fast_as_possible(self):
+        args = parse_args('--sources', '3', '--model', 'yolov9s', '--num-requests', '2')
+
+        config = bench.build_config(args, '/tmp/bench')
+
+        self.assertEqual(list(config['sources']), ['bench-0', 'bench-1', 'bench-2'])
+        self.assertEqual(config['sources']['bench-1']['source'], bench.DEFAULT_VIDEO)
+        self.assertEqual(config['sources']['bench-1']['grab_delay_sec'], 0)
+        self.assertEqual(config['sources']['bench-1']['stills_dir'], '/tmp/bench/Stills/bench-1')
+        self.assertEqual(config['recognizer']['model'], 'yolov9s')
+        self.assertEqual(config['recognizer']['num_requests'], 2)
+        self.assertEqual(config['app']['trace_path'], '/tmp/bench/traces.jsonl')
+        self.assertNotIn('telegram_bot', config)
+
+    @unittest.skipUnless(os.path.exists(bench.DEFAULT_VIDEO), 'demo video is not available')
+    def test_realtime_mode_uses_video_fps(self):
+        config = bench.build_config(parse_args('--mode', 'realtime'), '/tmp/bench')
+
+        delay = config['sources']['bench-0']['grab_delay_sec']
+        self.assertGreater(delay, 0)
+        self.assertLess(delay, 1)
+
+    def test_tiled_sources(self):
+        args = parse_args('--tiles', '3x2', '--tile-overlap', '0.25')
+
+        config = bench.build_config(args, '/tmp/bench')
+
+        self.assertEqual(config['sources']['bench-0']['tiles'], [3, 2])
+        self.assertEqual(config['sources']['bench-0']['tile_overlap'], 0.25)
+        self.assertEqual(bench.tile_count(args), 7)
+
+    def test_report(self):
+        args = parse_args('--sources', '2')
+        warm = {'time': 10, 'cpu': 1, 'captured': 100, 'recognized': 50, 'motion_skipped': 0}
+        end = {'time': 20, 'cpu': 6, 'captured': 300, 'recognized': 250, 'motion_skipped': 0}
+        traces = {1: ('bench-0', {'captured': 0, 'inferred': 30, 'notified_telegram': 100})}
+
+        result = bench.report(args, warm, end, traces, bench.StubNotifier())
+
+        self.assertEqual(
+            result['fps'], {'recognized': 20, 'recognized_per_source': 10, 'inferred_inputs': 20, 'captured': 20}
+        )
+        self.assertEqual(result['cpu_percent'], 50)
+        self.assertEqual(result['stages_ms']['inferred']['p50'], 30)
+        self.assertEqual(result['alert_delay_ms']['p50'], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
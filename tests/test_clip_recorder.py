@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import cv2
+import numpy as np
+
+from argus.domain.source_profile import SourceProfile
+from argus.utils.clip_recorder import ClipBuffer, ClipRecorder
+
+
+def make_profile(stills_dir='/tmp/Stills'):
+    return SourceProfile.from_config(
+        'first-cam', {'stills_dir': stills_dir, 'host_stills_uri': 'http://localhost/Stills/first'}
+    )
+
+
+def make_frame(value, height=360, width=640):
+    return np.full((height, width, 3), value, np.uint8)
+
+
+class ClipBufferTest(unittest.TestCase):
+    def test_frames_are_downscaled_and_kept_for_pre_sec(self):
+        buffer = ClipBuffer(make_profile(), pre_sec=2, fps=1, width=320)
+
+        for second in range(5):
+            buffer.add(make_frame(second * 10), second)
+
+        self.assertEqual([time for time, _ in buffer.frames], [2, 3, 4])
+        decoded = cv2.imdecode(np.frombuffer(buffer.frames[0][1], np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(decoded.shape, (180, 320, 3))
+
+    def test_memory_is_bounded(self):
+        buffer = ClipBuffer(make_profile(), pre_sec=100, fps=1, max_bytes=1)
+        noise = np.random.default_rng(0).integers(0, 255, (360, 640, 3), np.uint8)
+
+        for second in range(5):
+            buffer.add(noise, second)
+
+        self.assertEqual(len(buffer.frames), 0)
+        self.assertEqual(buffer.size, 0)
+
+    def test_clip_has_pre_and_post_roll(self):
+        buffer = ClipBuffer(make_profile(), pre_sec=2, post_sec=3, fps=1)
+        for second in range(4):
+            self.assertIsNone(buffer.add(make_frame(0), second))
+
+        buffer.trigger(3.5)
+        self.assertIsNone(buffer.add(make_frame(0), 4))
+        self.assertIsNone(buffer.add(make_frame(0), 5))
+        clip = buffer.add(make_frame(0), 6.5)
+
+        self.assertEqual([time for time, _ in clip.frames], [1, 2, 3, 4, 5, 6.5])
+        self.assertIsNone(buffer.clip)
+
+    def test_trigger_extends_post_roll_up_to_max_sec(self):
+        buffer = ClipBuffer(make_profile(), post_sec=3, max_sec=5)
+
+        buffer.trigger(0)
+        buffer.trigger(2)
+        self.assertEqual(buffer.clip.end_time, 5)
+        buffer.trigger(4)
+        self.assertEqual(buffer.clip.end_time, 5)
+
+    def test_clip_of_stopped_source_expires(self):
+        buffer = ClipBuffer(make_profile(), post_sec=3, fps=1)
+        buffer.add(make_frame(0), 0)
+        buffer.trigger(0)
+
+        self.assertIsNone(buffer.expire(3.5))
+        self.assertEqual(len(buffer.expire(4).frames), 1)
+
+
+class ClipRecorderTest(unittest.TestCase):
+    def test_clip_is_written_as_mp4(self):
+        with tempfile.TemporaryDirectory() as stills_dir:
+            buffer = ClipBuffer(make_profile(stills_dir), pre_sec=10, post_sec=1, fps=1)
+            on_written = Mock()
+            recorder = ClipRecorder({'first-cam': buffer}, on_written=on_written)
+
+            for second in range(5):
+                buffer.add(make_frame(second * 50), second)
+            buffer.trigger(4)
+            recorder.submit(buffer.add(make_frame(250), 5))
+            recorder.join()
+
+            source, path, url = on_written.call_args.args
+            self.assertEqual(source, 'first-cam')
+            self.assertEqual(os.path.dirname(path), os.path.join(stills_dir, 'clips'))
+            self.assertEqual(url, f'http://localhost/Stills/first/clips/{os.path.basename(path)}')
+
+            capture = cv2.VideoCapture(path)
+            self.assertEqual(capture.get(cv2.CAP_PROP_FRAME_COUNT), 6)
+            self.assertEqual(capture.get(cv2.CAP_PROP_FPS), 1)
+            capture.release()
+
+    def test_sources_without_clips_are_ignored(self):
+        recorder = ClipRecorder({})
+
+        recorder.add('first-cam', make_frame(0))
+        recorder.trigger('first-cam')
+
+        self.assertFalse(recorder.wants_frame('first-cam'))
+        self.assertIsNone(recorder.writer)
+
+
+if __name__ == '__main__':
+    unittest.main()
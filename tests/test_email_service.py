@@ -1,8 +1,23 @@
 import asyncio
+import smtplib
 import unittest
-from unittest.mock import patch
+from time import monotonic, sleep
+from unittest.mock import Mock, patch
 
-from argus.services.email import EmailService
+from argus.services.email import DIGEST_RETRIES, EmailService, SMTPConnectionPool
+from argus.utils.metrics import notifications_dropped
+
+
+def make_service(**kwargs):
+    return EmailService(
+        smtp_host='smtp.example.com',
+        smtp_port=587,
+        username='user@example.com',
+        password='secret',
+        from_addr='argus@example.com',
+        to_addrs=['alerts@example.com'],
+        **kwargs
+    )
 
 
 class EmailServiceTest(unittest.TestCase):
@@ -20,7 +35,7 @@ class EmailServiceTest(unittest.TestCase):
         )
 
         with patch('argus.services.email.smtplib.SMTP') as smtp_class:
-            smtp = smtp_class.return_value.__enter__.return_value
+            smtp = smtp_class.return_value
 
             asyncio.run(service.send_message('Objects detected: http://example.com/frame.jpg'))
 
@@ -50,7 +65,7 @@ class EmailServiceTest(unittest.TestCase):
         )
 
         with patch('argus.services.email.smtplib.SMTP_SSL') as smtp_ssl_class:
-            smtp = smtp_ssl_class.return_value.__enter__.return_value
+            smtp = smtp_ssl_class.return_value
 
             asyncio.run(service.send_message('Objects detected'))
 
@@ -77,6 +92,137 @@ class EmailServiceTest(unittest.TestCase):
         self.assertEqual(attachments[0].get_content_type(), 'image/jpeg')
         self.assertEqual(attachments[0].get_content(), b'jpeg bytes')
 
+    def test_connection_is_reused(self):
+        service = make_service()
+
+        with patch('argus.services.email.smtplib.SMTP') as smtp_class:
+            smtp = smtp_class.return_value
+
+            asyncio.run(service.send_message('first'))
+            asyncio.run(service.send_message('second'))
+
+        smtp_class.assert_called_once_with('smtp.example.com', 587)
+        smtp.login.assert_called_once_with('user@example.com', 'secret')
+        self.assertEqual(smtp.send_message.call_count, 2)
+
+    def test_digest_groups_notifications_in_one_email(self):
+        service = make_service(digest_window_sec=0.05, digest_max_attachments=1)
+
+        async def notify():
+            await service.send_frame(b'first jpeg', 'Object detected.')
+            await service.send_message('Objects detected: http://example.com/frame.jpg')
+            await service.send_frame(b'second jpeg', 'Object detected.')
+            await service.digest_task
+
+        with patch('argus.services.email.smtplib.SMTP') as smtp_class:
+            smtp = smtp_class.return_value
+            asyncio.run(notify())
+
+        smtp.send_message.assert_called_once()
+        message = smtp.send_message.call_args.args[0]
+        body = message.get_body(preferencelist=('plain',)).get_content()
+        attachments = list(message.iter_attachments())
+
+        self.assertEqual(len(body.strip().splitlines()), 3)
+        self.assertIn('http://example.com/frame.jpg', body)
+        self.assertEqual([a.get_content() for a in attachments], [b'first jpeg'])
+        self.assertEqual(service.digest, [])
+
+    def test_failed_digest_is_retried_and_counted_as_dropped(self):
+        service = make_service(digest_window_sec=0.01)
+
+        async def notify():
+            await service.send_message('first')
+            await service.send_message('second')
+            await service.digest_task
+
+        dropped = notifications_dropped.labels('email', 'digest_failed')
+        before = dropped.value()
+        with patch('argus.services.email.smtplib.SMTP') as smtp_class, \
+                patch('argus.services.email.DIGEST_BACKOFF_SEC', 0):
+            smtp_class.return_value.send_message.side_effect = smtplib.SMTPDataError(451, b'try later')
+            asyncio.run(notify())
+
+        self.assertEqual(smtp_class.return_value.send_message.call_count, DIGEST_RETRIES + 1)
+        self.assertEqual(dropped.value() - before, 2)
+
+
+class SMTPConnectionPoolTest(unittest.TestCase):
+    def test_idle_connection_is_checked_with_noop(self):
+        dead, fresh = Mock(), Mock()
+        dead.noop.side_effect = smtplib.SMTPServerDisconnected()
+        connect = Mock(side_effect=[dead, fresh])
+        pool = SMTPConnectionPool(connect, keepalive_sec=0)
+
+        pool.send_message('first', 'argus@example.com', ['alerts@example.com'])
+        pool.send_message('second', 'argus@example.com', ['alerts@example.com'])
+
+        self.assertEqual(connect.call_count, 2)
+        dead.noop.assert_called_once_with()
+        fresh.send_message.assert_called_once_with(
+            'second', from_addr='argus@example.com', to_addrs=['alerts@example.com']
+        )
+
+    def test_message_is_resent_after_disconnect(self):
+        dropped, fresh = Mock(), Mock()
+        dropped.send_message.side_effect = smtplib.SMTPServerDisconnected()
+        pool = SMTPConnectionPool(Mock(side_effect=[dropped, fresh]))
+
+        pool.send_message('message', 'argus@example.com', ['alerts@example.com'])
+
+        dropped.quit.assert_called_once_with()
+        fresh.send_message.assert_called_once()
+
+    def test_failed_resend_closes_new_connection(self):
+        dropped, fresh = Mock(), Mock()
+        dropped.send_message.side_effect = smtplib.SMTPServerDisconnected()
+        fresh.send_message.side_effect = smtplib.SMTPServerDisconnected()
+        pool = SMTPConnectionPool(Mock(side_effect=[dropped, fresh]))
+
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            pool.send_message('message', 'argus@example.com', ['alerts@example.com'])
+
+        fresh.quit.assert_called_once_with()
+        self.assertTrue(pool.idle.empty())
+
+    def test_idle_connection_gets_noop_without_send(self):
+        smtp = Mock()
+        smtp.noop.return_value = (250, b'OK')
+        pool = SMTPConnectionPool(Mock(return_value=smtp), keepalive_sec=0.05)
+
+        pool.send_message('message', 'argus@example.com', ['alerts@example.com'])
+        deadline = monotonic() + 2
+        while smtp.noop.call_count < 2 and monotonic() < deadline:
+            sleep(0.01)
+
+        self.assertGreaterEqual(smtp.noop.call_count, 2)
+        smtp.send_message.assert_called_once()
+        self.assertEqual(pool.idle.qsize(), 1)
+
+    def test_dropped_idle_connection_is_closed_by_keepalive(self):
+        smtp = Mock()
+        smtp.noop.side_effect = smtplib.SMTPServerDisconnected()
+        # No keepalive thread with 0, the check is run by the test
+        pool = SMTPConnectionPool(Mock(return_value=smtp), keepalive_sec=0)
+        pool.send_message('message', 'argus@example.com', ['alerts@example.com'])
+
+        pool.ping_idle()
+
+        smtp.quit.assert_called_once_with()
+        self.assertTrue(pool.idle.empty())
+
+    def test_rejected_message_keeps_connection(self):
+        smtp = Mock()
+        smtp.send_message.side_effect = [smtplib.SMTPRecipientsRefused({}), None]
+        connect = Mock(return_value=smtp)
+        pool = SMTPConnectionPool(connect)
+
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            pool.send_message('first', 'argus@example.com', ['alerts@example.com'])
+        pool.send_message('second', 'argus@example.com', ['alerts@example.com'])
+
+        connect.assert_called_once_with()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+
+import numpy as np
+
+from argus.domain.queue_item import QueueItem
+from argus.domain.source_profile import SourceProfile
+from argus.utils import event_store
+from argus.utils.event_store import EventStore, parse_time, query
+from argus.utils.metrics import Registry, start_metrics_server
+
+
+def make_item(source, path):
+    item = QueueItem(np.zeros((48, 64, 3), np.uint8), SourceProfile.from_config(source, {'stills_dir': '/tmp/Stills'}))
+    item.path = path
+    return item
+
+
+def detection(label, confidence=0.9, track_id=None):
+    return {
+        'label': label, 'confidence': confidence, 'xmin': 1, 'ymin': 2, 'xmax': 30, 'ymax': 40, 'track_id': track_id,
+    }
+
+
+class EventStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'events.db')
+        self.store = EventStore(self.path, batch_size=2, flush_sec=0.05)
+
+        self.store.record(
+            make_item('first-cam', '/tmp/Stills/1.jpg'), [detection('person', track_id=3), detection('car', 0.6)]
+        )
+        self.store.record(make_item('second-cam', '/tmp/Stills/2.jpg'), [detection('person', 0.8)])
+        self.store.join()
+
+    def test_detections_are_stored_and_filtered(self):
+        events = query(self.path)
+        self.assertEqual(len(events), 3)
+        # Latest first
+        self.assertEqual(events[0]['source'], 'second-cam')
+
+        events = query(self.path, source='first-cam', label='person')
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['track_id'], 3)
+        self.assertEqual(events[0]['path'], '/tmp/Stills/1.jpg')
+        self.assertEqual((events[0]['xmin'], events[0]['ymax']), (1, 40))
+
+        self.assertEqual(len(query(self.path, label='person', min_confidence=0.85)), 1)
+        self.assertEqual(query(self.path, since=parse_time('1h'), limit=1)[0]['source'], 'second-cam')
+        self.assertEqual(query(self.path, until=parse_time('1h')), [])
+
+    def test_queries_use_indexes(self):
+        connection = event_store.connect(self.path, read_only=True)
+        self.addCleanup(connection.close)
+        for column, index in (('source', 'detections_source_ts'), ('label', 'detections_label_ts')):
+            plan = connection.execute(
+                f'EXPLAIN QUERY PLAN SELECT * FROM detections WHERE {column} = ? AND ts >= ? ORDER BY ts DESC LIMIT 10',
+                ('x', 0),
+            ).fetchall()
+            self.assertIn(index, str(plan))
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_http_endpoint(self):
+        routes = {'/events': event_store.http_handler(self.path)}
+        server = start_metrics_server('127.0.0.1', 0, Registry(), routes=routes)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        with urllib.request.urlopen(f'{url}/events?label=car') as response:
+            self.assertEqual(response.headers['Content-Type'], 'application/json')
+            events = json.loads(response.read())
+        self.assertEqual([event['label'] for event in events], ['car'])
+
+        for bad_query in ('since=yesterday', 'limit=-1', 'limit=0', 'limit=many'):
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(f'{url}/events?{bad_query}')
+            self.assertEqual(error.exception.code, 400)
+
+    def test_negative_limit_is_not_unlimited(self):
+        self.assertEqual(len(query(self.path, limit=-1)), 1)
+
+    def test_database_error_is_http_500(self):
+        handle = event_store.http_handler(os.path.join(os.path.dirname(self.path), 'missing.db'))
+
+        with self.assertLogs('json', 'ERROR'):
+            status, _, body = handle('')
+
+        self.assertEqual(status, 500)
+        self.assertIn('error', json.loads(body))
+
+    def test_disabled_by_config(self):
+        self.assertIsNone(EventStore.from_config({}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import threading
+import unittest
+from time import monotonic
+from unittest.mock import patch
+
+from argus.utils import frame_scheduler as frame_scheduler_module
+from argus.utils.frame_scheduler import FrameScheduler
+
+
+class FrameSchedulerTest(unittest.TestCase):
+    def test_newer_frame_replaces_pending_one(self):
+        scheduler = FrameScheduler()
+        scheduler.add_source('first-cam')
+
+        scheduler.put('first-cam', 'frame-1')
+        scheduler.put('first-cam', 'frame-2')
+
+        self.assertEqual(scheduler.get(timeout=0), 'frame-2')
+        self.assertIsNone(scheduler.get(timeout=0))
+        self.assertEqual(scheduler.sources['first-cam'].dropped, 1)
+
+    def test_sources_served_by_priority(self):
+        scheduler = FrameScheduler()
+        scheduler.add_source('first-cam', priority=1)
+        scheduler.add_source('second-cam', priority=3)
+
+        served = []
+        for _ in range(8):
+            scheduler.put('first-cam', 'first-cam')
+            scheduler.put('second-cam', 'second-cam')
+            served.append(scheduler.get(timeout=0))
+
+        self.assertEqual(served.count('second-cam'), 6)
+        self.assertEqual(served.count('first-cam'), 2)
+
+    def test_max_fps_limits_source(self):
+        scheduler = FrameScheduler()
+        scheduler.add_source('first-cam', max_fps=2)
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=100.0):
+            scheduler.put('first-cam', 'frame-1')
+            self.assertEqual(scheduler.get(timeout=0), 'frame-1')
+            scheduler.put('first-cam', 'frame-2')
+            self.assertIsNone(scheduler.get(timeout=0))
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=100.5):
+            self.assertEqual(scheduler.get(timeout=0), 'frame-2')
+
+    def test_skipped_frame_uses_max_fps(self):
+        scheduler = FrameScheduler()
+        scheduler.add_source('first-cam', max_fps=2)
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=100.0):
+            scheduler.skip('first-cam')
+            self.assertFalse(scheduler.wants_frame('first-cam'))
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=100.5):
+            self.assertTrue(scheduler.wants_frame('first-cam'))
+
+    def test_skipped_frames_do_not_hold_back_pending_frame(self):
+        # Continuously captured source: static frames are skipped at 25 FPS
+        # while the heartbeat frame waits for the max_fps deadline
+        scheduler = FrameScheduler()
+        scheduler.add_source('first-cam', max_fps=5)
+        scheduler.put('first-cam', 'frame-1')
+        self.assertEqual(scheduler.get(timeout=0), 'frame-1')
+        scheduler.put('first-cam', 'heartbeat')
+
+        stop = threading.Event()
+
+        def skip_frames():
+            while not stop.wait(0.04):
+                scheduler.skip('first-cam')
+
+        skipper = threading.Thread(target=skip_frames)
+        skipper.start()
+        try:
+            started = monotonic()
+            self.assertEqual(scheduler.get(timeout=3), 'heartbeat')
+            self.assertLess(monotonic() - started, 0.3)
+        finally:
+            stop.set()
+            skipper.join()
+
+    def test_quiet_source_is_recognized_at_idle_fps(self):
+        scheduler = FrameScheduler(active_hold_sec=10)
+        scheduler.add_source('first-cam', idle_fps=1)
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=100.0):
+            scheduler.put('first-cam', 'frame-1')
+            self.assertEqual(scheduler.get(timeout=0), 'frame-1')
+            self.assertFalse(scheduler.wants_frame('first-cam'))
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=100.5):
+            # Detection on the frame: full rate right away and for active_hold_sec
+            scheduler.activate('first-cam')
+            self.assertTrue(scheduler.wants_frame('first-cam'))
+            scheduler.put('first-cam', 'frame-2')
+            self.assertEqual(scheduler.get(timeout=0), 'frame-2')
+            self.assertTrue(scheduler.wants_frame('first-cam'))
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=111.0):
+            self.assertFalse(scheduler.is_active('first-cam'))
+            scheduler.put('first-cam', 'frame-3')
+            self.assertEqual(scheduler.get(timeout=0), 'frame-3')
+            self.assertFalse(scheduler.wants_frame('first-cam'))
+
+    def test_neighbours_are_activated(self):
+        scheduler = FrameScheduler()
+        scheduler.add_source('gate-cam', neighbours=['yard-cam'])
+        scheduler.add_source('yard-cam', idle_fps=1)
+        scheduler.add_source('street-cam', idle_fps=1)
+
+        scheduler.activate('gate-cam')
+
+        self.assertTrue(scheduler.is_active('yard-cam'))
+        self.assertFalse(scheduler.is_active('street-cam'))
+
+    def test_active_sources_get_larger_share(self):
+        scheduler = FrameScheduler(active_weight=3)
+        scheduler.add_source('first-cam')
+        scheduler.add_source('second-cam')
+        scheduler.activate('second-cam')
+
+        served = []
+        for _ in range(8):
+            scheduler.put('first-cam', 'first-cam')
+            scheduler.put('second-cam', 'second-cam')
+            served.append(scheduler.get(timeout=0))
+
+        self.assertEqual(served.count('second-cam'), 6)
+
+    def test_stale_frame_is_dropped(self):
+        scheduler = FrameScheduler(max_frame_age=1)
+        scheduler.add_source('first-cam')
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=100.0):
+            scheduler.put('first-cam', 'frame-1')
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=102.0):
+            self.assertIsNone(scheduler.get(timeout=0))
+
+        self.assertEqual(scheduler.sources['first-cam'].dropped, 1)
+
+    def test_wants_frame_only_when_it_would_be_recognized(self):
+        scheduler = FrameScheduler(max_frame_age=1)
+        scheduler.add_source('first-cam', max_fps=2)
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=100.0):
+            self.assertTrue(scheduler.wants_frame('first-cam'))
+            scheduler.put('first-cam', 'frame-1')
+            self.assertFalse(scheduler.wants_frame('first-cam'))
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=101.5):
+            # Pending frame is stale
+            self.assertTrue(scheduler.wants_frame('first-cam'))
+            scheduler.put('first-cam', 'frame-2')
+            self.assertEqual(scheduler.get(timeout=0), 'frame-2')
+            # Rate limited after dispatch
+            self.assertFalse(scheduler.wants_frame('first-cam'))
+
+        with patch.object(frame_scheduler_module, 'monotonic', return_value=102.0):
+            self.assertTrue(scheduler.wants_frame('first-cam'))
+
+    def test_get_wakes_up_on_new_frame(self):
+        scheduler = FrameScheduler()
+        scheduler.add_source('first-cam')
+
+        timer = threading.Timer(0.05, scheduler.put, args=('first-cam', 'frame-1'))
+        timer.start()
+
+        self.assertEqual(scheduler.get(timeout=5), 'frame-1')
+        timer.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
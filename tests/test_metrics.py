@@ -0,0 +1,76 @@
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from argus.utils.metrics import Counter, Gauge, Histogram, Registry, start_metrics_server
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_sums_thread_shards(self):
+        counter = Counter('frames_total', 'Frames', ['source'], registry=self.registry)
+        child = counter.labels('first-cam')
+
+        def count():
+            for _ in range(10000):
+                child.inc()
+
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(child.value(), 40000)
+        self.assertEqual(len(child.shards.shards), 4)
+        self.assertIn('frames_total{source="first-cam"} 40000', self.registry.expose())
+
+    def test_histogram_exposition(self):
+        histogram = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1), registry=self.registry)
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+
+        lines = self.registry.expose().splitlines()
+
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{le="1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_sum 5.55', lines)
+        self.assertIn('latency_seconds_count 3', lines)
+
+    def test_gauge_function_is_called_on_scrape(self):
+        items = []
+        Gauge('queue_depth', 'Depth', ['queue'], registry=self.registry).labels('stills').set_function(
+            lambda: len(items)
+        )
+        items.extend([1, 2])
+
+        self.assertIn('queue_depth{queue="stills"} 2', self.registry.expose())
+
+    def test_duplicate_metric(self):
+        Counter('frames_total', 'Frames', registry=self.registry)
+        with self.assertRaises(ValueError):
+            Counter('frames_total', 'Frames', registry=self.registry)
+
+    def test_metrics_endpoint(self):
+        Counter('frames_total', 'Frames', registry=self.registry).inc(3)
+        server = start_metrics_server('127.0.0.1', 0, self.registry)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        with urllib.request.urlopen(f'{url}/metrics') as response:
+            body = response.read().decode()
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        self.assertIn('frames_total 3', body)
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'{url}/other')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from argus.utils import motion_gate
+from argus.utils.motion_gate import HEARTBEAT, MOTION, SKIPPED, MotionGate
+
+
+def make_frame(value=100, height=360, width=640):
+    return np.full((height, width, 3), value, np.uint8)
+
+
+class MotionGateTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        patcher = patch.object(motion_gate, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_static_frames_are_skipped(self):
+        gate = MotionGate(threshold=0.01, heartbeat_sec=5)
+
+        self.assertEqual(gate.check(make_frame()), MOTION)
+        self.now = 1
+        self.assertEqual(gate.check(make_frame()), SKIPPED)
+        self.now = 2
+        # Sensor noise is below the pixel threshold
+        noise = np.random.default_rng(0).integers(-5, 6, (360, 640, 3))
+        self.assertEqual(gate.check((make_frame() + noise).astype(np.uint8)), SKIPPED)
+
+    def test_moving_object_passes(self):
+        gate = MotionGate(threshold=0.01)
+        gate.check(make_frame())
+
+        frame = make_frame()
+        frame[100:200, 300:400] = 255
+        self.now = 1
+
+        self.assertEqual(gate.check(frame), MOTION)
+
+    def test_small_change_is_below_threshold(self):
+        gate = MotionGate(threshold=0.05)
+        gate.check(make_frame())
+
+        frame = make_frame()
+        frame[100:120, 300:320] = 255
+        self.now = 1
+
+        self.assertEqual(gate.check(frame), SKIPPED)
+
+    def test_heartbeat(self):
+        gate = MotionGate(threshold=0.01, heartbeat_sec=5)
+        gate.check(make_frame())
+
+        self.now = 4.9
+        self.assertEqual(gate.check(make_frame()), SKIPPED)
+        self.now = 5
+        self.assertEqual(gate.check(make_frame()), HEARTBEAT)
+        self.now = 6
+        self.assertEqual(gate.check(make_frame()), SKIPPED)
+
+    def test_new_frame_size_resets_background(self):
+        gate = MotionGate(threshold=0.01)
+        gate.check(make_frame())
+        self.now = 1
+
+        self.assertEqual(gate.check(make_frame(height=480)), MOTION)
+
+    def test_disabled_without_threshold(self):
+        self.assertIsNone(MotionGate.from_config({'source': 'rtsp://cam'}))
+        gate = MotionGate.from_config({'motion_threshold': 0.02, 'motion_heartbeat_sec': 30})
+        self.assertEqual((gate.threshold, gate.heartbeat_sec), (0.02, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import json
+import socket
+import socketserver
+import threading
+import time
+import unittest
+
+from argus.services.mqtt import MQTTService
+
+CONNECT = 0x10
+PUBLISH = 0x30
+PINGREQ = 0xC0
+DISCONNECT = 0xE0
+
+
+class FakeBrokerHandler(socketserver.BaseRequestHandler):
+    """
+    Minimal MQTT 3.1.1 broker: accepts CONNECT, acknowledges PUBLISH and records it.
+    """
+
+    def read_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def read_packet(self):
+        header = self.read_exactly(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self.read_exactly(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header, self.read_exactly(length)
+
+    def handle(self):
+        try:
+            while True:
+                header, body = self.read_packet()
+                packet_type = header & 0xF0
+                if packet_type == CONNECT:
+                    self.request.sendall(bytes([0x20, 0x02, 0x00, 0x00]))
+                elif packet_type == PUBLISH:
+                    self.on_publish(header, body)
+                elif packet_type == PINGREQ:
+                    self.request.sendall(bytes([0xD0, 0x00]))
+                elif packet_type == DISCONNECT:
+                    return
+        except ConnectionError:
+            return
+
+    def on_publish(self, header, body):
+        qos = (header >> 1) & 0x03
+        topic_length = int.from_bytes(body[:2], 'big')
+        topic = body[2:2 + topic_length].decode()
+        payload = body[2 + topic_length:]
+        if qos:
+            packet_id, payload = payload[:2], payload[2:]
+            self.request.sendall(bytes([0x40, 0x02]) + packet_id)
+        self.server.messages.append({'topic': topic, 'payload': payload, 'qos': qos, 'retain': bool(header & 0x01)})
+
+
+class FakeBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), FakeBrokerHandler)
+        self.messages = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Condition is not met in time')
+        time.sleep(0.01)
+
+
+class MQTTServiceTest(unittest.TestCase):
+    def make_service(self, port, **kwargs):
+        service = MQTTService('127.0.0.1', port, **kwargs)
+        self.addCleanup(service.close)
+        return service
+
+    def test_messages_go_over_one_connection(self):
+        broker = FakeBroker()
+        self.addCleanup(broker.stop)
+        service = self.make_service(broker.server_address[1], qos=1)
+        wait_for(lambda: service.connected)
+
+        service.publish('argus/source/first-cam/meta', 'first')
+        service.publish('argus/source/first-cam/meta', 'second')
+        wait_for(lambda: len(broker.messages) == 2)
+
+        self.assertEqual([m['payload'] for m in broker.messages], [b'first', b'second'])
+        self.assertEqual({m['qos'] for m in broker.messages}, {1})
+        self.assertEqual(broker.messages[0]['retain'], False)
+
+    def test_state_is_retained_and_sent_on_change(self):
+        broker = FakeBroker()
+        self.addCleanup(broker.stop)
+        service = self.make_service(broker.server_address[1])
+        wait_for(lambda: service.connected)
+
+        service.publish_state('first-cam', {'labels': ['person']})
+        service.publish_state('first-cam', {'labels': ['person']})
+        service.publish_state('first-cam', {'labels': []})
+        wait_for(lambda: len(broker.messages) == 2)
+        time.sleep(0.1)
+
+        self.assertEqual(len(broker.messages), 2)
+        self.assertEqual(broker.messages[0]['topic'], 'argus/source/first-cam/state')
+        self.assertTrue(broker.messages[0]['retain'])
+        self.assertEqual(json.loads(broker.messages[1]['payload']), {'labels': []})
+
+    def test_messages_are_queued_until_broker_is_up(self):
+        port = free_port()
+        service = self.make_service(port, max_queue_size=2, reconnect_min_delay=0.1, reconnect_max_delay=0.1)
+
+        for payload in ('first', 'second', 'third'):
+            service.publish('argus/source/first-cam/meta', payload)
+
+        self.assertFalse(service.connected)
+        self.assertEqual(service.dropped, 1)
+
+        broker = FakeBroker(port)
+        self.addCleanup(broker.stop)
+        wait_for(lambda: len(broker.messages) == 2)
+
+        self.assertEqual([m['payload'] for m in broker.messages], [b'second', b'third'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import unittest
+
+from argus.utils.notification_dispatcher import NotificationDispatcher
+
+
+class NotificationDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def run_on_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout=5)
+
+    def make_gate(self):
+        # Holds the channel worker until released, so notifications stay queued
+        gate = asyncio.Event()
+        sent = []
+
+        async def send(message):
+            await gate.wait()
+            sent.append(message)
+
+        async def release():
+            gate.set()
+
+        return send, release, sent
+
+    def wait_sent(self, channel, count):
+        async def wait():
+            while channel.stats()['sent'] + channel.stats()['failed'] < count:
+                await asyncio.sleep(0.01)
+        self.run_on_loop(wait())
+
+    def test_notifications_of_source_are_coalesced(self):
+        dispatcher = NotificationDispatcher(self.loop)
+        send, release, sent = self.make_gate()
+
+        dispatcher.dispatch('telegram', send, 'in flight', source='first-cam', kind='detection')
+        self.run_on_loop(asyncio.sleep(0.05))
+        dispatcher.dispatch('telegram', send, 'old', source='first-cam', kind='detection')
+        dispatcher.dispatch('telegram', send, 'other', source='second-cam', kind='detection')
+        dispatcher.dispatch('telegram', send, 'new', source='first-cam', kind='detection')
+
+        channel = dispatcher.channels['telegram']
+        self.assertEqual(channel.stats()['queue_depth'], 2)
+
+        self.run_on_loop(release())
+        self.wait_sent(channel, 3)
+
+        self.assertEqual(sent, ['in flight', 'new', 'other'])
+        self.assertEqual(channel.stats()['coalesced'], 1)
+
+    def test_full_queue_drops_oldest(self):
+        dispatcher = NotificationDispatcher(self.loop, {'email': {'max_queue_size': 2}})
+        send, release, sent = self.make_gate()
+
+        dispatcher.dispatch('email', send, 'in flight')
+        self.run_on_loop(asyncio.sleep(0.05))
+        for message in ('first', 'second', 'third'):
+            dispatcher.dispatch('email', send, message)
+
+        channel = dispatcher.channels['email']
+        self.run_on_loop(release())
+        self.wait_sent(channel, 3)
+
+        self.assertEqual(sent, ['in flight', 'second', 'third'])
+        self.assertEqual(channel.stats()['dropped'], 1)
+
+    def test_failed_notification_is_retried(self):
+        dispatcher = NotificationDispatcher(self.loop, {'telegram': {'retries': 2, 'backoff_sec': 0.01}})
+        attempts = []
+
+        async def send(message):
+            attempts.append(message)
+            if len(attempts) < 3:
+                raise ConnectionError
+
+        dispatcher.dispatch('telegram', send, 'message')
+        channel = dispatcher.channels['telegram']
+        self.wait_sent(channel, 1)
+
+        self.assertEqual(attempts, ['message'] * 3)
+        self.assertEqual(channel.stats()['sent'], 1)
+        self.assertEqual(channel.stats()['failed'], 0)
+
+    def test_channels_are_independent(self):
+        dispatcher = NotificationDispatcher(self.loop)
+        send, release, _ = self.make_gate()
+        sent = []
+
+        async def send_email(message):
+            sent.append(message)
+
+        dispatcher.dispatch('telegram', send, 'stuck')
+        dispatcher.dispatch('email', send_email, 'delivered')
+        self.wait_sent(dispatcher.channels['email'], 1)
+
+        self.assertEqual(sent, ['delivered'])
+        self.run_on_loop(release())
+
+
+if __name__ == '__main__':
+    unittest.main()
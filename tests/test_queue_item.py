@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+from argus.domain.queue_item import QueueItem
+from argus.domain.source_profile import SourceProfile
+
+
+def make_profile(**source_config):
+    source_config.setdefault('stills_dir', '/tmp/Stills')
+    return SourceProfile.from_config('first-cam', source_config)
+
+
+class SourceProfileTest(unittest.TestCase):
+    def test_defaults(self):
+        profile = make_profile()
+
+        self.assertEqual(profile.important_objects, frozenset({'person'}))
+        self.assertEqual(profile.detectable_objects, frozenset({'person'}))
+        self.assertEqual(profile.object_detected_prompt, 'Object detected.')
+        self.assertEqual(profile.photo_requested_prompt, 'Photo requested.')
+        self.assertEqual(profile.priority, 1)
+        self.assertIsNone(profile.max_fps)
+
+    def test_detectable_objects_include_other_objects(self):
+        profile = make_profile(important_objects=['person', 'car'], other_objects=['dog'])
+
+        self.assertEqual(profile.detectable_objects, frozenset({'person', 'car', 'dog'}))
+
+
+class QueueItemTest(unittest.TestCase):
+    def detection(self, label):
+        return {'label': label, 'confidence': 0.9, 'xmin': 10, 'ymin': 20, 'xmax': 30, 'ymax': 40}
+
+    def test_item_shares_profile_and_has_no_dict(self):
+        profile = make_profile()
+        item = QueueItem(np.zeros((10, 10, 3), np.uint8), profile)
+
+        self.assertIs(item.profile, profile)
+        self.assertEqual(item.thread_name, 'first-cam')
+        self.assertFalse(hasattr(item, '__dict__'))
+
+    def test_detections_are_classified_by_profile(self):
+        item = QueueItem(np.zeros((10, 10, 3), np.uint8), make_profile(other_objects=['dog']))
+
+        item.post_process([self.detection('dog'), self.detection('cat')])
+
+        self.assertTrue(item.objects_detected)
+        self.assertFalse(item.important_objects_detected)
+        self.assertEqual([obj['label'] for obj in item.marked_objects], ['dog'])
+
+        item.post_process([self.detection('person')])
+
+        self.assertTrue(item.important_objects_detected)
+
+    def test_raw_frame_is_not_drawn_on(self):
+        raw_frame = np.zeros((100, 100, 3), np.uint8)
+        item = QueueItem(raw_frame, make_profile())
+
+        item.post_process([self.detection('person')])
+
+        self.assertFalse(raw_frame.any())
+        self.assertIsNot(item.frame, raw_frame)
+        self.assertTrue(item.frame.any())
+        self.assertIs(item.frame, item.frame)
+
+    def test_jpeg_is_encoded_once(self):
+        item = QueueItem(np.zeros((100, 100, 3), np.uint8), make_profile())
+
+        with patch('argus.domain.queue_item.cv2.imencode', wraps=cv2.imencode) as imencode:
+            jpeg = item.encode_jpeg(80)
+            self.assertIs(item.jpeg, jpeg)
+            self.assertIs(item.encode_jpeg(80), jpeg)
+
+        imencode.assert_called_once()
+        self.assertTrue(jpeg.startswith(b'\xff\xd8'))
+
+    def test_jpeg_is_encoded_again_after_recognition(self):
+        item = QueueItem(np.zeros((100, 100, 3), np.uint8), make_profile())
+        jpeg = item.jpeg
+
+        item.post_process([self.detection('person')])
+
+        self.assertNotEqual(item.jpeg, jpeg)
+
+    def test_save_writes_memoized_jpeg(self):
+        with tempfile.TemporaryDirectory() as stills_dir:
+            item = QueueItem(np.zeros((100, 100, 3), np.uint8), make_profile(stills_dir=stills_dir))
+            jpeg = item.encode_jpeg(70)
+
+            item.save('frame.jpg', jpeg_quality=70)
+
+            self.assertEqual(item.path, os.path.join(stills_dir, 'frame.jpg'))
+            with open(item.path, 'rb') as f:
+                self.assertEqual(f.read(), jpeg)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import importlib.util
+import unittest
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from argus.domain.queue_item import QueueItem
+from argus.domain.source_profile import SourceProfile
+
+openvino_available = importlib.util.find_spec('openvino') is not None
+
+
+def make_model(anchors=10):
+    """
+    Stand-in for YOLO: every output value of a batch item is the mean of its input.
+    """
+    import openvino as ov
+    import openvino.opset13 as ops
+
+    images = ops.parameter([1, 3, 32, 32], np.float32, name='images')
+    mean = ops.unsqueeze(ops.reduce_mean(images, np.array([1, 2, 3])), np.array([1, 2]))
+    output = ops.multiply(mean, ops.constant(np.ones((1, 84, anchors), np.float32)))
+    return ov.Model([output], [images], 'yolo')
+
+
+@unittest.skipUnless(openvino_available, 'OpenVINO is not installed')
+class RecognizerBatchingTest(unittest.TestCase):
+    def make_recognizer(self, max_tiles=1, static_only=False, **net_config):
+        from argus.services import recognizer as recognizer_module
+
+        class FakeCore(recognizer_module.Core):
+            def read_model(self, path):
+                return make_model()
+
+            def compile_model(self, model, device_name):
+                # Device without dynamic shapes
+                if static_only and model.input(0).get_partial_shape().is_dynamic:
+                    raise RuntimeError('Dynamic shapes are not supported')
+                return super().compile_model(model, device_name)
+
+        net_config = {'device_name': 'CPU', 'num_requests': 2, **net_config}
+        with patch.object(recognizer_module, 'Core', FakeCore):
+            recognizer = recognizer_module.OpenVinoRecognizer(net_config, None, None, max_tiles=max_tiles)
+
+        recognizer.results = {}
+
+        def decode_detections(result, queue_item):
+            recognizer.results[queue_item.raw_frame[0, 0, 0]] = float(result[0, 0, 0])
+            return []
+
+        recognizer.decode_detections = decode_detections
+        recognizer.on_recognized = Mock()
+        return recognizer
+
+    def make_item(self, value):
+        profile = SourceProfile.from_config(f'cam-{value}', {'stills_dir': '/tmp/Stills'})
+        return QueueItem(np.full((48, 64, 3), value, np.uint8), profile, release_callback=Mock())
+
+    def test_batch_is_sent_when_full_and_split_per_item(self):
+        recognizer = self.make_recognizer(max_batch_size=2, max_batch_wait_ms=1000)
+        items = [self.make_item(51), self.make_item(204)]
+        release_callbacks = [item.release_callback for item in items]
+
+        recognizer.send_to_recognize(items[0])
+        self.assertEqual(recognizer.batch, [items[0]])
+
+        recognizer.send_to_recognize(items[1])
+        self.assertEqual(recognizer.batch, [])
+        recognizer.ireqs.wait_all()
+
+        # Letterbox pads 48x64 frame to square, so the mean is 3/4 of the value
+        self.assertAlmostEqual(recognizer.results[51], 51 / 255 * 0.75, places=4)
+        self.assertAlmostEqual(recognizer.results[204], 204 / 255 * 0.75, places=4)
+        self.assertEqual(recognizer.on_recognized.call_count, 2)
+        for release_callback in release_callbacks:
+            release_callback.assert_called_once_with()
+
+    def test_partial_batch_is_sent_after_max_wait(self):
+        recognizer = self.make_recognizer(max_batch_size=4, max_batch_wait_ms=0)
+
+        recognizer.send_to_recognize(self.make_item(102))
+        self.assertEqual(recognizer.batch_wait_time(), 0)
+
+        recognizer.send_expired_batch()
+        recognizer.ireqs.wait_all()
+
+        self.assertIsNone(recognizer.batch_wait_time())
+        self.assertAlmostEqual(recognizer.results[102], 102 / 255 * 0.75, places=4)
+
+    def test_single_frame_requests_by_default(self):
+        recognizer = self.make_recognizer()
+
+        recognizer.send_to_recognize(self.make_item(153))
+        recognizer.ireqs.wait_all()
+
+        self.assertEqual(recognizer.n, 1)
+        self.assertAlmostEqual(recognizer.results[153], 153 / 255 * 0.75, places=4)
+
+    def test_tiles_of_frame_go_to_one_request(self):
+        recognizer = self.make_recognizer(max_tiles=2)
+        results = []
+        recognizer.decode_detections = lambda result, queue_item: results.append(result[:, 0, 0].tolist()) or []
+
+        profile = SourceProfile.from_config('cam', {'stills_dir': '/tmp/Stills', 'tiles': [2, 1], 'tile_overlap': 0,
+                                                    'tile_full_frame': False})
+        frame = np.zeros((32, 64, 3), np.uint8)
+        frame[:, 32:] = 255
+        recognizer.send_to_recognize(QueueItem(frame, profile, release_callback=Mock()))
+        recognizer.ireqs.wait_all()
+
+        # Left tile is black, right one is white, both are 32x32 and fill the input
+        self.assertEqual(recognizer.n, 2)
+        self.assertEqual(len(results), 1)
+        self.assertAlmostEqual(results[0][0], 0, places=4)
+        self.assertAlmostEqual(results[0][1], 1, places=4)
+
+    def test_untiled_frame_is_not_padded_to_tile_count(self):
+        recognizer = self.make_recognizer(max_tiles=4, max_batch_size=2)
+        places = []
+        recognizer.decode_detections = lambda result, queue_item: places.append(len(result)) or []
+
+        recognizer.send_to_recognize(self.make_item(51))
+        recognizer.send_batch()
+        recognizer.ireqs.wait_all()
+
+        self.assertTrue(recognizer.dynamic_batch)
+        self.assertEqual(recognizer.ireqs[0].get_output_tensor(0).shape[0], 1)
+        self.assertEqual(places, [1])
+
+    def test_static_batch_without_dynamic_shapes(self):
+        recognizer = self.make_recognizer(max_tiles=2, static_only=True)
+
+        recognizer.send_to_recognize(self.make_item(153))
+        recognizer.send_batch()
+        recognizer.ireqs.wait_all()
+
+        self.assertFalse(recognizer.dynamic_batch)
+        self.assertEqual(recognizer.ireqs[0].get_output_tensor(0).shape[0], 2)
+        self.assertAlmostEqual(recognizer.results[153], 153 / 255 * 0.75, places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
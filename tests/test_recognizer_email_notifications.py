@@ -3,7 +3,7 @@ import sys
 import types
 import unittest
 from types import SimpleNamespace
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 
 
 def import_recognizer():
@@ -13,6 +13,14 @@ def import_recognizer():
     runtime = types.ModuleType('openvino.runtime')
     runtime.Core = object
     runtime.AsyncInferQueue = object
+    runtime.Dimension = object
+    runtime.Layout = object
+    runtime.Tensor = object
+    runtime.Type = object
+
+    preprocess = types.ModuleType('openvino.preprocess')
+    preprocess.ColorFormat = object
+    preprocess.PrePostProcessor = object
 
     cv2 = types.ModuleType('cv2')
     numpy = types.ModuleType('numpy')
@@ -20,6 +28,7 @@ def import_recognizer():
     modules = {
         'openvino': openvino,
         'openvino.runtime': runtime,
+        'openvino.preprocess': preprocess,
         'cv2': cv2,
         'numpy': numpy,
     }
@@ -47,50 +56,66 @@ class RecognizerEmailNotificationsTest(unittest.TestCase):
         queue_item = SimpleNamespace(
             thread_name='first-cam',
             url='http://example.com/Stills/detected.jpg',
-            frame=object(),
+            jpeg=b'jpeg',
             object_detected_prompt='Object detected.',
         )
 
         with patch.dict(self.recognizer_module.notification_throttlers, {'first-cam': throttler}, clear=True):
-            with patch.object(self.recognizer_module, 'run_async') as run_async:
+            with patch.object(self.recognizer_module, 'dispatch') as dispatch:
                 recognizer.notify_on_confirmed_detection(queue_item, detection_is_confirm=True)
 
         throttler.is_allowed.assert_called_once_with()
-        self.assertEqual(run_async.call_count, 2)
-        run_async.assert_any_call(
+        self.assertEqual(dispatch.call_count, 2)
+        dispatch.assert_any_call(
+            'telegram',
             recognizer.telegram.send_message,
             'Objects detected: http://example.com/Stills/detected.jpg',
+            source='first-cam',
+            kind='detection',
+            on_delivered=ANY,
         )
-        run_async.assert_any_call(
+        dispatch.assert_any_call(
+            'email',
             recognizer.email_service.send_message,
             'Objects detected: http://example.com/Stills/detected.jpg',
+            source='first-cam',
+            kind='detection',
+            on_delivered=ANY,
         )
 
     def test_confirmed_detection_without_url_sends_frame_to_email(self):
         recognizer = self.make_recognizer()
         throttler = Mock()
         throttler.is_allowed.return_value = True
-        frame = object()
+        jpeg = b'jpeg'
         queue_item = SimpleNamespace(
             thread_name='first-cam',
             url=None,
-            frame=frame,
+            jpeg=jpeg,
             object_detected_prompt='Object detected.',
         )
 
         with patch.dict(self.recognizer_module.notification_throttlers, {'first-cam': throttler}, clear=True):
-            with patch.object(self.recognizer_module, 'run_async') as run_async:
+            with patch.object(self.recognizer_module, 'dispatch') as dispatch:
                 recognizer.notify_on_confirmed_detection(queue_item, detection_is_confirm=True)
 
-        run_async.assert_any_call(
+        dispatch.assert_any_call(
+            'telegram',
             recognizer.telegram.send_frame,
-            frame,
+            jpeg,
             'Object detected.',
+            source='first-cam',
+            kind='detection',
+            on_delivered=ANY,
         )
-        run_async.assert_any_call(
+        dispatch.assert_any_call(
+            'email',
             recognizer.email_service.send_frame,
-            frame,
+            jpeg,
             'Object detected.',
+            source='first-cam',
+            kind='detection',
+            on_delivered=ANY,
         )
 
     def test_unconfirmed_detection_does_not_send_email(self):
@@ -99,16 +124,16 @@ class RecognizerEmailNotificationsTest(unittest.TestCase):
         queue_item = SimpleNamespace(
             thread_name='first-cam',
             url='http://example.com/Stills/detected.jpg',
-            frame=object(),
+            jpeg=b'jpeg',
             object_detected_prompt='Object detected.',
         )
 
         with patch.dict(self.recognizer_module.notification_throttlers, {'first-cam': throttler}, clear=True):
-            with patch.object(self.recognizer_module, 'run_async') as run_async:
+            with patch.object(self.recognizer_module, 'dispatch') as dispatch:
                 recognizer.notify_on_confirmed_detection(queue_item, detection_is_confirm=False)
 
         throttler.is_allowed.assert_not_called()
-        run_async.assert_not_called()
+        dispatch.assert_not_called()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from time import time
+from unittest.mock import patch
+
+from argus.domain.source_profile import SourceProfile
+from argus.utils.retention import RetentionManager, StillsIndex
+
+
+class RetentionTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.stills_dir = tmp_dir.name
+
+    def make_file(self, relative, size, age_days):
+        path = os.path.join(self.stills_dir, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'0' * size)
+        mtime = time() - age_days * 86400
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def make_manager(self, **quota):
+        index = StillsIndex('first-cam', self.stills_dir, **quota)
+        manager = RetentionManager({'first-cam': index}, deletes_per_sec=10000)
+        return manager, index
+
+    def test_old_files_and_empty_day_dirs_are_deleted(self):
+        old = self.make_file('2020/01/01/old.jpg', 10, age_days=10)
+        recent = self.make_file('2020/01/02/recent.jpg', 10, age_days=1)
+        manager, index = self.make_manager(max_age_sec=5 * 86400)
+        index.bootstrap()
+
+        manager.enforce()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertFalse(os.path.exists(os.path.join(self.stills_dir, '2020/01/01')))
+        self.assertTrue(os.path.exists(recent))
+        self.assertEqual(index.size, 10)
+
+    def test_oldest_files_are_deleted_over_size_quota(self):
+        paths = [self.make_file(f'2020/01/01/{age}.jpg', 100, age_days=age) for age in (3, 2, 1)]
+        manager, index = self.make_manager(max_bytes=250)
+        index.bootstrap()
+        new = self.make_file('2020/01/01/new.jpg', 100, age_days=0)
+        manager.add('first-cam', new)
+
+        # Deleted from the index, new files are not scanned again
+        with patch('argus.utils.retention.os.walk') as walk:
+            manager.enforce()
+        walk.assert_not_called()
+
+        self.assertEqual([os.path.exists(path) for path in paths + [new]], [False, False, True, True])
+        self.assertEqual(index.size, 200)
+
+    def test_files_added_during_scan_are_kept_once(self):
+        path = self.make_file('2020/01/01/a.jpg', 10, age_days=0)
+        manager, index = self.make_manager(max_bytes=1000)
+
+        manager.add('first-cam', path)
+        index.bootstrap()
+
+        self.assertEqual(len(index.files), 1)
+        self.assertEqual(index.size, 10)
+
+    def test_deletes_are_rate_limited(self):
+        for age in range(3):
+            self.make_file(f'2020/01/01/{age}.jpg', 10, age_days=10 + age)
+        index = StillsIndex('first-cam', self.stills_dir, max_age_sec=86400)
+        index.bootstrap()
+        manager = RetentionManager({'first-cam': index}, deletes_per_sec=5)
+
+        with patch('argus.utils.retention.sleep') as sleep:
+            manager.enforce()
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.2] * 3)
+
+    def test_sources_are_cleaned_round_robin(self):
+        backlog = [self.make_file(f'first/2020/01/01/{age}.jpg', 10, age_days=10 + age) for age in range(3)]
+        other = self.make_file('second/2020/01/01/0.jpg', 10, age_days=10)
+        indexes = {
+            name: StillsIndex(name, os.path.join(self.stills_dir, name), max_age_sec=86400)
+            for name in ('first', 'second')
+        }
+        for index in indexes.values():
+            index.bootstrap()
+        manager = RetentionManager(indexes, deletes_per_sec=10000)
+
+        with patch('argus.utils.retention.os.remove') as remove:
+            manager.enforce()
+
+        # The other source does not wait for the whole backlog
+        removed = [call.args[0] for call in remove.call_args_list]
+        self.assertEqual(removed, [backlog[2], other, backlog[1], backlog[0]])
+
+    def test_quotas_from_config(self):
+        profile = SourceProfile.from_config('first-cam', {'stills_dir': self.stills_dir})
+        config = {'app': {'retention_days': 30}, 'sources': {'first-cam': {'retention_gb': 0.5}}}
+
+        manager = RetentionManager.from_config(config, {'first-cam': profile})
+
+        index = manager.indexes['first-cam']
+        self.assertEqual(index.max_age_sec, 30 * 86400)
+        self.assertEqual(index.max_bytes, 2 ** 29)
+        config = {'app': {}, 'sources': {'first-cam': {}}}
+        self.assertIsNone(RetentionManager.from_config(config, {'first-cam': profile}))
+
+
+if __name__ == '__main__':
+    unittest.main()
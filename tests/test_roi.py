@@ -0,0 +1,89 @@
+import importlib.util
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from argus.domain.queue_item import QueueItem
+from argus.domain.source_profile import SourceProfile
+from argus.utils.roi import Roi
+
+openvino_available = importlib.util.find_spec('openvino') is not None
+
+DRIVEWAY = [[100, 200], [300, 200], [300, 400], [100, 400]]
+
+
+class RoiTest(unittest.TestCase):
+    def test_no_roi_by_default(self):
+        profile = SourceProfile.from_config('first-cam', {'stills_dir': '/tmp/Stills'})
+
+        self.assertIsNone(profile.roi)
+
+    def test_crop_is_bounding_rect_of_polygon(self):
+        roi = Roi([[150, 200], [300, 250], [100, 400]])
+        frame = np.zeros((480, 640, 3), np.uint8)
+
+        crop, offset = roi.crop(frame)
+
+        self.assertEqual(offset, (100, 200))
+        self.assertEqual(crop.shape, (200, 200, 3))
+        self.assertTrue(np.shares_memory(crop, frame))
+
+    def test_crop_is_clipped_to_frame(self):
+        roi = Roi([[500, -10], [800, -10], [800, 300], [500, 300]])
+
+        crop, offset = roi.crop(np.zeros((240, 640, 3), np.uint8))
+
+        self.assertEqual(offset, (500, 0))
+        self.assertEqual(crop.shape, (240, 140, 3))
+
+    def test_polygon_outside_of_frame_keeps_whole_frame(self):
+        frame = np.zeros((160, 320, 3), np.uint8)
+
+        crop, offset = Roi(DRIVEWAY).crop(frame)
+
+        self.assertIs(crop, frame)
+        self.assertEqual(offset, (0, 0))
+
+    def test_contains(self):
+        roi = Roi([[0, 0], [100, 0], [0, 100]])
+
+        self.assertTrue(roi.contains(10, 10))
+        self.assertTrue(roi.contains(50, 50))
+        self.assertFalse(roi.contains(60, 60))
+
+    def test_polygon_needs_three_points(self):
+        with self.assertRaises(ValueError):
+            Roi([[0, 0], [10, 10]])
+
+
+@unittest.skipUnless(openvino_available, 'OpenVINO is not installed')
+class RoiDetectionsTest(unittest.TestCase):
+    def test_detections_are_mapped_from_crop_and_filtered_by_polygon(self):
+        from argus.services.recognizer import OpenVinoRecognizer
+
+        # Triangle: the bottom right corner of its bounding crop is outside
+        roi = [[100, 200], [300, 200], [100, 400]]
+        profile = SourceProfile.from_config('first-cam', {'stills_dir': '/tmp/Stills', 'roi': roi})
+        item = QueueItem(np.zeros((480, 640, 3), np.uint8), profile)
+
+        recognizer = SimpleNamespace(labels_map=['person'])
+        [(frame, (offset_x, offset_y))] = OpenVinoRecognizer.inference_views(item)
+        # 200x200 crop is letterboxed into 64x64 input
+        item.inference_transforms = [(200 / 64, offset_x, offset_y)]
+
+        output = np.zeros((1, 5, 2), np.float32)
+        output[0, :, 0] = (16, 16, 16, 16, 0.9)
+        output[0, :, 1] = (56, 56, 8, 8, 0.9)
+
+        detections = OpenVinoRecognizer.decode_detections(recognizer, output, item)
+
+        self.assertEqual(len(detections), 1)
+        self.assertEqual(
+            [detections[0][key] for key in ('xmin', 'ymin', 'xmax', 'ymax')],
+            [125, 225, 175, 275],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from argus.utils.shared_frame_ring import SharedFrameRing
+
+
+def write_frames(ring, values):
+    for value in values:
+        ring.write(np.full((4, 6, 3), value, np.uint8))
+
+
+class SharedFrameRingTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedFrameRing(slots=3, max_frame_size=(8, 8))
+
+    def tearDown(self):
+        self.ring.close(unlink=True)
+
+    def test_reads_newest_frame_once(self):
+        self.ring.write(np.full((4, 6, 3), 1, np.uint8))
+        self.ring.write(np.full((4, 6, 3), 2, np.uint8))
+
+        shared_frame = self.ring.read_latest()
+
+        self.assertEqual(shared_frame.seq, 2)
+        self.assertEqual(shared_frame.data.shape, (4, 6, 3))
+        self.assertTrue((shared_frame.data == 2).all())
+        self.assertIsNone(self.ring.read_latest(after_seq=shared_frame.seq))
+
+        shared_frame.release()
+        del shared_frame
+
+    def test_pinned_frame_is_not_overwritten(self):
+        self.ring.write(np.full((4, 6, 3), 1, np.uint8))
+        pinned = self.ring.read_latest()
+
+        for value in range(2, 6):
+            self.ring.write(np.full((4, 6, 3), value, np.uint8))
+
+        self.assertTrue((pinned.data == 1).all())
+        pinned.release()
+        del pinned
+
+    def test_frame_dropped_when_every_slot_is_pinned(self):
+        pinned = []
+        for value in range(3):
+            self.assertTrue(self.ring.write(np.full((4, 6, 3), value, np.uint8)))
+            pinned.append(self.ring.read_latest(after_seq=value))
+
+        self.assertFalse(self.ring.write(np.zeros((4, 6, 3), np.uint8)))
+        self.assertEqual(self.ring.dropped, 1)
+
+        for shared_frame in pinned:
+            shared_frame.release()
+        del pinned, shared_frame
+
+    def test_frame_wanted_after_latest_is_consumed(self):
+        self.assertTrue(self.ring.frame_wanted())
+
+        self.ring.write(np.zeros((4, 6, 3), np.uint8))
+        self.assertFalse(self.ring.frame_wanted())
+
+        self.ring.read_latest().release()
+        self.assertTrue(self.ring.frame_wanted())
+
+    def test_frame_bigger_than_slot(self):
+        with self.assertRaises(ValueError):
+            self.ring.write(np.zeros((16, 16, 3), np.uint8))
+
+    def test_frames_written_by_another_process(self):
+        process = multiprocessing.get_context('spawn').Process(target=write_frames, args=(self.ring, [7, 8]))
+        process.start()
+        process.join(30)
+
+        self.assertTrue(self.ring.new_frame.is_set())
+        shared_frame = self.ring.read_latest()
+
+        self.assertEqual(shared_frame.seq, 2)
+        self.assertTrue((shared_frame.data == 8).all())
+        shared_frame.release()
+        del shared_frame
+
+
+if __name__ == '__main__':
+    unittest.main()
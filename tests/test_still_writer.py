@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from argus.domain.queue_item import QueueItem
+from argus.domain.source_profile import SourceProfile
+from argus.utils.still_writer import BLOCK, StillWriter
+
+
+class StillWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.stills_dir = os.path.join(self.tmp_dir.name, 'first-cam')
+        self.profile = SourceProfile.from_config('first-cam', {
+            'stills_dir': self.stills_dir,
+            'host_stills_uri': 'http://example.com/Stills',
+        })
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_item(self):
+        return QueueItem(np.full((40, 60, 3), 128, np.uint8), self.profile)
+
+    def test_still_is_written_and_callback_gets_path_and_url(self):
+        writer = StillWriter(jpeg_quality=50)
+        saved = []
+
+        self.assertTrue(writer.submit(self.make_item(), saved.append))
+        writer.join()
+
+        item, = saved
+        self.assertTrue(os.path.exists(item.path))
+        # Stills are sharded by date: stills_dir/YYYY/MM/DD
+        relative = os.path.relpath(item.path, self.stills_dir)
+        self.assertRegex(relative, r'^\d{4}/\d{2}/\d{2}/[^/]+\.jpg$')
+        self.assertEqual(item.url, 'http://example.com/Stills/' + relative)
+        self.assertEqual(writer.stats.snapshot()['written'], 1)
+
+    def test_directory_is_created_once(self):
+        writer = StillWriter()
+        saved = []
+
+        with patch('argus.utils.still_writer.os.makedirs', wraps=os.makedirs) as makedirs:
+            writer.submit(self.make_item(), saved.append)
+            writer.submit(self.make_item(), saved.append)
+            writer.join()
+
+        # makedirs also calls itself for the parents of the date directory
+        day_dirs = {os.path.dirname(item.path) for item in saved}
+        created = [call.args[0] for call in makedirs.call_args_list]
+        for day_dir in day_dirs:
+            self.assertEqual(created.count(day_dir), 1)
+
+    def test_full_queue_drops_still_but_calls_callback(self):
+        writer = StillWriter(max_queue_size=1)
+        unblock = threading.Event()
+        saved = []
+
+        # Keep the worker busy, so the next still fills the queue
+        writer.submit(self.make_item(), lambda item: unblock.wait())
+        while writer.queue.qsize():
+            pass
+        self.assertTrue(writer.submit(self.make_item(), saved.append))
+        self.assertFalse(writer.submit(self.make_item(), saved.append))
+
+        self.assertEqual(len(saved), 1)
+        self.assertIsNone(saved[0].path)
+        self.assertEqual(writer.stats.snapshot()['dropped'], 1)
+
+        unblock.set()
+        writer.join()
+        self.assertEqual(len(saved), 2)
+        self.assertIsNotNone(saved[1].path)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            StillWriter(policy='wait')
+
+    def test_block_policy_waits_for_queue(self):
+        writer = StillWriter(max_queue_size=1, policy=BLOCK)
+
+        for _ in range(3):
+            self.assertTrue(writer.submit(self.make_item()))
+        writer.join()
+
+        self.assertEqual(writer.stats.snapshot()['dropped'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import importlib.util
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from argus.domain.queue_item import QueueItem
+from argus.domain.source_profile import SourceProfile
+from argus.utils.tiling import tile_rects
+from argus.utils.yolo import suppress_fragments
+
+openvino_available = importlib.util.find_spec('openvino') is not None
+
+
+def make_profile(**source_config):
+    return SourceProfile.from_config('first-cam', {'stills_dir': '/tmp/Stills', **source_config})
+
+
+class TilingTest(unittest.TestCase):
+    def test_tiles_cover_frame_with_overlap(self):
+        rects = tile_rects(3840, 2160, (3, 2), 0.2)
+
+        self.assertEqual(len(rects), 6)
+        self.assertEqual(rects[0][:2], (0, 0))
+        self.assertEqual(rects[-1][2:], (3840, 2160))
+        # Tiles of a row have the same size, neighbours overlap by 20% of it
+        (xmin, _, xmax, _), (next_xmin, _, _, _) = rects[0], rects[1]
+        self.assertAlmostEqual((xmax - next_xmin) / (xmax - xmin), 0.2, places=2)
+
+    def test_tiles_without_overlap(self):
+        self.assertEqual(tile_rects(100, 50, (2, 1), 0), [(0, 0, 50, 50), (50, 0, 100, 50)])
+
+    def test_tile_count(self):
+        self.assertEqual(make_profile().tile_count, 1)
+        self.assertEqual(make_profile(tiles=[3, 2]).tile_count, 7)
+        self.assertEqual(make_profile(tiles=[3, 2], tile_full_frame=False).tile_count, 6)
+
+    def test_invalid_tiles(self):
+        with self.assertRaises(ValueError):
+            make_profile(tiles=[0, 2])
+        with self.assertRaises(ValueError):
+            make_profile(tiles=[2, 2], tile_overlap=1)
+
+    def test_part_of_object_is_suppressed(self):
+        boxes = np.array([
+            [0, 0, 100, 200],     # whole object
+            [50, 0, 50, 200],     # its part from the right tile, IoU is 0.5
+            [50, 0, 50, 200],     # same place, other class
+            [300, 0, 100, 200],
+        ], np.float32)
+        scores = np.array([0.9, 0.95, 0.8, 0.7], np.float32)
+        class_ids = np.array([0, 0, 1, 0])
+
+        kept = suppress_fragments(boxes, scores, class_ids)
+
+        self.assertEqual(sorted(kept.tolist()), [1, 2, 3])
+
+
+@unittest.skipUnless(openvino_available, 'OpenVINO is not installed')
+class TiledDetectionsTest(unittest.TestCase):
+    def test_object_in_overlap_is_detected_once(self):
+        from argus.services.recognizer import OpenVinoRecognizer
+
+        item = QueueItem(np.zeros((100, 200, 3), np.uint8), make_profile(tiles=[2, 1], tile_full_frame=False))
+        views = OpenVinoRecognizer.inference_views(item)
+        self.assertEqual([offset for _, offset in views], [(0, 0), (89, 0)])
+        self.assertEqual([frame.shape[:2] for frame, _ in views], [(100, 111), (100, 111)])
+
+        # Both 111x100 tiles are letterboxed with scale 2
+        item.inference_transforms = [(2, 0, 0), (2, 89, 0)]
+        output = np.zeros((2, 5, 1), np.float32)
+        output[0, :, 0] = (50, 25, 10, 10, 0.9)    # (100, 50) in frame
+        output[1, :, 0] = (5.5, 25, 10, 10, 0.8)   # the same object seen by the right tile
+
+        recognizer = SimpleNamespace(labels_map=['person'])
+        detections = OpenVinoRecognizer.decode_detections(recognizer, output, item)
+
+        self.assertEqual(len(detections), 1)
+        self.assertAlmostEqual(detections[0]['confidence'], 0.9, places=5)
+        self.assertEqual(
+            [detections[0][key] for key in ('xmin', 'ymin', 'xmax', 'ymax')],
+            [90, 40, 110, 60],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from argus.domain.queue_item import QueueItem
+from argus.domain.source_profile import SourceProfile
+from argus.utils.tracing import Tracer, read_traces, stage_durations, summarize
+
+
+class TracingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'traces.jsonl')
+        self.profile = SourceProfile.from_config('first-cam', {'stills_dir': self.tmp_dir.name})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_item(self, stages):
+        item = QueueItem(np.zeros((4, 4, 3), np.uint8), self.profile, captured=100.0)
+        for stage, time in stages.items():
+            item.stages[stage] = 100.0 + time / 1000
+        return item
+
+    def test_items_are_sampled_by_trace_id(self):
+        tracer = Tracer(self.path, sample_rate=0.5)
+        items = [self.make_item({'scheduled': 1}) for _ in range(4)]
+        for item in items:
+            tracer.export(item)
+        tracer.close()
+
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+
+        self.assertEqual(len(records), 2)
+        self.assertTrue(all(record['trace_id'] % 2 == 0 for record in records))
+        self.assertEqual(records[0]['source'], 'first-cam')
+        self.assertEqual(records[0]['stages'], {'captured': 0, 'scheduled': 1})
+
+    def test_records_of_one_item_are_merged(self):
+        tracer = Tracer(self.path, sample_rate=1)
+        item = self.make_item({'scheduled': 2, 'inferred': 12, 'postprocessed': 13})
+        tracer.export(item)
+        item.stages['saved'] = 100.020
+        item.stages['notified_telegram'] = 100.500
+        tracer.export(item)
+        tracer.close()
+
+        (source, stages), = read_traces(self.path).values()
+        durations = stage_durations(stages)
+
+        self.assertEqual(source, 'first-cam')
+        self.assertAlmostEqual(durations['inferred'], 10)
+        self.assertAlmostEqual(durations['saved'], 7)
+        self.assertAlmostEqual(durations['notified_telegram'], 480)
+        self.assertAlmostEqual(durations['alert'], 500)
+        self.assertAlmostEqual(durations['total'], 500)
+
+    def test_summary_percentiles_per_source(self):
+        traces = {
+            trace_id: ('first-cam', {'captured': 0, 'inferred': float(trace_id)})
+            for trace_id in range(1, 101)
+        }
+        traces[0] = ('second-cam', {'captured': 0, 'inferred': 5.0})
+
+        summary = summarize(traces)
+
+        self.assertEqual(summary['first-cam']['inferred'], {'count': 100, 'p50': 50, 'p95': 95, 'p99': 99})
+        self.assertEqual(summary['second-cam']['inferred']['p99'], 5)
+        self.assertEqual(summary['all']['inferred']['count'], 101)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import importlib.util
+import unittest
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from argus.domain.queue_item import QueueItem
+from argus.domain.source_profile import SourceProfile
+from argus.utils.tracker import Tracker
+
+openvino_available = importlib.util.find_spec('openvino') is not None
+
+
+def detection(xmin, ymin=100, size=50, label='person', confidence=0.9):
+    return {
+        'label': label,
+        'confidence': confidence,
+        'xmin': xmin,
+        'ymin': ymin,
+        'xmax': xmin + size,
+        'ymax': ymin + size,
+    }
+
+
+class TrackerTest(unittest.TestCase):
+    def test_track_is_born_after_min_hits_and_keeps_id(self):
+        tracker = Tracker(min_hits=3)
+        events = [tracker.update([detection(100 + 10 * frame)], frame) for frame in range(5)]
+
+        self.assertEqual([len(frame_events.born) for frame_events in events], [0, 0, 1, 0, 0])
+        self.assertEqual(events[2].born[0].label, 'person')
+        self.assertEqual(events[4].active, [1])
+
+        detections = [detection(150)]
+        tracker.update(detections, 5)
+        self.assertEqual(detections[0]['track_id'], 1)
+
+    def test_standing_object_has_no_events(self):
+        tracker = Tracker(min_hits=1)
+        self.assertTrue(tracker.update([detection(100)], 0).born)
+
+        for frame in range(1, 20):
+            self.assertFalse(tracker.update([detection(100 + frame % 2)], frame))
+
+    def test_track_ends_after_max_misses(self):
+        tracker = Tracker(min_hits=1, max_misses=2)
+        tracker.update([detection(100)], 0)
+
+        self.assertFalse(tracker.update([], 1))
+        self.assertFalse(tracker.update([], 2))
+        events = tracker.update([], 3)
+
+        self.assertEqual([track.id for track in events.ended], [1])
+        self.assertEqual(events.active, [])
+
+    def test_tentative_track_survives_frame_without_detection(self):
+        tracker = Tracker(min_hits=3, max_misses=2)
+        tracker.update([detection(100)], 0)
+        tracker.update([detection(100)], 1)
+
+        self.assertFalse(tracker.update([], 2))
+        events = tracker.update([detection(100)], 3)
+
+        self.assertEqual([track.id for track in events.born], [1])
+
+    def test_tentative_track_is_dropped_after_max_misses_without_event(self):
+        tracker = Tracker(min_hits=3, max_misses=1)
+        tracker.update([detection(100)], 0)
+
+        self.assertFalse(tracker.update([], 1))
+        self.assertFalse(tracker.update([], 2))
+        self.assertEqual(tracker.tracks, [])
+
+    def test_detection_below_075_starts_track_by_default(self):
+        # Any detection above the decoder threshold (0.65) can start a track
+        tracker = Tracker()
+        events = [tracker.update([detection(100, confidence=0.7)], frame) for frame in range(3)]
+
+        self.assertEqual([track.label for track in events[2].born], ['person'])
+
+    def test_moved_object_is_changed(self):
+        tracker = Tracker(min_hits=1, change_iou=0.5)
+        tracker.update([detection(100)], 0)
+
+        self.assertFalse(tracker.update([detection(110)], 1))
+        events = tracker.update([detection(130)], 2)
+
+        self.assertEqual([track.id for track in events.changed], [1])
+
+    def test_low_confidence_continues_track_but_does_not_start_one(self):
+        tracker = Tracker(min_hits=1, high_confidence=0.8)
+        tracker.update([detection(100)], 0)
+
+        detections = [detection(105, confidence=0.7), detection(400, confidence=0.7)]
+        events = tracker.update(detections, 1)
+
+        self.assertFalse(events)
+        self.assertEqual([obj['track_id'] for obj in detections], [1, None])
+
+    def test_labels_are_not_mixed(self):
+        tracker = Tracker(min_hits=1)
+        tracker.update([detection(100)], 0)
+
+        detections = [detection(100, label='dog')]
+        events = tracker.update(detections, 1)
+
+        self.assertEqual(detections[0]['track_id'], 2)
+        self.assertEqual([track.label for track in events.born], ['dog'])
+
+    def test_fast_object_is_followed_by_velocity(self):
+        tracker = Tracker(min_hits=1)
+        for frame, xmin in enumerate((100, 120, 150)):
+            detections = [detection(xmin)]
+            tracker.update(detections, frame)
+
+        # IoU of the last two boxes is 0.25, of the last box and the predicted one 0.43
+        self.assertEqual(detections[0]['track_id'], 1)
+
+    def test_disabled_by_config(self):
+        self.assertIsNone(Tracker.from_config({'tracking': False}))
+        self.assertEqual(Tracker.from_config({'track_min_hits': 5}).min_hits, 5)
+        self.assertEqual(Tracker.from_config({'track_high_confidence': 0.8}).high_confidence, 0.8)
+
+
+@unittest.skipUnless(openvino_available, 'OpenVINO is not installed')
+class TrackedRecognitionTest(unittest.TestCase):
+    def recognize(self, frames_detections):
+        from argus.services import recognizer as recognizer_module
+
+        recognizer = recognizer_module.OpenVinoRecognizer.__new__(recognizer_module.OpenVinoRecognizer)
+        recognizer.telegram = None
+        recognizer.mqtt_service = Mock()
+        recognizer.still_writer = Mock()
+        recognizer.clip_recorder = Mock()
+        recognizer.event_store = Mock()
+        recognizer.notify_on_confirmed_detection = Mock()
+
+        profile = SourceProfile.from_config('first-cam', {'stills_dir': '/tmp/Stills'})
+        throttler = Mock()
+        throttler.is_allowed.return_value = False
+        settings = {
+            'trackers': {'first-cam': Tracker.from_config({})},
+            'save_throttlers': {'first-cam': throttler, 'first-cam_detected': throttler},
+        }
+
+        with patch.multiple(recognizer_module, **settings):
+            for detections in frames_detections:
+                item = QueueItem(np.zeros((480, 640, 3), np.uint8), profile)
+                events = recognizer.track(item, detections)
+                recognizer.on_recognized(item, detections, events)
+        return recognizer
+
+    def test_standing_person_is_saved_and_notified_once(self):
+        recognizer = self.recognize([[detection(100)] for _ in range(10)])
+
+        self.assertEqual(recognizer.still_writer.submit.call_count, 1)
+        item, on_saved = recognizer.still_writer.submit.call_args.args
+        on_saved(item)
+        recognizer.notify_on_confirmed_detection.assert_called_once_with(item, True)
+        recognizer.clip_recorder.trigger.assert_called_once_with('first-cam')
+        recognizer.event_store.record.assert_called_once_with(item, item.marked_objects)
+        self.assertEqual(recognizer.mqtt_service.publish_state.call_args.args[1]['tracks'], [1])
+
+    def test_person_at_070_with_missed_frame_is_saved_and_notified(self):
+        person = detection(100, confidence=0.7)
+        recognizer = self.recognize([[dict(person)], [], [dict(person)], [dict(person)]])
+
+        self.assertEqual(recognizer.still_writer.submit.call_count, 1)
+        item, on_saved = recognizer.still_writer.submit.call_args.args
+        on_saved(item)
+        recognizer.notify_on_confirmed_detection.assert_called_once_with(item, True)
+
+
+if __name__ == '__main__':
+    unittest.main()
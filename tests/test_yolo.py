@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+
+from argus.utils.yolo import batched_nms, decode_predictions, decode_predictions_loop, letterbox
+
+
+def make_output(classes=3, anchors=6):
+    output = np.zeros((1, 4 + classes, anchors), np.float32)
+    # cx, cy, w, h
+    output[0, :4, 0] = (50, 50, 20, 20)
+    output[0, :4, 1] = (51, 51, 20, 20)
+    output[0, :4, 2] = (52, 52, 20, 20)
+    output[0, :4, 3] = (300, 300, 40, 10)
+    output[0, :4, 4] = (100, 100, 10, 10)
+    output[0, 4 + 0, 0] = 0.9
+    output[0, 4 + 0, 1] = 0.8
+    output[0, 4 + 1, 2] = 0.7
+    output[0, 4 + 2, 3] = 0.95
+    output[0, 4 + 1, 4] = 0.3
+    return output
+
+
+class DecodePredictionsTest(unittest.TestCase):
+    def test_vectorized_decoder_matches_loop_decoder(self):
+        output = make_output()
+
+        boxes, scores, class_ids = decode_predictions(output, 0.65)
+        loop_boxes, loop_scores, loop_class_ids = decode_predictions_loop(output, 0.65)
+
+        np.testing.assert_allclose(boxes, np.array(loop_boxes))
+        np.testing.assert_allclose(scores, np.array(loop_scores))
+        self.assertEqual(class_ids.tolist(), loop_class_ids)
+
+    def test_boxes_are_converted_to_top_left_corner(self):
+        boxes, scores, class_ids = decode_predictions(make_output(), 0.65)
+
+        self.assertEqual(boxes[3].tolist(), [280, 295, 40, 10])
+        self.assertEqual(class_ids.tolist(), [0, 0, 1, 2])
+
+    def test_nothing_above_threshold(self):
+        boxes, scores, class_ids = decode_predictions(make_output(), 0.99)
+
+        self.assertEqual(boxes.shape, (0, 4))
+        self.assertEqual(batched_nms(boxes, scores, class_ids, 0.99).tolist(), [])
+
+
+class BatchedNmsTest(unittest.TestCase):
+    def test_overlapping_boxes_suppressed_only_within_class(self):
+        boxes, scores, class_ids = decode_predictions(make_output(), 0.65)
+
+        kept = batched_nms(boxes, scores, class_ids, 0.65)
+
+        # Anchor 1 overlaps anchor 0 of the same class, anchor 2 has another class
+        self.assertEqual(sorted(kept.tolist()), [0, 2, 3])
+
+
+class LetterboxTest(unittest.TestCase):
+    def test_wide_frame_is_written_into_top_of_buffer(self):
+        frame = np.full((1080, 1920, 3), 7, np.uint8)
+        buffer = np.full((640, 640, 3), 255, np.uint8)
+
+        scale = letterbox(frame, buffer)
+
+        self.assertEqual(scale, 3)
+        self.assertTrue((buffer[:360] == 7).all())
+        self.assertTrue((buffer[360:] == 0).all())
+
+    def test_tall_frame_is_written_into_left_of_buffer(self):
+        frame = np.full((1920, 1080, 3), 7, np.uint8)
+        buffer = np.full((640, 640, 3), 255, np.uint8)
+
+        letterbox(frame, buffer)
+
+        self.assertTrue((buffer[:, :360] == 7).all())
+        self.assertTrue((buffer[:, 360:] == 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()